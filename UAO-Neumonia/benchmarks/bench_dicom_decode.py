@@ -0,0 +1,85 @@
+# Benchmark de memoria y latencia de read_dicom_file en DICOM grandes sintéticos
+"""
+Mide la latencia y el pico de RSS por imagen de `read_dicom_file` sobre DICOM
+sintéticos grandes de 16 bits, en dos modos:
+
+- completo: resolución original (comportamiento por defecto),
+- liviano: `target_size=(512, 512)`, `display_size=(250, 250)`.
+
+Cada modo se ejecuta en un proceso nuevo. En Linux el pico se mide por
+imagen con `VmHWM` (reiniciado con `/proc/self/clear_refs` antes de cada
+lectura); en otros sistemas se usa `ru_maxrss` de todo el modo.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_dicom_decode.py --size 3000 -n 5
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from common import reset_peak, rss_mb, write_synthetic_dicom
+
+MODES = {
+    "completo": {},
+    "liviano": {"target_size": (512, 512), "display_size": (250, 250)},
+}
+
+
+def _run_mode(mode, paths, queue):
+    from read_img import read_dicom_file
+
+    times, peaks = [], []
+    per_image = reset_peak()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for path in paths:
+        if per_image:
+            reset_peak()
+            before = rss_mb("VmRSS")
+        start = time.perf_counter()
+        img_rgb, img_pil = read_dicom_file(path, **MODES[mode])
+        times.append(time.perf_counter() - start)
+        if per_image:
+            peaks.append(rss_mb("VmHWM") - before)
+        del img_rgb, img_pil
+    if not per_image:
+        # ru_maxrss está en KiB en Linux
+        peaks.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                     - baseline)
+    queue.put((statistics.median(times), max(peaks)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=3000,
+                        help="Lado de los DICOM sintéticos")
+    parser.add_argument("-n", "--images", type=int, default=5,
+                        help="Número de DICOM sintéticos")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.images):
+            path = os.path.join(tmp, f"sintetico{i}.dcm")
+            write_synthetic_dicom(path, args.size, seed=i)
+            paths.append(path)
+
+        print(f"{args.images} DICOM de {args.size}x{args.size}, 16 bits")
+        for mode in MODES:
+            queue = context.Queue()
+            worker = context.Process(target=_run_mode, args=(mode, paths, queue))
+            worker.start()
+            latency, peak = queue.get()
+            worker.join()
+            print(f"{mode:10s} {latency * 1000:8.1f} ms/imagen   "
+                  f"pico de RSS: {peak:7.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# Microbenchmark del motor Grad-CAM compilado frente a la implementación anterior
+"""
+Compara el tiempo por mapa de calor de:
+
+- la implementación anterior (construye el `Model` intermedio en cada llamada,
+  pasa los tensores a NumPy y pondera los canales en un bucle de Python),
+- el motor compilado (`tf.function` con firma fija y operaciones tensoriales),
+  con lotes de 1 y de N imágenes.
+
+También informa la diferencia máxima entre ambos mapas de calor.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_grad_cam.py --model "ruta/al/modelo.h5" -n 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Model
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+)
+
+import load_model  # noqa: E402
+from grad_cam import compute_heatmaps  # noqa: E402
+
+
+def legacy_heatmap(model, img):
+    """Grad-CAM tal como estaba antes del motor compilado (sin redimensionar)."""
+    last_conv_layer = model.get_layer(load_model.LAST_CONV_LAYER)
+    grad_model = Model(
+        inputs=model.input,
+        outputs=[last_conv_layer.output, model.output]
+    )
+    with tf.GradientTape() as tape:
+        conv_outputs, predictions = grad_model(img)
+        predicted_class = tf.argmax(predictions[0])
+        loss = predictions[:, predicted_class]
+    grads = tape.gradient(loss, conv_outputs)
+    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+    conv_outputs = conv_outputs[0].numpy()
+    pooled_grads = pooled_grads.numpy()
+    for i in range(pooled_grads.shape[-1]):
+        conv_outputs[:, :, i] *= pooled_grads[i]
+    heatmap = np.mean(conv_outputs, axis=-1)
+    heatmap = np.maximum(heatmap, 0)
+    heatmap /= np.max(heatmap)
+    return heatmap
+
+
+def _per_image(fn, n, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) / n)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=load_model.MODEL_PATH,
+                        help="Ruta al modelo .h5")
+    parser.add_argument("-n", "--images", type=int, default=16,
+                        help="Imágenes por repetición")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Repeticiones (se informa la mediana)")
+    args = parser.parse_args()
+
+    load_model.MODEL_PATH = args.model
+    model = load_model.get_model()
+    rng = np.random.default_rng(0)
+    batch = rng.random((args.images,) + load_model.INPUT_SHAPE, dtype=np.float32)
+    compute_heatmaps(batch[:1])  # trazado del tf.function
+
+    legacy = _per_image(
+        lambda: [legacy_heatmap(model, batch[i:i + 1]) for i in range(len(batch))],
+        len(batch), args.repeat,
+    )
+    single = _per_image(
+        lambda: [compute_heatmaps(batch[i:i + 1]) for i in range(len(batch))],
+        len(batch), args.repeat,
+    )
+    batched = _per_image(lambda: compute_heatmaps(batch), len(batch), args.repeat)
+
+    _, heatmaps = compute_heatmaps(batch)
+    drift = max(
+        float(np.max(np.abs(heatmaps[i] - legacy_heatmap(model, batch[i:i + 1]))))
+        for i in range(len(batch))
+    )
+
+    print(f"anterior (bucle, Model por llamada): {legacy * 1000:8.2f} ms/mapa")
+    print(f"motor compilado, lote 1:             {single * 1000:8.2f} ms/mapa"
+          f"  ({legacy / single:.1f}x)")
+    label = f"motor compilado, lote {len(batch)}:"
+    print(f"{label:37s}{batched * 1000:8.2f} ms/mapa  ({legacy / batched:.1f}x)")
+    print(f"diferencia máxima entre mapas:       {drift:.2e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# Benchmark de la superposición del Grad-CAM: resolución completa + LANCZOS frente a tamaño de vista
+"""
+Compara el costo de obtener la vista de 250x250 del mapa de calor:
+
+- anterior: superposición JET a resolución completa, volteo de canales y
+  reducción a 250x250 con LANCZOS (como hacía la interfaz),
+- actual: `render_overlay(array, cam, (250, 250))`, que reduce la imagen y
+  colorea el mapa crudo con la tabla JET solo a ese tamaño.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_heatmap_render.py --sizes 1024,2048,4096
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from common import synthetic_pixels
+from heatmap import render_overlay
+
+
+def legacy_preview(array, heatmap):
+    """Vista previa tal como la construían grad_cam.superimpose y la interfaz."""
+    heatmap = cv2.resize(heatmap, (array.shape[1], array.shape[0]))
+    heatmap = cv2.applyColorMap(np.uint8(255 * heatmap), cv2.COLORMAP_JET)
+    overlay = cv2.addWeighted(array, 0.8, heatmap, 0.2, 0)[:, :, ::-1]
+    return Image.fromarray(overlay).resize((250, 250), Image.LANCZOS)
+
+
+def _ms(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1024,2048,4096",
+                        help="Lados de las imágenes sintéticas")
+    args = parser.parse_args()
+
+    cam = np.random.default_rng(0).random((32, 32), dtype=np.float32)
+    for size in (int(s) for s in args.sizes.split(",")):
+        array = cv2.cvtColor(synthetic_pixels(size), cv2.COLOR_GRAY2BGR)
+        legacy = _ms(lambda: legacy_preview(array, cam))
+        current = _ms(lambda: Image.fromarray(render_overlay(array, cam, (250, 250))))
+        print(f"{size}x{size}: anterior {legacy:8.1f} ms   actual {current:6.1f} ms"
+              f"   ({legacy / current:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
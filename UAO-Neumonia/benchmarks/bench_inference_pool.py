@@ -0,0 +1,106 @@
+# Benchmark de escalado del pool de inferencia: imágenes por segundo según réplicas e hilos
+"""
+Mide el rendimiento de `InferencePool` con distintos números de réplicas,
+para elegir la configuración de cada máquina. Para cada valor de
+`--workers` se envían `-n` imágenes desde `--callers` hilos a la vez y se
+informan las imágenes por segundo y la latencia p50/p99 por llamada.
+
+`0` es el modelo en el proceso principal, compartido por los hilos. Con
+`--pin` cada réplica queda fijada a su propio conjunto de CPU. Los hilos de
+TensorFlow por réplica se reparten entre los núcleos, salvo que se den
+`--intra`/`--inter`. Usa el modelo sustituto de `common.py` si no se pasa
+`--model`.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_inference_pool.py --workers 0,1,2,4,8 --pin -n 256
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from common import build_stand_in_model, synthetic_pixels
+
+
+def _run(pool, images, callers, per_call, heatmaps):
+    calls = [images[i:i + per_call] for i in range(0, len(images), per_call)]
+    latencies = []
+
+    def one(arrays):
+        start = time.perf_counter()
+        pool.predict_batch(arrays, heatmaps=heatmaps)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        list(executor.map(one, calls))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (len(images) / elapsed, statistics.median(latencies),
+            latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="0,1,2,4",
+                        help="Números de réplicas a medir, separados por comas")
+    parser.add_argument("-n", type=int, default=128, help="Imágenes por corrida")
+    parser.add_argument("--callers", type=int, default=8,
+                        help="Hilos que llaman al pool a la vez")
+    parser.add_argument("--per-call", type=int, default=4,
+                        help="Imágenes por llamada")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="Imágenes por llamada al modelo en cada réplica")
+    parser.add_argument("--intra", type=int, default=None,
+                        help="Hilos intra-op por réplica")
+    parser.add_argument("--inter", type=int, default=None,
+                        help="Hilos inter-op por réplica")
+    parser.add_argument("--pin", action="store_true",
+                        help="Fijar cada réplica a su conjunto de CPU")
+    parser.add_argument("--heatmaps", action="store_true",
+                        help="Calcular también el Grad-CAM")
+    parser.add_argument("--model", help="Modelo .h5 (por defecto, el sustituto)")
+    args = parser.parse_args()
+
+    # Sin caché: se mide el modelo, no el disco
+    os.environ["NEUMONIA_CACHE"] = "0"
+    import integrator
+    import load_model
+    from inference_pool import InferencePool
+
+    integrator.CACHE_ENABLED = False
+    images = [np.repeat(synthetic_pixels(1024, seed=i % 8)[:, :, None], 3, axis=2)
+              for i in range(args.n)]
+    print(f"{os.cpu_count()} CPU, {args.n} imágenes, {args.callers} hilos "
+          f"llamando, {args.per_call} imágenes por llamada", file=sys.stderr)
+    with tempfile.TemporaryDirectory() as workdir:
+        model_path = args.model or build_stand_in_model(
+            os.path.join(workdir, "stand_in.h5")
+        )
+        load_model.MODEL_PATH = model_path
+        for workers in (int(w) for w in args.workers.split(",")):
+            pool = InferencePool(workers, batch_size=args.batch_size,
+                                 intra_op_threads=args.intra,
+                                 inter_op_threads=args.inter, pin=args.pin,
+                                 model_path=model_path)
+            try:
+                pool.start()
+                # Primera pasada fuera de la medición (trazado de TF)
+                _run(pool, images[:args.per_call * max(1, workers)], args.callers,
+                     args.per_call, args.heatmaps)
+                rate, p50, p99 = _run(pool, images, args.callers, args.per_call,
+                                      args.heatmaps)
+            finally:
+                pool.close()
+            print(f"{workers:3d} réplicas: {rate:7.1f} img/s   "
+                  f"p50 {p50:7.1f} ms   p99 {p99:7.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Benchmark de latencia por estudio con el registro de modelos de load_model
+"""
+Mide la latencia de `prediction.predict` por estudio:
+
+- primera llamada (carga del `.h5`, warm-up y predicción),
+- llamadas siguientes (modelo ya en memoria),
+- llamadas sin caché (se hace `evict()` antes de cada estudio, equivalente
+  al comportamiento anterior en el que cada llamada leía el archivo).
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_model_cache.py --model "ruta/al/modelo.h5" -n 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+)
+
+import load_model  # noqa: E402
+from prediction import predict  # noqa: E402
+
+
+def _study(seed, size=1024):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=load_model.MODEL_PATH,
+                        help="Ruta al modelo .h5")
+    parser.add_argument("-n", "--studies", type=int, default=10,
+                        help="Número de estudios sintéticos")
+    parser.add_argument("--size", type=int, default=1024,
+                        help="Lado de las imágenes sintéticas")
+    args = parser.parse_args()
+
+    load_model.MODEL_PATH = args.model
+    studies = [_study(i, args.size) for i in range(args.studies)]
+
+    load_model.evict()
+    first = _timed(predict, studies[0])
+    warm = [_timed(predict, s) for s in studies[1:]]
+
+    cold = []
+    for s in studies[1:]:
+        load_model.evict()
+        cold.append(_timed(predict, s))
+    load_model.evict()
+
+    print(f"primera llamada:         {first * 1000:9.1f} ms")
+    if warm:
+        print(f"siguientes (con caché):  {statistics.median(warm) * 1000:9.1f} ms"
+              f" (mediana de {len(warm)})")
+        print(f"sin caché (evict):       {statistics.median(cold) * 1000:9.1f} ms"
+              f" (mediana de {len(cold)})")
+        print(f"aceleración:             "
+              f"{statistics.median(cold) / statistics.median(warm):9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
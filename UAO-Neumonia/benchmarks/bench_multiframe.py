@@ -0,0 +1,81 @@
+# Benchmark de estudios multicuadro: memoria y tiempo de la lectura por cuadros frente a la carga completa
+"""
+Clasifica DICOM multicuadro sintéticos de 16 bits con cada vez más cuadros:
+
+- completo: `pixel_array` con todos los cuadros, preprocesamiento de todos
+  y `predict_batch(..., heatmaps=False)`, como haría el código anterior si
+  recibiera los cuadros como imágenes sueltas,
+- por cuadros: `integrator.prediction_series`, que decodifica un cuadro a
+  la vez y los pasa al modelo en lotes de tamaño fijo.
+
+Se informa el tiempo y el pico de RSS de cada corrida (Linux). Con la
+lectura por cuadros el pico no crece con el número de cuadros. Usa el
+modelo sustituto de `common.py`.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_multiframe.py --frames 16,64,256 --size 1024
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from common import build_stand_in_model, reset_peak, rss_mb, write_synthetic_dicom
+
+
+def _full_load(path):
+    import pydicom
+
+    from prediction import predict_batch
+    from read_img import MODEL_SIZE, _to_uint8
+
+    pixels = pydicom.dcmread(path).pixel_array
+    frames = [_to_uint8(frame, MODEL_SIZE) for frame in pixels]
+    results = predict_batch(frames, heatmaps=False)
+    return max(results, key=lambda r: r[1])
+
+
+def _measure(fn):
+    per_call = reset_peak()
+    before = rss_mb("VmRSS")
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = rss_mb("VmHWM") - before if per_call else float("nan")
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", default="16,64,256",
+                        help="Números de cuadros, separados por comas")
+    parser.add_argument("--size", type=int, default=1024, help="Lado de cada cuadro")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Cuadros por llamada al modelo")
+    args = parser.parse_args()
+
+    import load_model
+    from integrator import prediction_series
+
+    with tempfile.TemporaryDirectory() as workdir:
+        load_model.MODEL_PATH = build_stand_in_model(os.path.join(workdir, "m.h5"))
+        load_model.get_predictor()
+        for frames in (int(n) for n in args.frames.split(",")):
+            path = os.path.join(workdir, f"{frames}.dcm")
+            write_synthetic_dicom(path, args.size, bits=16, frames=frames)
+            # Primera llamada fuera de la medición (trazado del modelo)
+            prediction_series(path, batch_size=args.batch_size)
+            streamed = _measure(
+                lambda: prediction_series(path, batch_size=args.batch_size)
+            )
+            full = _measure(lambda: _full_load(path))
+            print(f"{frames:4d} cuadros de {args.size}²: "
+                  f"completo {full[0]:6.2f} s {full[1]:8.1f} MB | "
+                  f"por cuadros {streamed[0]:6.2f} s {streamed[1]:8.1f} MB")
+            os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
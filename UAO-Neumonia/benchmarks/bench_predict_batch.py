@@ -0,0 +1,65 @@
+# Benchmark de rendimiento de predict_batch frente a predict en un bucle
+"""
+Compara imágenes/s de `prediction.predict_batch` contra llamar a
+`prediction.predict` imagen por imagen, con y sin Grad-CAM.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_predict_batch.py --model "ruta/al/modelo.h5" -n 64
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+)
+
+import load_model  # noqa: E402
+from prediction import predict, predict_batch  # noqa: E402
+
+
+def _throughput(fn, n):
+    start = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=load_model.MODEL_PATH,
+                        help="Ruta al modelo .h5")
+    parser.add_argument("-n", "--images", type=int, default=64,
+                        help="Número de imágenes sintéticas")
+    parser.add_argument("--size", type=int, default=1024,
+                        help="Lado de las imágenes sintéticas")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[8, 16, 32],
+                        help="Tamaños de lote a comparar")
+    args = parser.parse_args()
+
+    load_model.MODEL_PATH = args.model
+    load_model.preload()
+    rng = np.random.default_rng(0)
+    arrays = [
+        rng.integers(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+        for _ in range(args.images)
+    ]
+    n = len(arrays)
+
+    loop = _throughput(lambda: [predict(a) for a in arrays], n)
+    print(f"{'predict en bucle (con Grad-CAM)':40s} {loop:8.2f} img/s")
+    for batch_size in args.batch_size:
+        for heatmaps in (True, False):
+            rate = _throughput(
+                lambda: predict_batch(arrays, batch_size, heatmaps=heatmaps), n
+            )
+            name = (f"predict_batch bs={batch_size} "
+                    f"({'con' if heatmaps else 'sin'} Grad-CAM)")
+            print(f"{name:40s} {rate:8.2f} img/s  ({rate / loop:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# Benchmark del preprocesamiento: implementación anterior frente a la actual
+"""
+Compara imágenes/s del preprocesamiento:
+
+- anterior: CLAHE nuevo por llamada, float64 y dos `expand_dims`,
+- `preprocess` por imagen (CLAHE por hilo, float32),
+- `preprocess_batch` sobre un buffer reutilizado, con el pool de hilos.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_preprocess.py -n 64 --size 2048
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+)
+
+from preprocess_img import BufferPool, preprocess, preprocess_batch  # noqa: E402
+
+
+def legacy_preprocess(array):
+    """Preprocesamiento tal como estaba antes del motor actual."""
+    array = cv2.resize(array, (512, 512))
+    array = cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4))
+    array = clahe.apply(array)
+    array = array / 255
+    array = np.expand_dims(array, axis=-1)
+    array = np.expand_dims(array, axis=0)
+    return array
+
+
+def _rate(fn, n, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return n / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--images", type=int, default=64,
+                        help="Número de imágenes sintéticas")
+    parser.add_argument("--size", type=int, default=2048,
+                        help="Lado de las imágenes sintéticas")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    arrays = [
+        rng.integers(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+        for _ in range(args.images)
+    ]
+    n = len(arrays)
+    pool = BufferPool()
+    buffer = pool.acquire(n)
+
+    legacy = _rate(lambda: [legacy_preprocess(a) for a in arrays], n)
+    single = _rate(lambda: [preprocess(a) for a in arrays], n)
+    batch = _rate(lambda: preprocess_batch(arrays, out=buffer), n)
+
+    print(f"{n} imágenes BGR de {args.size}x{args.size}, "
+          f"{os.cpu_count()} CPU")
+    print(f"anterior:                  {legacy:8.1f} img/s")
+    print(f"preprocess por imagen:     {single:8.1f} img/s  ({single / legacy:.2f}x)")
+    print(f"preprocess_batch (hilos):  {batch:8.1f} img/s  ({batch / legacy:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
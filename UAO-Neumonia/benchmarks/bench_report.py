@@ -0,0 +1,66 @@
+# Benchmark de la generación de reportes PDF: reportes por segundo según el número de procesos
+"""
+Mide el rendimiento de `report.render_reports` sobre radiografías DICOM
+sintéticas, con sus mapas de calor crudos, en el proceso principal y con
+pools de 1, 2, 4... procesos. También mide un reporte aislado
+(`write_report`), el trabajo que hace el botón "PDF" de la interfaz.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_report.py -n 64 --size 2048 --workers 0,1,2,4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import write_synthetic_dicom
+from read_img import MODEL_SIZE, read_dicom_file
+from report import render_reports, write_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=64, help="Reportes por corrida")
+    parser.add_argument("--size", type=int, default=2048,
+                        help="Lado de los DICOM sintéticos")
+    parser.add_argument("--workers", default="0,1,2,4",
+                        help="Números de procesos a medir, separados por comas")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        studies = []
+        for i in range(4):
+            path = os.path.join(workdir, f"estudio{i}.dcm")
+            write_synthetic_dicom(path, args.size, seed=i)
+            studies.append(path)
+
+        array, _ = read_dicom_file(studies[0], target_size=MODEL_SIZE)
+        cam = rng.random((16, 16), dtype=np.float32)
+        single = os.path.join(workdir, "unico.pdf")
+        write_report(single, array, cam, "1", "normal", 90.0)
+        start = time.perf_counter()
+        for _ in range(10):
+            write_report(single, array, cam, "1", "normal", 90.0)
+        print(f"write_report: {(time.perf_counter() - start) * 100:.1f} ms por reporte")
+
+        for workers in (int(w) for w in args.workers.split(",")):
+            jobs = [{
+                "path": studies[i % len(studies)],
+                "output": os.path.join(workdir, f"w{workers}", f"{i}.pdf"),
+                "patient_id": str(i), "label": "normal", "proba": 90.0,
+                "cam": cam,
+            } for i in range(args.n)]
+            start = time.perf_counter()
+            stats = render_reports(jobs, workers)
+            elapsed = time.perf_counter() - start
+            print(f"{workers} procesos: {stats['written']} reportes en "
+                  f"{elapsed:5.2f} s  ({stats['written'] / elapsed:6.1f} reportes/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# Generador de carga para el servicio HTTP local (src/app/server.py)
+"""
+Envía peticiones concurrentes a POST /predict y reporta latencia p50/p99 y
+predicciones/s.
+
+Uso (desde UAO-Neumonia/), con el servicio ya en marcha:
+    python src/app/server.py --port 8080 --max-batch 16 --max-wait-ms 10
+    python benchmarks/bench_server_load.py --port 8080 -n 500 -c 32
+
+Sin `--file` se envía una radiografía JPG sintética; `--heatmap` pide
+también el Grad-CAM.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _client(host, port, path, body, content_type, counter, latencies,
+                  statuses):
+    # Conexión persistente (keep-alive) por cliente
+    reader, writer = await asyncio.open_connection(host, port)
+    head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode()
+    try:
+        while counter[0] > 0:
+            counter[0] -= 1
+            start = time.perf_counter()
+            writer.write(head + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            status = int(status_line.split()[1])
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def _get_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Connection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.partition(b"\r\n\r\n")[2])
+
+
+async def run(args, body, content_type):
+    path = f"/predict?heatmap={int(args.heatmap)}"
+    # Esperar a que el modelo esté cargado para no medir el arranque
+    while not (await _get_json(args.host, args.port, "/health"))["model_loaded"]:
+        await asyncio.sleep(0.2)
+
+    counter = [args.requests]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(args.host, args.port, path, body, content_type, counter,
+                latencies, statuses)
+        for _ in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    metrics = await _get_json(args.host, args.port, "/metrics")
+    return latencies, statuses, elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-n", "--requests", type=int, default=500,
+                        help="Número total de peticiones")
+    parser.add_argument("-c", "--concurrency", type=int, default=32,
+                        help="Clientes simultáneos")
+    parser.add_argument("--file", help="Archivo DICOM o imagen a enviar")
+    parser.add_argument("--heatmap", action="store_true",
+                        help="Pedir también el mapa de calor")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            body = f.read()
+        dicom = os.path.splitext(args.file)[1].lower() == ".dcm"
+        content_type = "application/dicom" if dicom else "image/jpeg"
+    else:
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (1024, 1024, 3), dtype=np.uint8)
+        body = cv2.imencode(".jpg", image)[1].tobytes()
+        content_type = "image/jpeg"
+
+    latencies, statuses, elapsed, metrics = asyncio.run(
+        run(args, body, content_type)
+    )
+    ok = len(latencies)
+    print(f"{args.requests} peticiones, {args.concurrency} clientes, "
+          f"respuestas: {statuses}")
+    if ok:
+        print(f"latencia p50: {_percentile(latencies, 50) * 1000:8.1f} ms")
+        print(f"latencia p99: {_percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"throughput:   {ok / elapsed:8.1f} predicciones/s")
+    print(f"lote medio en el servidor: {metrics['mean_batch_size']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
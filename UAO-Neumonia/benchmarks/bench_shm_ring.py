@@ -0,0 +1,94 @@
+# Benchmark del traspaso de tensores: memoria compartida frente a serialización
+"""
+Compara dos formas de llevar los tensores preprocesados desde los procesos
+decodificadores hasta el proceso de inferencia, sin ejecutar el modelo:
+
+- `pickle`: el pool de `batch_scan` (`load_study`), que serializa cada
+  tensor de (512, 512, 1) float32, y `np.stack` para armar el lote,
+- `shm`: `shm_ring.ring_batches`, que escribe en un anillo de memoria
+  compartida y entrega el lote como vista.
+
+Informa imágenes por segundo, el tiempo que el proceso principal pasa
+esperando y armando cada lote, y los MB serializados por imagen.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_shm_ring.py -n 512 --size 1024 --workers 4 --batch-size 16
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import write_synthetic_dicom
+
+
+def _pickling(paths, workers, batch_size):
+    from batch_scan import _decoded, load_study
+
+    start = time.perf_counter()
+    batch, assemble = [], 0.0
+    window = max(2 * batch_size, 2 * workers)
+    for item in _decoded(paths, workers, False, window):
+        batch.append(item)
+        if len(batch) == batch_size:
+            t = time.perf_counter()
+            np.stack([it[1] for it in batch])
+            assemble += time.perf_counter() - t
+            batch = []
+    elapsed = time.perf_counter() - start
+    payload = len(pickle.dumps(load_study(paths[0]))) / 2 ** 20
+    return elapsed, assemble, payload
+
+
+def _shared(paths, workers, batch_size):
+    import shm_ring
+
+    start = time.perf_counter()
+    assemble = 0.0
+    for tensors, _ in shm_ring.ring_batches(paths, workers, batch_size):
+        t = time.perf_counter()
+        np.asarray(tensors)
+        assemble += time.perf_counter() - t
+    elapsed = time.perf_counter() - start
+    # Lo que viaja por la tubería: ruta, error e información del paciente
+    with shm_ring.SharedRing(1) as ring:
+        shm_ring._ring = ring
+        payload = len(pickle.dumps(shm_ring._fill(paths[0], 0))) / 2 ** 20
+        shm_ring._ring = None
+    return elapsed, assemble, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=256, help="Archivos por corrida")
+    parser.add_argument("--size", type=int, default=1024, help="Lado de cada imagen")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Procesos de decodificación")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Imágenes por lote")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        for i in range(args.n):
+            path = os.path.join(workdir, f"estudio{i:05d}.dcm")
+            write_synthetic_dicom(path, args.size, seed=i % 16)
+            paths.append(path)
+        print(f"{args.n} DICOM de {args.size}x{args.size}, {args.workers} procesos, "
+              f"lotes de {args.batch_size}", file=sys.stderr)
+        for name, run in (("pickle", _pickling), ("shm", _shared)):
+            # Primera pasada corta para arrancar los procesos y el caché de disco
+            run(paths[:args.batch_size], args.workers, args.batch_size)
+            elapsed, assemble, payload = run(paths, args.workers, args.batch_size)
+            print(f"{name:7s} {args.n / elapsed:7.1f} img/s   armado de lotes "
+                  f"{1000 * assemble / max(1, args.n // args.batch_size):6.2f} ms/lote   "
+                  f"{payload:6.3f} MB serializados por imagen")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
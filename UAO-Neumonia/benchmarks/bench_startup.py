@@ -0,0 +1,98 @@
+# Benchmark del arranque de la interfaz: primera ventana y primera predicción
+"""
+Mide, en un proceso nuevo por repetición:
+
+- tiempo hasta la primera ventana: desde el arranque del intérprete hasta que
+  la ventana de `main.py` se dibuja (sin pantalla, hasta importar los módulos
+  de la interfaz),
+- tiempo hasta la primera predicción: hasta que el modelo está cargado en
+  segundo plano y `integrator.prediction` devuelve un resultado.
+
+`anticipada` importa TensorFlow antes que la interfaz, como hacía el grafo de
+imports anterior; sirve de referencia para detectar regresiones.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_startup.py --repeat 3
+    python benchmarks/bench_startup.py --model /ruta/modelo.h5 --headless
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+
+# Proceso hijo: imprime los instantes (time.time) de cada hito
+_CHILD = r"""
+import sys, time, threading
+if {eager}:
+    import tensorflow
+import numpy as np
+
+def first_prediction():
+    import integrator, load_model
+    while not load_model.is_loaded():
+        time.sleep(0.01)
+    rng = np.random.default_rng(0)
+    integrator.prediction(rng.integers(0, 256, (1024, 1024, 3), dtype=np.uint8))
+    print("prediction", time.time(), flush=True)
+
+if {headless}:
+    import tkinter, PIL.ImageTk, integrator
+    print("window", time.time(), flush=True)
+    threading.Thread(target=integrator.warm_up, daemon=True).start()
+    first_prediction()
+else:
+    import tkinter
+    def mainloop(root, n=0):
+        root.update()
+        print("window", time.time(), flush=True)
+        first_prediction()
+        root.destroy()
+    tkinter.Tk.mainloop = mainloop
+    import main
+    main.App()
+"""
+
+
+def _run_once(eager, headless, env):
+    start = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c",
+         _CHILD.format(eager=eager, headless=headless)],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    marks = dict(line.split() for line in output.splitlines()
+                 if line.startswith(("window", "prediction")))
+    return {name: float(t) - start for name, t in marks.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Procesos por modo (se reporta la mediana)")
+    parser.add_argument("--model", help="Modelo .h5 (por defecto MODEL_PATH)")
+    parser.add_argument("--headless", action="store_true",
+                        help="No abrir la ventana (sin pantalla)")
+    args = parser.parse_args()
+
+    env = dict(os.environ, NEUMONIA_CACHE="0", TF_CPP_MIN_LOG_LEVEL="3")
+    if args.model:
+        env["NEUMONIA_MODEL_PATH"] = os.path.abspath(args.model)
+    headless = args.headless or not os.environ.get("DISPLAY")
+
+    print(f"{'ventana' if not headless else 'sin pantalla (imports)'}, "
+          f"mediana de {args.repeat} procesos")
+    for name, eager in (("diferida", False), ("anticipada", True)):
+        runs = [_run_once(eager, headless, env) for _ in range(args.repeat)]
+        window = statistics.median(r["window"] for r in runs)
+        prediction = statistics.median(r["prediction"] for r in runs)
+        print(f"importación {name:10s}  primera ventana: {window:6.2f} s  "
+              f"primera predicción: {prediction:6.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
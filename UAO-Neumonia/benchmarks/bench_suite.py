@@ -0,0 +1,214 @@
+# Suite de benchmarks por etapa: tiempo y pico de memoria, con comparación contra una línea base
+"""
+Mide cada etapa de la aplicación sobre radiografías sintéticas:
+
+- `read_dicom_file` a resolución completa y en modo liviano (8 y 16 bits),
+- `read_jpg_file`,
+- `preprocess`, `predict` y `grad_cam` sobre la imagen ya decodificada,
+- la superposición del mapa de calor al tamaño de la vista (250x250) y a
+  resolución completa (`render_overlay`).
+
+Sin `--model` la inferencia usa un modelo sustituto pequeño (misma entrada,
+misma salida y capa `conv10_thisone`), así que la suite corre sin el `.h5`
+real. Cada resultado guarda la mediana y el p90 del tiempo y el pico de RSS
+de una llamada (Linux). Los resultados se escriben como JSON.
+
+`--baseline` compara la corrida con un JSON anterior y termina con código 1
+si alguna etapa es más lenta o usa más memoria que el umbral; `--compare`
+compara dos JSON ya guardados sin medir nada.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_suite.py -o base.json
+    python benchmarks/bench_suite.py -o nuevo.json --baseline base.json
+    python benchmarks/bench_suite.py --compare base.json nuevo.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from common import (build_stand_in_model, reset_peak, rss_mb,
+                    write_synthetic_dicom, write_synthetic_jpg)
+
+SIZES = (512, 1024, 2048, 4096)
+BITS = (8, 16)
+# Diferencias de memoria menores que esto (MB) no cuentan como regresión
+MEMORY_NOISE_MB = 5.0
+
+
+def _measure(fn, repeat):
+    """Tiempo (mediana y p90, en ms) y pico de RSS (MB) de `fn()`."""
+    fn()  # primera llamada fuera de la medición (caches, trazado de TF)
+    times, peaks = [], []
+    per_call = reset_peak()
+    for _ in range(repeat):
+        if per_call:
+            reset_peak()
+            before = rss_mb("VmRSS")
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+        if per_call:
+            peaks.append(rss_mb("VmHWM") - before)
+        del result
+    times.sort()
+    return {
+        "median_ms": statistics.median(times),
+        "p90_ms": times[min(len(times) - 1, int(0.9 * len(times)))],
+        "peak_mb": max(peaks) if peaks else None,
+    }
+
+
+def run_suite(sizes, bits, repeat, model_path, workdir, log=sys.stderr):
+    """
+    Ejecuta todas las etapas y devuelve el diccionario de resultados.
+
+    Las claves tienen la forma `etapa/tamaño/bits`, por ejemplo
+    `read_dicom_file/2048/16`.
+    """
+    import load_model
+
+    load_model.MODEL_PATH = model_path
+    from grad_cam import grad_cam
+    from heatmap import render_overlay
+    from prediction import predict
+    from preprocess_img import preprocess
+    from read_img import read_dicom_file, read_jpg_file
+
+    results = {}
+
+    def record(name, fn):
+        results[name] = _measure(fn, repeat)
+        print(f"{name:32s} {results[name]['median_ms']:9.1f} ms", file=log,
+              flush=True)
+
+    for size in sizes:
+        for depth in bits:
+            dcm = os.path.join(workdir, f"{size}_{depth}.dcm")
+            write_synthetic_dicom(dcm, size, bits=depth)
+            record(f"read_dicom_file/{size}/{depth}",
+                   lambda: read_dicom_file(dcm))
+            record(f"read_dicom_file_lean/{size}/{depth}",
+                   lambda: read_dicom_file(dcm, target_size=(512, 512),
+                                           display_size=(250, 250)))
+
+        jpg = os.path.join(workdir, f"{size}.jpg")
+        write_synthetic_jpg(jpg, size)
+        record(f"read_jpg_file/{size}/8", lambda: read_jpg_file(jpg))
+
+        array, _ = read_jpg_file(jpg)
+        record(f"preprocess/{size}/8", lambda: preprocess(array))
+        record(f"predict/{size}/8", lambda: predict(array))
+        record(f"grad_cam/{size}/8", lambda: grad_cam(array))
+        cam = predict(array)[2]
+        record(f"heatmap_display/{size}/8",
+               lambda: render_overlay(array, cam, (250, 250)))
+        record(f"heatmap_full/{size}/8", lambda: render_overlay(array, cam))
+    return results
+
+
+def compare(baseline, current, threshold):
+    """
+    Compara dos corridas etapa por etapa.
+
+    Returns:
+        list of str: Descripción de cada regresión (tiempo o memoria mayor
+        que `threshold`, relativo) encontrada.
+    """
+    regressions = []
+    for name, new in sorted(current["results"].items()):
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = new["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- más lento"
+            regressions.append(f"{name}: {old['median_ms']:.1f} -> "
+                               f"{new['median_ms']:.1f} ms ({ratio:.2f}x)")
+        if old.get("peak_mb") is not None and new.get("peak_mb") is not None:
+            extra = new["peak_mb"] - old["peak_mb"]
+            if (extra > MEMORY_NOISE_MB
+                    and new["peak_mb"] > old["peak_mb"] * (1 + threshold)):
+                flag += "  <-- más memoria"
+                regressions.append(f"{name}: {old['peak_mb']:.1f} -> "
+                                   f"{new['peak_mb']:.1f} MB de pico")
+        print(f"{name:32s} {old['median_ms']:9.1f} -> {new['median_ms']:9.1f} ms"
+              f"  ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _report(regressions):
+    if regressions:
+        print(f"\n{len(regressions)} regresiones:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nSin regresiones.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-o", "--output", default="benchmark.json",
+                        help="Archivo JSON de resultados")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="Lados de las imágenes sintéticas, separados por comas")
+    parser.add_argument("--bits", default=",".join(map(str, BITS)),
+                        help="Profundidades de los DICOM sintéticos (8, 16)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Repeticiones medidas por etapa")
+    parser.add_argument("--model", help="Modelo .h5 (por defecto, el sustituto)")
+    parser.add_argument("--baseline", help="JSON anterior con el que comparar")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NUEVO"),
+                        help="Solo comparar dos JSON ya guardados")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Empeoramiento relativo tolerado (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    if args.compare:
+        return _report(compare(_load(args.compare[0]), _load(args.compare[1]),
+                               args.threshold))
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    bits = [int(b) for b in args.bits.split(",")]
+    with tempfile.TemporaryDirectory() as workdir:
+        model_path = args.model or build_stand_in_model(
+            os.path.join(workdir, "stand_in.h5")
+        )
+        results = run_suite(sizes, bits, args.repeat, model_path, workdir)
+
+    import tensorflow as tf
+
+    current = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "tensorflow": tf.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "model": args.model or "stand-in",
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Resultados en {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        return _report(compare(_load(args.baseline), current, args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
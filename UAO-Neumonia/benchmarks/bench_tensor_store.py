@@ -0,0 +1,91 @@
+# Benchmark de reevaluación: decodificar y preprocesar de nuevo frente al almacén de tensores
+"""
+Compara dos formas de volver a evaluar un conjunto de estudios con el
+modelo, por ejemplo al reemplazarlo:
+
+- `completa`: `read_image_file` + `preprocess` + `predict_preprocessed`,
+- `almacén`: `tensor_store.rescore`, que lee los tensores ya preprocesados
+  desde archivos `.npy` mapeados en memoria.
+
+También informa el tiempo de construir el almacén y su tamaño en disco.
+Usa el modelo sustituto de `common.py` si no se pasa `--model`.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_tensor_store.py -n 256 --size 2048 --dtype uint8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import build_stand_in_model, write_synthetic_dicom
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=128, help="Estudios")
+    parser.add_argument("--size", type=int, default=2048, help="Lado de cada imagen")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Imágenes por llamada al modelo")
+    parser.add_argument("--dtype", choices=("uint8", "float16"), default="uint8",
+                        help="Tipo de almacenamiento")
+    parser.add_argument("--model", help="Modelo .h5 (por defecto, el sustituto)")
+    args = parser.parse_args()
+
+    # Sin caché de resultados: se mide la reevaluación completa
+    os.environ["NEUMONIA_CACHE"] = "0"
+    import load_model
+    from prediction import predict_preprocessed
+    from preprocess_img import preprocess
+    from read_img import MODEL_SIZE, read_image_file
+    from tensor_store import TensorStore, build, rescore
+
+    with tempfile.TemporaryDirectory() as workdir:
+        load_model.MODEL_PATH = args.model or build_stand_in_model(
+            os.path.join(workdir, "stand_in.h5")
+        )
+        inputs = os.path.join(workdir, "estudios")
+        os.makedirs(inputs)
+        paths = []
+        for i in range(args.n):
+            path = os.path.join(inputs, f"estudio{i:05d}.dcm")
+            write_synthetic_dicom(path, args.size, seed=i)
+            paths.append(path)
+        # Primera llamada fuera de la medición (trazado de TF)
+        predict_preprocessed(np.zeros((args.batch_size, 512, 512, 1), np.float32),
+                             args.batch_size, heatmaps=False)
+
+        start = time.perf_counter()
+        for i in range(0, len(paths), args.batch_size):
+            batch = np.stack([
+                preprocess(read_image_file(p, target_size=MODEL_SIZE)[0])[0]
+                for p in paths[i:i + args.batch_size]
+            ])
+            predict_preprocessed(batch, args.batch_size, heatmaps=False)
+        full = time.perf_counter() - start
+
+        root = os.path.join(workdir, "tensores")
+        with TensorStore(root, args.dtype) as store:
+            start = time.perf_counter()
+            build(store, inputs, workers=0, batch_size=args.batch_size)
+            building = time.perf_counter() - start
+            start = time.perf_counter()
+            count = sum(1 for _ in rescore(store, args.batch_size))
+            stored = time.perf_counter() - start
+        # Bloques ocupados: los shards se crean dispersos con su capacidad total
+        disk = sum(os.stat(os.path.join(d, f)).st_blocks * 512
+                   for d, _, files in os.walk(root) for f in files) / 2 ** 20
+
+    print(f"{args.n} DICOM de {args.size}x{args.size}, lotes de {args.batch_size}")
+    print(f"completa  {args.n / full:7.1f} estudios/s")
+    print(f"almacén   {count / stored:7.1f} estudios/s   "
+          f"({(count / stored) / (args.n / full):.1f}x)")
+    print(f"construir el almacén: {building:.1f} s, {disk:.0f} MB en disco ({args.dtype})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# Benchmark del servicio de carpeta vigilada: ráfaga de archivos, memoria y colas
+"""
+Deja una ráfaga de `-n` DICOM sintéticos en una carpeta vigilada por
+`IngestDaemon` y mide el tiempo hasta procesarlos todos, el rendimiento por
+etapa, la profundidad máxima de cada cola y el pico de memoria residente.
+Con colas acotadas la memoria no depende de `-n`, solo de `--queue-size`.
+Usa el modelo sustituto de `common.py` si no se pasa `--model`.
+
+Uso (desde UAO-Neumonia/):
+    python benchmarks/bench_watch_daemon.py -n 2000 --size 1024 --queue-size 32
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from common import build_stand_in_model, reset_peak, rss_mb, write_synthetic_dicom
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=500, help="Archivos de la ráfaga")
+    parser.add_argument("--size", type=int, default=1024, help="Lado de cada imagen")
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="Capacidad de cada cola entre etapas")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Imágenes por llamada al modelo")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                        help="Hilos de decodificación")
+    parser.add_argument("--polling", action="store_true",
+                        help="Revisar la carpeta en lugar de usar inotify")
+    parser.add_argument("--model", help="Modelo .h5 (por defecto, el sustituto)")
+    args = parser.parse_args()
+
+    # Sin caché: se mide la tubería, no el disco
+    os.environ["NEUMONIA_CACHE"] = "0"
+    import load_model
+    from results_store import ResultsStore
+    from watch_daemon import IngestDaemon
+
+    with tempfile.TemporaryDirectory() as workdir:
+        load_model.MODEL_PATH = args.model or build_stand_in_model(
+            os.path.join(workdir, "stand_in.h5")
+        )
+        inbox = os.path.join(workdir, "entrada")
+        os.makedirs(inbox)
+        store = ResultsStore(os.path.join(workdir, "historial.db"))
+        daemon = IngestDaemon(
+            inbox, store=store, batch_size=args.batch_size,
+            queue_size=args.queue_size, decode_workers=args.decode_workers,
+            poll_interval=0.2, use_inotify=False if args.polling else None,
+        ).start()
+        base = rss_mb()
+        peak_supported = reset_peak()
+
+        # La ráfaga: se escriben a un nombre temporal y se renombran, como un copiado
+        start = time.perf_counter()
+        for i in range(args.n):
+            tmp = os.path.join(inbox, f"estudio{i:06d}.dcm.part")
+            write_synthetic_dicom(tmp, args.size, seed=i % 16)
+            os.replace(tmp, tmp[:-len(".part")])
+        depth = {}
+        while len(store.processed()) < args.n:
+            for name, stage in daemon.stats()["stages"].items():
+                depth[name] = max(depth.get(name, 0), stage["queue"])
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        stats = daemon.stats()
+        daemon.stop()
+        store.close()
+
+    peak = rss_mb("VmHWM") if peak_supported else float("nan")
+    print(f"{args.n} archivos de {args.size}x{args.size} ({daemon.watcher.mode}): "
+          f"{elapsed:.1f} s desde el inicio de la ráfaga, {args.n / elapsed:.1f} archivos/s")
+    print(f"memoria: {base:.0f} MB al arrancar, pico {peak:.0f} MB")
+    for name, stage in stats["stages"].items():
+        print(f"  {name:10s} cola máx {depth.get(name, 0):3d}/{stage['capacity']}   "
+              f"{stage['processed']:6d} procesados   {100 * stage['busy']:5.1f}% ocupado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
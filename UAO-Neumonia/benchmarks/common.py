@@ -0,0 +1,116 @@
+# Utilidades compartidas por los benchmarks: datos sintéticos, modelo sustituto y memoria
+"""
+Datos y mediciones comunes a los scripts de `benchmarks/`:
+
+- `write_synthetic_dicom` / `write_synthetic_jpg`: radiografías sintéticas
+  de cualquier tamaño, en 8 o 16 bits,
+- `build_stand_in_model`: modelo Keras pequeño con la misma entrada
+  (512x512x1), la misma salida (3 clases) y una capa `conv10_thisone`, para
+  medir la inferencia sin el `.h5` real; las pruebas (`src/app/test/conftest.py`)
+  usan este mismo modelo,
+- `reset_peak` / `rss_mb`: pico de memoria residente por operación (Linux).
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def synthetic_pixels(size, bits=8, seed=0):
+    """
+    Devuelve una imagen en escala de grises con forma de radiografía: un
+    fondo suave con dos campos pulmonares más oscuros y ruido.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    image = 0.6 + 0.3 * np.cos(np.pi * (x - 0.5))
+    for center in (0.32, 0.68):
+        image -= 0.35 * np.exp(-(((x - center) / 0.14) ** 2
+                                 + ((y - 0.5) / 0.28) ** 2))
+    image += rng.normal(0, 0.03, image.shape).astype(np.float32)
+    image = np.clip(image, 0, 1)
+    peak = 4095 if bits == 16 else 255
+    dtype = np.uint16 if bits == 16 else np.uint8
+    return (image * peak).astype(dtype)
+
+
+def write_synthetic_dicom(path, size, bits=16, seed=0, frames=1):
+    """
+    Escribe un DICOM MONOCHROME2 sin comprimir de size x size píxeles; con
+    `frames` > 1, un objeto multicuadro (se repiten 4 cuadros distintos).
+    """
+    import pydicom
+    from pydicom.dataset import FileDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    pixels = synthetic_pixels(size, bits, seed)
+    if frames > 1:
+        distinct = [synthetic_pixels(size, bits, seed + i) for i in range(min(frames, 4))]
+        pixels = np.stack([distinct[i % len(distinct)] for i in range(frames)])
+
+    meta = pydicom.dataset.FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(path, {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.PixelData = pixels.tobytes()
+    ds.Rows = size
+    ds.Columns = size
+    ds.BitsAllocated = bits
+    ds.BitsStored = 12 if bits == 16 else 8
+    ds.HighBit = ds.BitsStored - 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.SamplesPerPixel = 1
+    ds.PixelRepresentation = 0
+    if frames > 1:
+        ds.NumberOfFrames = frames
+    ds.save_as(path)
+
+
+def write_synthetic_jpg(path, size, seed=0):
+    """Escribe una radiografía sintética JPG (BGR, 8 bits) de size x size."""
+    gray = synthetic_pixels(size, 8, seed)
+    cv2.imwrite(path, cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+
+
+def build_stand_in_model(path):
+    """
+    Guarda en `path` un modelo Keras pequeño compatible con la aplicación:
+    entrada (512, 512, 1), salida softmax de 3 clases y capa `conv10_thisone`.
+    """
+    from tensorflow.keras import Model, layers
+
+    inputs = layers.Input((512, 512, 1))
+    x = inputs
+    for filters in (16, 32, 64):
+        x = layers.Conv2D(filters, 3, padding="same", activation="relu")(x)
+        x = layers.MaxPooling2D(2)(x)
+    x = layers.Conv2D(
+        64, 3, padding="same", activation="relu", name="conv10_thisone"
+    )(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    outputs = layers.Dense(3, activation="softmax")(x)
+    Model(inputs, outputs).save(path)
+    return path
+
+
+def rss_mb(field="VmRSS"):
+    """Lee un campo de memoria de /proc/self/status, en MB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def reset_peak():
+    """Reinicia el pico de RSS del proceso; devuelve False si no es posible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
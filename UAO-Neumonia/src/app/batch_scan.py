@@ -0,0 +1,400 @@
+# Herramienta de línea de comandos para analizar carpetas completas de estudios
+"""
+Batch scanner for directory trees of `.dcm`/`.jpg`/`.png` studies, without a
+display.
+
+The work runs as a pipeline: a process pool decodes files with
+`read_image_file` and preprocesses them, and a single inference stage in the
+main process groups the images into batches for the model. Results are written
+incrementally to CSV or JSONL (the output file is also the checkpoint), and the
+Grad-CAM heatmaps can be saved to disk. With `--store` every result is also
+added to the indexed history (`results_store`), one transaction per batch.
+With `--index` the studies are picked from the DICOM header index
+(`dicom_index`), updated incrementally first, instead of by file extension:
+only the CR/DX files (or those of `--modality`) are decoded. With
+`--shared-memory` the workers write the preprocessed tensors into a shared
+ring (`shm_ring`) instead of pickling them back. With `--heatmap-policy auto`
+Grad-CAM is only computed (and saved) for the abnormal or low-confidence
+studies.
+
+Usage (from UAO-Neumonia/):
+    python src/app/batch_scan.py /ruta/exportacion -o resultados.csv \\
+        --workers 4 --batch-size 16 --resume --heatmaps heatmaps/ \\
+        --store historial.db --index indice_dicom.db --shared-memory
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pydicom as dicom
+
+from read_img import MODEL_SIZE, read_image_file
+from heatmap import render_overlay
+from preprocess_img import preprocess
+from result_cache import study_hash
+
+# Extensiones que se analizan
+EXTENSIONS = (".dcm", ".dicom", ".jpg", ".jpeg", ".png")
+# Columnas del archivo de resultados
+FIELDS = ("path", "label", "proba", "error")
+
+
+def find_images(root):
+    """
+    Walks a directory tree and returns the supported image files, sorted.
+
+    Args:
+        root (str): Directory to scan.
+
+    Returns:
+        list of str: Paths of the `.dcm`/`.jpg`/`.png` files found.
+    """
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(EXTENSIONS):
+                paths.append(os.path.join(dirpath, name))
+    paths.sort()
+    return paths
+
+
+def find_indexed(root, index, modality=None, workers=None, log=None):
+    """
+    Updates a DICOM header index for `root` and returns the studies in it.
+
+    Args:
+        root (str): Directory to scan.
+        index (str): Index database (see `dicom_index`).
+        modality (tuple of str, optional): Modalities to pick. Defaults to
+            `dicom_index.RADIOGRAPHY`.
+        workers (int, optional): Header-parsing processes.
+        log (file, optional): Stream for the index summary.
+
+    Returns:
+        list of str: Paths of the matching DICOM files, sorted.
+    """
+    from dicom_index import RADIOGRAPHY, DicomIndex
+
+    with DicomIndex(index) as db:
+        db.update(root, workers=workers, log=log)
+        return db.paths(root, modality=modality or RADIOGRAPHY)
+
+
+def patient_id(path):
+    """
+    Returns the patient ID of a study: the DICOM PatientID if the header has
+    one, otherwise the file name without extension.
+    """
+    if path.lower().endswith((".dcm", ".dicom")):
+        try:
+            header = dicom.dcmread(path, stop_before_pixels=True,
+                                   specific_tags=["PatientID"])
+            value = str(header.get("PatientID", "")).strip()
+            if value:
+                return value
+        except Exception:
+            pass
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_study(path, keep_original=False):
+    """
+    Decodes and preprocesses one file. Runs inside the worker processes.
+
+    Args:
+        path (str): File to read.
+        keep_original (bool): Also return the decoded image, needed to
+            superimpose the heatmap.
+
+    Returns:
+        tuple: (path, preprocessed (512, 512, 1) float32 array or None,
+        decoded image or None, error message or None, dict with the
+        `patient_id` and `study_hash` or None).
+    """
+    try:
+        array, _ = read_image_file(path, target_size=MODEL_SIZE)
+        if array is None:
+            return path, None, None, "No se pudo leer el archivo.", None
+        tensor = preprocess(array)[0]
+        info = {"patient_id": patient_id(path), "study_hash": study_hash(array)}
+        return path, tensor, array if keep_original else None, None, info
+    except Exception as e:
+        return path, None, None, str(e), None
+
+
+def _decoded(paths, workers, keep_original, window):
+    """Yields load_study results in input order, with at most `window` pending."""
+    if workers == 0:
+        for path in paths:
+            yield load_study(path, keep_original)
+        return
+
+    # spawn: los procesos hijos no heredan el estado de TensorFlow
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(load_study, path, keep_original))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_checkpoint(output):
+    """
+    Returns the paths already present in an existing results file.
+
+    Args:
+        output (str): CSV or JSONL results file.
+
+    Returns:
+        set of str: Processed paths (empty if the file does not exist).
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, newline="", encoding="utf-8") as f:
+        if output.lower().endswith(".jsonl"):
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    # Línea incompleta de una ejecución interrumpida
+                    continue
+        else:
+            for row in csv.DictReader(f):
+                if row.get("path"):
+                    done.add(row["path"])
+    return done
+
+
+def _drop_partial_line(output):
+    # Descarta la última línea si una ejecución interrumpida la dejó a medias
+    with open(output, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class ResultWriter:
+    """Appends result rows to a CSV or JSONL file and flushes every batch."""
+
+    def __init__(self, output, append):
+        self.jsonl = output.lower().endswith(".jsonl")
+        write_header = not (append and os.path.exists(output))
+        if append and not write_header:
+            _drop_partial_line(output)
+        self.file = open(output, "a" if append else "w", newline="",
+                         encoding="utf-8")
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if write_header:
+                self.csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.jsonl:
+                self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            else:
+                self.csv.writerow(row)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def _heatmap_path(heatmap_dir, root, path):
+    relative = os.path.relpath(path, root)
+    return os.path.join(heatmap_dir, os.path.splitext(relative)[0] + ".png")
+
+
+def scan(root, output, workers=None, batch_size=16, heatmap_dir=None,
+         resume=False, progress_every=1, store=None, index=None,
+         modality=None, shared_memory=False, heatmap_policy="always",
+         log=sys.stderr):
+    """
+    Scans a directory tree and writes one result row per study.
+
+    Args:
+        root (str): Directory with the studies.
+        output (str): Results file (`.csv` or `.jsonl`).
+        workers (int, optional): Decoding processes; 0 decodes in-process.
+            Defaults to the number of CPUs.
+        batch_size (int): Images per model call.
+        heatmap_dir (str, optional): Where to save the Grad-CAM images.
+            If None, Grad-CAM is not computed.
+        resume (bool): Skip the studies already in `output`.
+        progress_every (int): Report progress every this many batches.
+        store (str, optional): Results database (see `results_store`) where
+            the results are also recorded.
+        index (str, optional): DICOM header index (see `dicom_index`). The
+            index is updated for `root` and the studies are taken from it.
+        modality (tuple of str, optional): Modalities picked from the index.
+            Defaults to `dicom_index.RADIOGRAPHY`.
+        shared_memory (bool): Hand the preprocessed tensors over through a
+            shared-memory ring (see `shm_ring`) instead of pickling them.
+        heatmap_policy (str): With `heatmap_dir`, "always" saves the
+            Grad-CAM of every study and "auto" only of those that
+            `prediction.needs_heatmap` selects.
+        log (file): Stream for the progress reports.
+
+    Returns:
+        dict: Counters with the processed, failed and skipped studies.
+    """
+    # La inferencia (y TensorFlow) solo se carga en el proceso principal
+    from prediction import predict_preprocessed
+    from integrator import model_version
+    from results_store import ResultsStore
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    paths = find_indexed(root, index, modality, workers, log) if index else find_images(root)
+    done = read_checkpoint(output) if resume else set()
+    todo = [p for p in paths if p not in done]
+    stats = {"total": len(paths), "skipped": len(paths) - len(todo),
+             "processed": 0, "failed": 0}
+    print(f"{len(todo)} estudios por procesar "
+          f"({stats['skipped']} ya procesados).", file=log)
+
+    writer = ResultWriter(output, append=resume)
+    history = ResultsStore(store) if store else None
+    version = model_version() if store else None
+    start = time.perf_counter()
+    keep_original = heatmap_dir is not None
+    batch, rows = [], []
+    batches = 0
+
+    def flush(tensors=None):
+        nonlocal batches
+        if batch:
+            if tensors is None:
+                tensors = np.stack([item[1] for item in batch])
+            results = predict_preprocessed(
+                tensors, batch_size=batch_size,
+                heatmaps=heatmap_policy if keep_original else False,
+                lazy_maps=False,
+            )
+            records = []
+            for (path, _, original, _, info), (label, proba, cam) in zip(batch, results):
+                rows.append({"path": path, "label": label,
+                             "proba": round(proba, 4), "error": ""})
+                records.append(dict(info, label=label, proba=proba,
+                                    model_version=version, source=path))
+                # En modo "auto" los mapas no pedidos no se calculan
+                if cam is not None:
+                    # Exportación: superposición a la resolución decodificada
+                    target = _heatmap_path(heatmap_dir, root, path)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    overlay = render_overlay(original, cam)
+                    cv2.imwrite(target, overlay[:, :, ::-1])
+            if history is not None:
+                history.add_many(records)
+            stats["processed"] += len(batch)
+        writer.write(rows)
+        batch.clear()
+        rows.clear()
+        batches += 1
+        if progress_every and batches % progress_every == 0:
+            _report(stats, len(todo), time.perf_counter() - start, log)
+
+    try:
+        if shared_memory:
+            from shm_ring import ring_batches
+
+            # Lotes completos como vistas de la memoria compartida
+            for tensors, results in ring_batches(todo, workers, batch_size,
+                                                 keep_original=keep_original):
+                valid = []
+                for i, (path, error, info, original) in enumerate(results):
+                    if error is not None:
+                        stats["failed"] += 1
+                        rows.append({"path": path, "label": "", "proba": "",
+                                     "error": error})
+                        continue
+                    valid.append(i)
+                    batch.append((path, None, original, None, info))
+                # Solo si falló algún archivo se copian las filas válidas
+                flush(tensors if len(valid) == len(results) else tensors[valid])
+        else:
+            window = max(2 * batch_size, 2 * workers)
+            for item in _decoded(todo, workers, keep_original, window):
+                path, tensor, _, error, _ = item
+                if error is not None:
+                    stats["failed"] += 1
+                    rows.append({"path": path, "label": "", "proba": "",
+                                 "error": error})
+                    continue
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+        flush()
+    finally:
+        writer.close()
+        if history is not None:
+            history.close()
+    _report(stats, len(todo), time.perf_counter() - start, log)
+    return stats
+
+
+def _report(stats, total, elapsed, log):
+    finished = stats["processed"] + stats["failed"]
+    rate = finished / elapsed if elapsed > 0 else 0.0
+    remaining = (total - finished) / rate if rate > 0 else 0.0
+    print(f"{finished}/{total} estudios | {rate:.1f} img/s | "
+          f"errores: {stats['failed']} | restante: {remaining:.0f} s",
+          file=log, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analiza carpetas de estudios DICOM/JPG/PNG sin interfaz gráfica."
+    )
+    parser.add_argument("input", help="Carpeta con los estudios")
+    parser.add_argument("-o", "--output", default="resultados.csv",
+                        help="Archivo de resultados (.csv o .jsonl)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Procesos de decodificación (0 = en el proceso principal)")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Imágenes por llamada al modelo")
+    parser.add_argument("--heatmaps", metavar="DIR", default=None,
+                        help="Carpeta donde guardar los Grad-CAM")
+    parser.add_argument("--heatmap-policy", choices=("always", "auto"),
+                        default="always",
+                        help="Con --heatmaps: calcular el Grad-CAM de todos los estudios "
+                             "o solo de los anormales o de baja confianza")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continuar desde el archivo de resultados existente")
+    parser.add_argument("--progress-every", type=int, default=1,
+                        help="Reportar el progreso cada N lotes")
+    parser.add_argument("--store", metavar="DB", default=None,
+                        help="Base de datos del historial donde registrar los resultados")
+    parser.add_argument("--index", metavar="DB", default=None,
+                        help="Índice de encabezados DICOM para elegir los estudios")
+    parser.add_argument("--modality", nargs="+", default=None,
+                        help="Modalidades a tomar del índice (por defecto CR DX)")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="Pasar los tensores por memoria compartida en lugar de serializarlos")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input):
+        parser.error(f"La carpeta {args.input} no existe.")
+    scan(args.input, args.output, workers=args.workers,
+         batch_size=args.batch_size, heatmap_dir=args.heatmaps,
+         resume=args.resume, progress_every=args.progress_every,
+         store=args.store, index=args.index, modality=args.modality,
+         shared_memory=args.shared_memory, heatmap_policy=args.heatmap_policy)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
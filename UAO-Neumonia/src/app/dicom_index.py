@@ -0,0 +1,373 @@
+# Módulo encargado de indexar archivos DICOM leyendo solo sus encabezados
+"""
+Incremental index of a DICOM archive, built from headers only.
+
+`DicomIndex.update(root)` walks a directory tree. It reads the header of
+every new or changed file with `pydicom.dcmread(stop_before_pixels=True)`,
+in a process pool, and records what it finds in an SQLite database: path,
+size, mtime, Study/Series/SOP Instance UIDs, modality, body part, rows,
+columns, bits, frames and patient ID. Pixel data is never read. Files that
+are not DICOM are recorded too (`is_dicom = 0`), so later rescans skip
+them. A rescan only parses files whose size or mtime changed, and forgets
+files that disappeared.
+
+`query` picks studies without touching pixel data, for example the chest
+radiographs (CR/DX) of a patient. `batch_scan.py --index` and
+`integrator.indexed_studies` use it.
+
+Usage (from UAO-Neumonia/):
+    python src/app/dicom_index.py /ruta/archivo --db indice.db --workers 8
+    python src/app/dicom_index.py /ruta/archivo --db indice.db --list
+
+Classes:
+    DicomIndex: The index database.
+
+Functions:
+    read_header: Header fields of one file.
+    walk_files: Regular files of a directory tree, with size and mtime.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pydicom as dicom
+
+# Índice por defecto; se puede cambiar con NEUMONIA_DICOM_INDEX
+DB_PATH = os.environ.get("NEUMONIA_DICOM_INDEX", "indice_dicom.db")
+# Modalidades de radiografía simple
+RADIOGRAPHY = ("CR", "DX")
+# Palabras que identifican un estudio de tórax en los encabezados
+CHEST_WORDS = ("CHEST", "THORAX", "TORAX", "TÓRAX", "PULM", "LUNG")
+# Columnas de la tabla, en orden
+COLUMNS = (
+    "path", "size", "mtime_ns", "is_dicom", "study_uid", "series_uid",
+    "sop_uid", "modality", "body_part", "chest", "rows", "columns",
+    "bits_allocated", "bits_stored", "frames", "patient_id", "study_date",
+    "error",
+)
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    is_dicom INTEGER NOT NULL,
+    study_uid TEXT,
+    series_uid TEXT,
+    sop_uid TEXT,
+    modality TEXT,
+    body_part TEXT,
+    chest INTEGER,
+    rows INTEGER,
+    columns INTEGER,
+    bits_allocated INTEGER,
+    bits_stored INTEGER,
+    frames INTEGER,
+    patient_id TEXT,
+    study_date TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS files_study ON files (study_uid);
+CREATE INDEX IF NOT EXISTS files_series ON files (series_uid);
+CREATE INDEX IF NOT EXISTS files_patient ON files (patient_id);
+CREATE INDEX IF NOT EXISTS files_modality ON files (modality, chest);
+"""
+
+# Etiquetas leídas del encabezado
+_TAGS = [
+    "StudyInstanceUID", "SeriesInstanceUID", "SOPInstanceUID", "Modality",
+    "BodyPartExamined", "StudyDescription", "SeriesDescription", "Rows",
+    "Columns", "BitsAllocated", "BitsStored", "NumberOfFrames", "PatientID",
+    "StudyDate", "PixelData",
+]
+
+
+def _text(ds, keyword):
+    value = ds.get(keyword)
+    return str(value).strip() if value not in (None, "") else None
+
+
+def _int(ds, keyword):
+    value = ds.get(keyword)
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def read_header(path):
+    """
+    Reads the header fields of one file, without its pixel data.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        dict: Values for COLUMNS. `is_dicom` is 0 (and `error` says why)
+        when the file is not a readable DICOM object.
+    """
+    stat = os.stat(path)
+    record = dict.fromkeys(COLUMNS)
+    record.update(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                  is_dicom=0)
+    try:
+        ds = dicom.dcmread(path, stop_before_pixels=True, specific_tags=_TAGS)
+    except Exception as e:
+        record["error"] = str(e) or type(e).__name__
+        return record
+
+    descriptions = " ".join(filter(None, (
+        _text(ds, "BodyPartExamined"), _text(ds, "StudyDescription"),
+        _text(ds, "SeriesDescription"),
+    ))).upper()
+    record.update(
+        is_dicom=1,
+        study_uid=_text(ds, "StudyInstanceUID"),
+        series_uid=_text(ds, "SeriesInstanceUID"),
+        sop_uid=_text(ds, "SOPInstanceUID"),
+        modality=_text(ds, "Modality"),
+        body_part=_text(ds, "BodyPartExamined"),
+        chest=int(any(word in descriptions for word in CHEST_WORDS)),
+        rows=_int(ds, "Rows"),
+        columns=_int(ds, "Columns"),
+        bits_allocated=_int(ds, "BitsAllocated"),
+        bits_stored=_int(ds, "BitsStored"),
+        frames=_int(ds, "NumberOfFrames") or 1,
+        patient_id=_text(ds, "PatientID"),
+        study_date=_text(ds, "StudyDate"),
+    )
+    return record
+
+
+def _read_headers(paths):
+    # Se ejecuta en los procesos del pool: un lote de archivos por tarea
+    records = []
+    for path in paths:
+        try:
+            records.append(read_header(path))
+        except OSError:
+            # El archivo desapareció entre el recorrido y la lectura
+            continue
+    return records
+
+
+def walk_files(root):
+    """Yields (path, size, mtime_ns) of every regular file under `root`."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime_ns
+            except OSError:
+                continue
+
+
+class DicomIndex:
+    """
+    SQLite index of DICOM headers.
+
+    Args:
+        path (str, optional): Database file. Defaults to DB_PATH.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _known(self, root):
+        prefix = os.path.join(root, "")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+        return {row["path"]: (row["size"], row["mtime_ns"]) for row in rows}
+
+    def _store(self, records):
+        if not records:
+            return
+        placeholders = ", ".join("?" * len(COLUMNS))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                [tuple(r[c] for c in COLUMNS) for r in records],
+            )
+
+    def update(self, root, workers=None, chunk=64, log=None):
+        """
+        Indexes a directory tree, parsing only new or changed files.
+
+        Args:
+            root (str): Directory to index.
+            workers (int, optional): Header-parsing processes; 0 parses
+                in-process. Defaults to the number of CPUs.
+            chunk (int): Files per task (and per transaction).
+            log (file, optional): Stream for a summary line.
+
+        Returns:
+            dict: Counters: `files` seen, `parsed`, `unchanged`, `removed`
+            and `dicom` (DICOM files among the parsed ones).
+        """
+        root = os.path.abspath(root)
+        start = time.perf_counter()
+        known = self._known(root)
+        todo, seen = [], set()
+        for path, size, mtime_ns in walk_files(root):
+            seen.add(path)
+            if known.get(path) != (size, mtime_ns):
+                todo.append(path)
+        gone = [path for path in known if path not in seen]
+        stats = {"files": len(seen), "parsed": 0,
+                 "unchanged": len(seen) - len(todo), "removed": len(gone),
+                 "dicom": 0}
+
+        if gone:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?",
+                                       [(p,) for p in gone])
+
+        chunks = [todo[i:i + chunk] for i in range(0, len(todo), chunk)]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers == 0 or len(chunks) <= 1:
+            results = map(_read_headers, chunks)
+            executor = None
+        else:
+            # spawn: igual que batch_scan, sin heredar el estado del padre
+            context = multiprocessing.get_context("spawn")
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            results = executor.map(_read_headers, chunks)
+        try:
+            for records in results:
+                self._store(records)
+                stats["parsed"] += len(records)
+                stats["dicom"] += sum(r["is_dicom"] for r in records)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if log is not None:
+            print(f"{stats['files']} archivos: {stats['parsed']} leídos "
+                  f"({stats['dicom']} DICOM), {stats['unchanged']} sin cambios, "
+                  f"{stats['removed']} eliminados en "
+                  f"{time.perf_counter() - start:.1f} s", file=log)
+        return stats
+
+    def query(self, root=None, modality=RADIOGRAPHY, chest=None,
+              patient_id=None, study_uid=None, series_uid=None,
+              min_size=None, limit=None):
+        """
+        Returns indexed DICOM files matching the filters, without reading them.
+
+        Args:
+            root (str, optional): Only files under this directory.
+            modality (str or tuple, optional): Modality or modalities;
+                defaults to the plain radiographs (CR, DX). None for any.
+            chest (bool, optional): Only files whose headers do (True) or do
+                not (False) mention the chest. None for any.
+            patient_id, study_uid, series_uid (str, optional): Exact matches.
+            min_size (int, optional): Minimum rows and columns.
+            limit (int, optional): Maximum number of rows.
+
+        Returns:
+            list of dict: Rows with the keys in COLUMNS, sorted by path.
+        """
+        where, params = ["is_dicom = 1"], []
+        if root is not None:
+            prefix = os.path.join(os.path.abspath(root), "")
+            where.append("substr(path, 1, ?) = ?")
+            params += [len(prefix), prefix]
+        if modality is not None:
+            modalities = (modality,) if isinstance(modality, str) else tuple(modality)
+            where.append(f"modality IN ({', '.join('?' * len(modalities))})")
+            params += list(modalities)
+        if chest is not None:
+            where.append("chest = ?")
+            params.append(int(chest))
+        for column, value in (("patient_id", patient_id),
+                              ("study_uid", study_uid),
+                              ("series_uid", series_uid)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if min_size is not None:
+            where.append("rows >= ? AND columns >= ?")
+            params += [min_size, min_size]
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM files WHERE "
+               + " AND ".join(where) + " ORDER BY path")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def paths(self, root=None, **filters):
+        """Same as `query`, returning only the paths."""
+        return [row["path"] for row in self.query(root, **filters)]
+
+    def count(self, dicom_only=True):
+        sql = "SELECT COUNT(*) FROM files"
+        if dicom_only:
+            sql += " WHERE is_dicom = 1"
+        with self._lock:
+            return self._conn.execute(sql).fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Indexa los encabezados DICOM de una carpeta, sin leer los píxeles."
+    )
+    parser.add_argument("root", help="Carpeta del archivo DICOM")
+    parser.add_argument("--db", default=DB_PATH, help="Base de datos del índice")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Procesos de lectura (0 = en el proceso principal)")
+    parser.add_argument("--list", action="store_true",
+                        help="Listar las radiografías de tórax (CR/DX) indexadas")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"La carpeta {args.root} no existe.")
+    with DicomIndex(args.db) as index:
+        index.update(args.root, workers=args.workers, log=sys.stderr)
+        if args.list:
+            for path in index.paths(args.root, chest=True):
+                print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# Herramienta para exportar el modelo a formatos optimizados para CPU
+"""
+Exports the Keras `.h5` model to SavedModel and TFLite, and checks parity.
+
+The exported copies are written next to the `.h5` (see
+`load_model.exported_path`). Then `NEUMONIA_BACKEND` (or
+`load_model.get_predictor(backend=...)`) can use them for predictions
+without Grad-CAM:
+
+    savedmodel   `<modelo>.savedmodel/`, the same graph without Keras.
+    tflite       `<modelo>.tflite`, float32.
+    tflite-fp16  `<modelo>.fp16.tflite`, float16 weights.
+    tflite-int8  `<modelo>.int8.tflite`, post-training int8 quantization
+                 calibrated on sample images (`--calibration`). Input and
+                 output stay float32.
+
+After exporting, every format is compared with the Keras model on sample
+images. The report gives the label agreement, the drift of the class
+probabilities and the latency per image.
+
+Usage (from UAO-Neumonia/):
+    python src/app/export_model.py --formats tflite-fp16,tflite-int8 \\
+        --calibration /ruta/radiografias --parity /ruta/otras
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import load_model
+from batch_scan import find_images
+from preprocess_img import preprocess
+from read_img import MODEL_SIZE, read_image_file
+
+FORMATS = ("savedmodel", "tflite", "tflite-fp16", "tflite-int8")
+
+
+def sample_batch(root, limit):
+    """
+    Reads and preprocesses up to `limit` images from a folder.
+
+    Args:
+        root (str): Folder with `.dcm`, `.jpg` or `.png` files (recursive).
+        limit (int): Maximum number of images.
+
+    Returns:
+        numpy.ndarray: Batch (N, 512, 512, 1) float32.
+    """
+    batch = []
+    for path in find_images(root):
+        array, _ = read_image_file(path, target_size=MODEL_SIZE)
+        if array is None:
+            continue
+        batch.append(preprocess(array)[0])
+        if len(batch) >= limit:
+            break
+    if not batch:
+        raise ValueError(f"No se encontraron imágenes legibles en {root}")
+    return np.stack(batch)
+
+
+def export_savedmodel(model, path):
+    """Writes the model as a SavedModel with a `serve` endpoint."""
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    model.export(path, verbose=False)
+    return path
+
+
+def export_tflite(model, path, quantization=None, calibration=None):
+    """
+    Converts the model to TFLite.
+
+    Args:
+        model (tensorflow.keras.Model): The Keras model.
+        path (str): Destination `.tflite` file.
+        quantization (str, optional): None (float32), "fp16" or "int8".
+        calibration (numpy.ndarray, optional): Preprocessed images used to
+            calibrate the int8 ranges. Required for "int8".
+
+    Returns:
+        str: `path`.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == "fp16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if calibration is None or len(calibration) == 0:
+            raise ValueError("La cuantización int8 necesita imágenes de calibración.")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: (
+            [calibration[i:i + 1]] for i in range(len(calibration))
+        )
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization is not None:
+        raise ValueError(f"Cuantización desconocida: {quantization}")
+    content = converter.convert()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return path
+
+
+def export(model_path, formats=FORMATS, calibration=None):
+    """
+    Exports the model at `model_path` to each of `formats`.
+
+    Returns:
+        dict: Format -> path of the exported copy.
+    """
+    model = load_model.get_model(model_path, warm_up=False)
+    written = {}
+    for fmt in formats:
+        path = load_model.exported_path(os.path.abspath(model_path), fmt)
+        if fmt == "savedmodel":
+            export_savedmodel(model, path)
+        else:
+            quantization = fmt.partition("-")[2] or None
+            export_tflite(model, path, quantization, calibration)
+        written[fmt] = path
+    # Los predictores en caché podrían venir de una exportación anterior
+    load_model.evict(model_path)
+    return written
+
+
+def parity_check(model_path, backend, batch):
+    """
+    Compares a backend with the Keras model on a preprocessed batch.
+
+    Args:
+        model_path (str): Path to the `.h5` file.
+        backend (str): Backend to check, see `load_model.BACKENDS`.
+        batch (numpy.ndarray): Preprocessed images (N, 512, 512, 1).
+
+    Returns:
+        dict: `images`, `label_agreement` (fraction of equal labels),
+        `max_drift` and `mean_drift` (absolute difference of the class
+        probabilities, 0-1) and `ms_per_image` of both engines.
+    """
+    reference = load_model.get_predictor(model_path, "keras")
+    candidate = load_model.get_predictor(model_path, backend)
+
+    timings = {}
+    outputs = {}
+    for name, predictor in (("keras", reference), (backend, candidate)):
+        start = time.perf_counter()
+        outputs[name] = np.concatenate([
+            predictor(batch[i:i + 1]) for i in range(len(batch))
+        ])
+        timings[name] = (time.perf_counter() - start) * 1000 / len(batch)
+
+    drift = np.abs(outputs[backend] - outputs["keras"])
+    agreement = np.mean(
+        outputs[backend].argmax(axis=1) == outputs["keras"].argmax(axis=1)
+    )
+    return {
+        "images": len(batch),
+        "label_agreement": float(agreement),
+        "max_drift": float(drift.max()),
+        "mean_drift": float(drift.mean()),
+        "ms_per_image": timings,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Exporta el modelo a SavedModel/TFLite y verifica la paridad."
+    )
+    parser.add_argument("--model", default=load_model.MODEL_PATH,
+                        help="Modelo .h5 de referencia")
+    parser.add_argument("--formats", default=",".join(FORMATS),
+                        help="Formatos separados por comas: " + ", ".join(FORMATS))
+    parser.add_argument("--calibration",
+                        help="Carpeta con imágenes para calibrar int8")
+    parser.add_argument("--calibration-count", type=int, default=100,
+                        help="Imágenes de calibración como máximo")
+    parser.add_argument("--parity",
+                        help="Carpeta con imágenes para la verificación "
+                             "(por defecto, la de calibración)")
+    parser.add_argument("--parity-count", type=int, default=50,
+                        help="Imágenes de verificación como máximo")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"Formatos desconocidos: {', '.join(sorted(unknown))}")
+    if "tflite-int8" in formats and not args.calibration:
+        parser.error("tflite-int8 necesita --calibration")
+
+    calibration = None
+    if args.calibration:
+        calibration = sample_batch(args.calibration, args.calibration_count)
+    for fmt, path in export(args.model, formats, calibration).items():
+        print(f"{fmt:12s} -> {path}")
+
+    parity_dir = args.parity or args.calibration
+    if not parity_dir:
+        print("Sin imágenes de verificación (--parity): no se revisó la paridad.")
+        return 0
+    batch = sample_batch(parity_dir, args.parity_count)
+    print(f"\nParidad frente a Keras en {len(batch)} imágenes:")
+    for fmt in formats:
+        report = parity_check(args.model, fmt, batch)
+        print(f"{fmt:12s} etiquetas iguales: {report['label_agreement']:6.1%}  "
+              f"deriva máx: {report['max_drift']:.4f}  "
+              f"media: {report['mean_drift']:.4f}  "
+              f"{report['ms_per_image'][fmt]:7.1f} ms/img "
+              f"(Keras {report['ms_per_image']['keras']:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
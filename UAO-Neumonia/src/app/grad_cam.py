@@ -1,65 +1,136 @@
 # Módulo encargado de generar Grad-CAM y superponerlo en la imagen original
-import numpy as np
-import cv2
+import threading
+import weakref
+
 import tensorflow as tf
-import tensorflow.keras.backend as K
-from tensorflow.keras.models import Model
 
-from load_model import get_model
+import metrics
+from heatmap import render_overlay
+from load_model import INPUT_SHAPE, get_grad_model
 from preprocess_img import preprocess
 
-def grad_cam(array):
+# Un motor compilado por submodelo; se libera junto con el modelo
+_engines = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def _cam_from_gradients(conv_outputs, grads):
+    # Peso de cada canal: gradiente promedio sobre los ejes espaciales
+    pooled_grads = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)
+    # Ponderar los canales y reducirlos en una sola operación tensorial
+    heatmap = tf.reduce_mean(conv_outputs * pooled_grads, axis=-1)
+    heatmap = tf.nn.relu(heatmap)
+    # Normalizar entre 0 y 1; un mapa todo en cero se queda en cero
+    peak = tf.reduce_max(heatmap, axis=(1, 2), keepdims=True)
+    return tf.math.divide_no_nan(heatmap, peak)
+
+
+def _build_engine(grad_model):
+    @tf.function(
+        input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32),
+                         tf.TensorSpec((None,), tf.int64)]
+    )
+    def engine(batch_array_img, classes):
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions = grad_model(batch_array_img, training=False)
+            # Clase pedida por el llamador, o la predicha por Keras si es -1
+            predicted_class = tf.where(
+                classes >= 0, classes, tf.argmax(predictions, axis=-1)
+            )
+            loss = tf.gather(predictions, predicted_class, batch_dims=1)
+        grads = tape.gradient(loss, conv_outputs)
+        return predictions, _cam_from_gradients(conv_outputs, grads)
+
+    return engine
+
+
+def get_engine(grad_model=None):
     """
-    Genera un Grad-CAM para resaltar las áreas importantes de una imagen de entrada.
+    Devuelve el motor Grad-CAM compilado (`tf.function`) de un submodelo.
+
+    El motor tiene una firma de entrada fija, (None, 512, 512, 1) float32,
+    por lo que se traza una sola vez para cualquier tamaño de lote.
 
     Args:
-        array (numpy.ndarray): Imagen de entrada procesada como un array.
-    
+        grad_model (tensorflow.keras.Model, optional): Submodelo de Grad-CAM.
+            Por defecto, el del registro de load_model.
+
     Returns:
-        numpy.ndarray: Imagen original con un mapa de calor superpuesto.
+        Callable: Función que recibe un lote y devuelve
+        (predictions, heatmaps) como tensores.
     """
-    # Preprocesar la imagen
-    img = preprocess(array)
+    grad_model = grad_model or get_grad_model()
+    engine = _engines.get(grad_model)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(grad_model)
+            if engine is None:
+                engine = _build_engine(grad_model)
+                _engines[grad_model] = engine
+    return engine
+
 
-    # Cargar el modelo
-    model = get_model()
+def compute_heatmaps(batch_array_img, classes=None):
+    """
+    Clasifica un lote y calcula sus N mapas de calor con una sola llamada de
+    gradiente.
 
-    # Obtener la capa convolucional final
-    last_conv_layer = model.get_layer("conv10_thisone")
+    Args:
+        batch_array_img (numpy.ndarray): Imágenes preprocesadas con forma
+            (N, 512, 512, 1).
+        classes (sequence of int, optional): Índice (en LABELS) de la clase
+            de cada mapa, por ejemplo la que predijo otro motor; por defecto,
+            la de mayor probabilidad según el modelo Keras.
 
-    # Crear un modelo intermedio para obtener características
-    grad_model = Model(
-        inputs=model.input,
-        outputs=[last_conv_layer.output, model.output]
-    )
+    Returns:
+        tuple: (predictions, heatmaps) como arrays de NumPy, con formas
+        (N, 3) y (N, h, w); los mapas tienen valores entre 0 y 1.
+    """
+    with metrics.span("grad_cam_forward"):
+        # El modelo se carga (y se fijan los hilos de TF) antes de crear tensores
+        engine = get_engine()
+        batch = tf.convert_to_tensor(batch_array_img, dtype=tf.float32)
+        if classes is None:
+            classes = tf.fill([tf.shape(batch)[0]], tf.constant(-1, tf.int64))
+        else:
+            classes = tf.convert_to_tensor(classes, dtype=tf.int64)
+        predictions, heatmaps = engine(batch, classes)
+        return predictions.numpy(), heatmaps.numpy()
+
+
+def superimpose(array, heatmap):
+    """
+    Superpone el mapa de calor a la imagen original, a resolución completa.
+
+    Es la ruta de exportación. Para mostrar en pantalla, conviene
+    `heatmap.render_overlay` con el tamaño de la vista, que no colorea
+    píxeles que luego se descartan.
+
+    Args:
+        array (numpy.ndarray): Imagen original, en escala de grises o BGR.
+        heatmap (numpy.ndarray): Mapa de calor 2D entre 0 y 1.
+
+    Returns:
+        numpy.ndarray: Imagen original con el mapa de calor superpuesto (RGB).
+    """
+    return render_overlay(array, heatmap)
+
+
+def grad_cam(array, batch_array_img=None):
+    """
+    Genera un Grad-CAM para resaltar las áreas importantes de una imagen de entrada.
+
+    Args:
+        array (numpy.ndarray): Imagen de entrada procesada como un array.
+        batch_array_img (numpy.ndarray, optional): La imagen ya preprocesada,
+            con forma (1, 512, 512, 1); si se omite, se preprocesa aquí.
+
+    Returns:
+        numpy.ndarray: Imagen original con un mapa de calor superpuesto.
+    """
+    # Preprocesar la imagen solo si el llamador no lo hizo
+    if batch_array_img is None:
+        batch_array_img = preprocess(array)
 
-    # Usar GradientTape para calcular los gradientes
-    with tf.GradientTape() as tape:
-        conv_outputs, predictions = grad_model(img)
-        predicted_class = tf.argmax(predictions[0])
-        loss = predictions[:, predicted_class]
-
-    # Calcular gradientes de la pérdida con respecto a las salidas de la capa 
-    # convolucional
-    grads = tape.gradient(loss, conv_outputs)
-
-    # Promediar los gradientes sobre los ejes espaciales
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-
-    # Multiplicar cada canal por su gradiente promedio
-    conv_outputs = conv_outputs[0].numpy()
-    pooled_grads = pooled_grads.numpy()
-    for i in range(pooled_grads.shape[-1]):
-        conv_outputs[:, :, i] *= pooled_grads[i]
-
-    # Crear el mapa de calor
-    heatmap = np.mean(conv_outputs, axis=-1)
-    heatmap = np.maximum(heatmap, 0)  # Aplicar ReLU
-    heatmap /= np.max(heatmap)  # Normalizar entre 0 y 1
-    heatmap = cv2.resize(heatmap, (array.shape[1], array.shape[0]))
-    heatmap = np.uint8(255 * heatmap)
-    heatmap = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-
-    # Superponer el mapa de calor a la imagen original
-    superimposed_img = cv2.addWeighted(array, 0.8, heatmap, 0.2, 0)
-    return superimposed_img[:, :, ::-1]
+    _, heatmaps = compute_heatmaps(batch_array_img)
+    return superimpose(array, heatmaps[0])
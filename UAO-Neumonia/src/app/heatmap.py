@@ -0,0 +1,72 @@
+# Módulo encargado de colorear el Grad-CAM y superponerlo a la imagen, a la resolución pedida
+"""
+Rendering of Grad-CAM heatmaps.
+
+The pipeline keeps the raw class activation map (CAM): a small float32 2D
+array with values between 0 and 1, at the resolution of `conv10_thisone`.
+These functions turn it into an image only when one is needed, at the size
+it will be shown. That is 250x250 for the interface, and the full resolution
+of the study only when exporting.
+
+Colouring uses a precomputed 256-entry JET table in RGB, indexed with the
+uint8 CAM. No BGR→RGB flip is needed afterwards.
+
+Functions:
+    colorize: CAM -> RGB JET image at a given size.
+    render_overlay: CAM superimposed on the original image at a given size.
+"""
+import cv2
+import numpy as np
+
+import metrics
+
+# Tabla JET de OpenCV (256 colores) ya ordenada como RGB
+JET_LUT = cv2.applyColorMap(
+    np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_JET
+)[:, 0, ::-1].copy()
+# Pesos de la imagen original y del mapa de calor en la superposición
+IMAGE_WEIGHT = 0.8
+HEATMAP_WEIGHT = 0.2
+
+
+def colorize(cam, size=None):
+    """
+    Colours a CAM with the JET table.
+
+    Args:
+        cam (numpy.ndarray): 2D map with values between 0 and 1.
+        size (tuple, optional): (width, height) of the result; the CAM is
+            upsampled bilinearly. None keeps the CAM resolution.
+
+    Returns:
+        numpy.ndarray: RGB uint8 image.
+    """
+    cam = np.asarray(cam, dtype=np.float32)
+    if size is not None and (cam.shape[1], cam.shape[0]) != tuple(size):
+        cam = cv2.resize(cam, tuple(size))
+    return JET_LUT[np.uint8(255 * cam)]
+
+
+@metrics.timed("heatmap_render")
+def render_overlay(array, cam, size=None):
+    """
+    Superimposes a CAM on the original image.
+
+    With `size` the original is first reduced to that size (INTER_AREA) and
+    the CAM is upsampled only to it. Without `size` the overlay is rendered
+    at the full resolution of `array`, as needed when exporting.
+
+    Args:
+        array (numpy.ndarray): Original image, grayscale or BGR.
+        cam (numpy.ndarray): 2D map with values between 0 and 1.
+        size (tuple, optional): (width, height) of the result.
+
+    Returns:
+        numpy.ndarray: RGB uint8 image with the heatmap superimposed.
+    """
+    if size is not None and (array.shape[1], array.shape[0]) != tuple(size):
+        array = cv2.resize(array, tuple(size), interpolation=cv2.INTER_AREA)
+    code = cv2.COLOR_GRAY2RGB if array.ndim == 2 else cv2.COLOR_BGR2RGB
+    image = cv2.cvtColor(array, code)
+    heatmap = colorize(cam, (image.shape[1], image.shape[0]))
+    return cv2.addWeighted(image, IMAGE_WEIGHT, heatmap, HEATMAP_WEIGHT, 0)
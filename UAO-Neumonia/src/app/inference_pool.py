@@ -0,0 +1,250 @@
+# Módulo encargado de repartir la inferencia entre varias réplicas del modelo
+"""
+Concurrent inference pool with configurable CPU parallelism.
+
+One TensorFlow process uses all the cores for each operation. On many-core
+servers, several smaller replicas often give more images per second. Each
+replica is a worker process with its own copy of the model, its own
+intra/inter-op thread counts and, optionally, its own set of CPUs
+(`os.sched_setaffinity`, Linux).
+
+`InferencePool` is shared by any number of caller threads. `submit` returns
+a `concurrent.futures.Future`, and `predict`/`predict_batch` block until the
+results arrive. Work is spread over the workers in chunks of `batch_size`
+images. With `workers=0` the pool runs in the calling process and shares the
+in-process model: the `integrator` functions are safe to call from several
+threads, and those threads share that one replica.
+
+Usage:
+    with InferencePool(workers=4, pin=True) as pool:
+        label, proba, heatmap = pool.predict(array)
+
+`benchmarks/bench_inference_pool.py` measures throughput against the worker
+count, to choose the settings of each machine.
+
+Classes:
+    InferencePool: Pool of model replicas.
+
+Functions:
+    cpu_sets: Splits the available CPUs into disjoint sets.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import load_model
+from prediction import BATCH_SIZE
+
+# Réplicas por defecto; se puede cambiar con NEUMONIA_WORKERS
+WORKERS = int(os.environ.get("NEUMONIA_WORKERS", "0"))
+
+# En cada réplica: contadores compartidos [réplicas iniciadas, réplicas listas]
+_counter = None
+
+
+def _available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_sets(workers):
+    """
+    Splits the CPUs available to this process into `workers` disjoint sets
+    of consecutive CPUs.
+
+    Args:
+        workers (int): Number of sets.
+
+    Returns:
+        list of list of int: One CPU set per worker. With more workers than
+        CPUs, sets are reused round-robin.
+    """
+    cpus = _available_cpus()
+    if workers <= len(cpus):
+        size, extra = divmod(len(cpus), workers)
+        sets, start = [], 0
+        for i in range(workers):
+            end = start + size + (1 if i < extra else 0)
+            sets.append(cpus[start:end])
+            start = end
+        return sets
+    return [[cpus[i % len(cpus)]] for i in range(workers)]
+
+
+def _init_worker(model_path, backend, cpus, counter, intra, inter):
+    """Sets up one replica: CPU affinity, thread counts and the model."""
+    global _counter
+    _counter = counter
+    with counter.get_lock():
+        index = counter[0]
+        counter[0] += 1
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus[index % len(cpus)])
+        intra = intra or len(cpus[index % len(cpus)])
+    load_model.MODEL_PATH = model_path
+    if backend:
+        load_model.BACKEND = backend
+    load_model.configure_threads(intra, inter)
+    load_model.preload()
+    with counter.get_lock():
+        counter[1] += 1
+
+
+def _wait_ready(workers, timeout):
+    # Ocupa la réplica hasta que todas arrancaron, así el pool crea las N
+    deadline = time.monotonic() + timeout
+    while _counter[1] < workers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return os.getpid()
+
+
+def _run(arrays, heatmaps):
+    # Se ejecuta en el proceso de la réplica
+    from integrator import prediction_batch
+
+    return prediction_batch(arrays, batch_size=len(arrays), heatmaps=heatmaps)
+
+
+class InferencePool:
+    """
+    Pool of model replicas shared by concurrent callers.
+
+    Args:
+        workers (int, optional): Replica processes; 0 runs in the calling
+            process. Defaults to WORKERS.
+        batch_size (int): Images per model call inside a replica.
+        intra_op_threads (int, optional): TensorFlow intra-op threads per
+            replica. Defaults to the size of its CPU set when pinned, else
+            to the number of CPUs divided by the number of workers.
+        inter_op_threads (int, optional): TensorFlow inter-op threads per
+            replica. Defaults to 1 with several workers.
+        pin (bool or list): True pins each replica to a set from
+            `cpu_sets(workers)`; a list gives the CPU sets explicitly.
+        model_path (str, optional): Defaults to load_model.MODEL_PATH.
+        backend (str, optional): Backend of the predictions without
+            Grad-CAM, see `load_model.get_predictor`.
+    """
+
+    def __init__(self, workers=None, batch_size=BATCH_SIZE,
+                 intra_op_threads=None, inter_op_threads=None, pin=False,
+                 model_path=None, backend=None):
+        self.workers = WORKERS if workers is None else workers
+        self.batch_size = batch_size
+        self.model_path = model_path or load_model.MODEL_PATH
+        self.executor = None
+        if self.workers == 0:
+            return
+
+        if pin is True:
+            cpus = cpu_sets(self.workers)
+        else:
+            cpus = [list(c) for c in pin] if pin else None
+        if intra_op_threads is None and not cpus:
+            intra_op_threads = max(1, len(_available_cpus()) // self.workers)
+        if inter_op_threads is None:
+            inter_op_threads = 1 if self.workers > 1 else 0
+        self.cpus = cpus
+
+        # spawn: cada réplica arranca TensorFlow desde cero con sus hilos
+        context = multiprocessing.get_context("spawn")
+        counter = context.Array("i", 2)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.model_path, backend, cpus, counter,
+                      intra_op_threads or 0, inter_op_threads or 0),
+        )
+
+    def start(self, timeout=120):
+        """
+        Starts every replica and waits until their models are loaded.
+
+        Returns:
+            list of int: Process IDs of the replicas.
+        """
+        if self.executor is not None:
+            futures = [self.executor.submit(_wait_ready, self.workers, timeout)
+                       for _ in range(self.workers)]
+            return sorted({f.result() for f in futures})
+        from integrator import warm_up
+
+        warm_up()
+        return [os.getpid()]
+
+    def submit(self, arrays, heatmaps=True):
+        """
+        Queues images for prediction.
+
+        Args:
+            arrays (list of numpy.ndarray): Images, as given to
+                `integrator.prediction`.
+            heatmaps (bool): Whether to compute the Grad-CAM maps.
+
+        Returns:
+            concurrent.futures.Future: Resolves to one (label, proba,
+            heatmap) per image, in input order.
+        """
+        arrays = list(arrays)
+        if self.executor is None:
+            from integrator import prediction_batch
+
+            future = Future()
+            try:
+                future.set_result(prediction_batch(
+                    arrays, batch_size=self.batch_size, heatmaps=heatmaps
+                ))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if not arrays:
+            # Sin trozos no habría ningún resultado que complete el Future
+            future = Future()
+            future.set_result([])
+            return future
+        chunks = [
+            self.executor.submit(_run, arrays[i:i + self.batch_size], heatmaps)
+            for i in range(0, len(arrays), self.batch_size)
+        ]
+        if len(chunks) == 1:
+            return chunks[0]
+        future = Future()
+        remaining = [len(chunks)]
+        lock = threading.Lock()
+
+        def collect(_):
+            # Se llama una vez por trozo; al terminar el último se arma el resultado
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                future.set_result([r for c in chunks for r in c.result()])
+            except Exception as e:
+                future.set_exception(e)
+
+        for chunk in chunks:
+            chunk.add_done_callback(collect)
+        return future
+
+    def predict_batch(self, arrays, heatmaps=True):
+        """Predicts many images; blocks until all results are ready."""
+        return self.submit(arrays, heatmaps).result()
+
+    def predict(self, array, heatmaps=True):
+        """Predicts one image; returns (label, proba, heatmap)."""
+        return self.submit([array], heatmaps).result()[0]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,44 +1,378 @@
 # Módulo integrador que se encarga de orquestar las funciones de lectura de imagen,
+import gc
 import os
+import threading
 import cv2
 import numpy as np
 
-from read_img import read_dicom_file, read_jpg_file
-from prediction import predict
+from read_img import (DISPLAY_SIZE, MODEL_SIZE, iter_series_frames,
+                      read_dicom_file, read_jpg_file)
+from prediction import (BATCH_SIZE, LABELS, LazyHeatmap, heatmap_mode,
+                        needs_heatmap, predict, predict_batch, predict_study,
+                        resolve_heatmap)
+from preprocess_img import buffer_pool, preprocess
+from heatmap import render_overlay
+from result_cache import ResultCache, model_fingerprint, study_hash
+from results_store import ResultsStore
+from dicom_index import DicomIndex
+from report import write_report
+import load_model
 
-def prediction(array):
+# Caché de resultados en disco: NEUMONIA_CACHE=0 la desactiva
+CACHE_DIR = os.environ.get(
+    "NEUMONIA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "neumonia", "resultados"),
+)
+CACHE_MAX_MB = int(os.environ.get("NEUMONIA_CACHE_MAX_MB", "512"))
+CACHE_ENABLED = os.environ.get("NEUMONIA_CACHE", "1") != "0"
+
+# Política de Grad-CAM de la interfaz (ver prediction.HEATMAP_MODES)
+HEATMAP_MODE = os.environ.get("NEUMONIA_HEATMAP", "auto")
+
+# Modo de memoria acotada: NEUMONIA_LOW_MEMORY=1 guarda solo copias a la
+# resolución del modelo o de la vista y limita los búferes de lote retenidos
+LOW_MEMORY = os.environ.get("NEUMONIA_LOW_MEMORY", "0") == "1"
+
+_cache = None
+_cache_lock = threading.Lock()
+_store = None
+_index = None
+
+if LOW_MEMORY:
+    buffer_pool.max_buffers = 1
+    buffer_pool.max_rows = BATCH_SIZE
+
+def get_cache():
+    """
+    Returns the shared result cache, or None if it is disabled.
+
+    Returns:
+        ResultCache or None: The cache configured by CACHE_DIR/CACHE_MAX_MB.
+    """
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024)
+    return _cache
+
+def cache_stats():
+    """
+    Returns the hit/miss counters of the result cache.
+
+    Returns:
+        dict: Counters from ResultCache.stats(), empty if the cache is disabled.
+    """
+    cache = get_cache()
+    return cache.stats() if cache is not None else {}
+
+def _upgrade_on_compute(cache, fingerprint, array, label, proba, lazy):
+    # Cuando el mapa diferido se calcula, la entrada pasa a tenerlo
+    lazy.on_compute = lambda cam: cache.put(array, fingerprint, (label, proba, cam))
+
+def _cache_result(cache, fingerprint, array, result):
+    # Clase y probabilidad se guardan siempre; el mapa, si ya está calculado
+    label, proba, heatmap = result
+    if isinstance(heatmap, LazyHeatmap):
+        if not heatmap.computed:
+            _upgrade_on_compute(cache, fingerprint, array, label, proba, heatmap)
+        heatmap = heatmap.get() if heatmap.computed else None
+    cache.put(array, fingerprint, (label, proba, heatmap))
+
+def _cached_result(cache, fingerprint, array, result, mode, lazy_maps=True):
+    # Adapta una entrada de la caché al modo pedido
+    label, proba, heatmap = result
+    if mode == "never":
+        return label, proba, None
+    if heatmap is not None:
+        return result
+    # Entrada sin mapa: se calcula ahora o queda diferido, para la clase guardada
+    eager = mode == "always" or (mode == "auto" and needs_heatmap(label, proba))
+    if not eager and not lazy_maps:
+        return label, proba, None
+    lazy = LazyHeatmap(preprocess(array), class_index=LABELS.index(label))
+    _upgrade_on_compute(cache, fingerprint, array, label, proba, lazy)
+    return label, proba, lazy.get() if eager else lazy
+
+def prediction(array, heatmap="always"):
     """
     Make a prediction based on the input array.
 
+    Results are looked up first in the on-disk cache, keyed by the pixel data
+    and the model file, so re-opening a study skips inference. Label and
+    probability are always cached; the heatmap once it has been computed.
+    A cached result without heatmap gets one as `mode` asks: computed now,
+    or a `LazyHeatmap` that stores it in the cache when computed.
+
     Args:
         array (list or numpy.ndarray): The input data for making the prediction.
+        heatmap (str or bool): Grad-CAM mode, see `prediction.predict`.
 
     Returns:
         The prediction result from the model.
     """
-    return predict(array)
+    mode = heatmap_mode(heatmap)
+    cache = get_cache()
+    fingerprint = model_fingerprint(load_model.MODEL_PATH) if cache else None
+    if fingerprint is None:
+        return predict(array, mode)
+    result = cache.get(array, fingerprint)
+    if result is None:
+        result = predict(array, mode)
+        _cache_result(cache, fingerprint, array, result)
+        return result
+    return _cached_result(cache, fingerprint, array, result, mode)
+
+def prediction_batch(arrays, batch_size=BATCH_SIZE, heatmaps=True, lazy_maps=True):
+    """
+    Make predictions for many input arrays in one call.
+
+    Cached results are reused as in `prediction`; only the misses go
+    through the model.
+
+    Args:
+        arrays (list of numpy.ndarray): The input images.
+        batch_size (int): Number of images per model call.
+        heatmaps (bool or str): Grad-CAM mode, see
+            `prediction.predict_preprocessed`.
+        lazy_maps (bool): False returns None instead of the maps that were
+            not computed, see `prediction.predict_preprocessed`.
+
+    Returns:
+        list of tuple: One (label, proba, heatmap) per image, in input order.
+    """
+    mode = heatmap_mode(heatmaps)
+    cache = get_cache()
+    fingerprint = model_fingerprint(load_model.MODEL_PATH) if cache else None
+    if fingerprint is None:
+        return predict_batch(arrays, batch_size=batch_size, heatmaps=mode,
+                             lazy_maps=lazy_maps)
+
+    results = [cache.get(array, fingerprint) for array in arrays]
+    results = [
+        r if r is None
+        else _cached_result(cache, fingerprint, array, r, mode, lazy_maps)
+        for array, r in zip(arrays, results)
+    ]
+    missing = [i for i, r in enumerate(results) if r is None]
+    computed = predict_batch(
+        [arrays[i] for i in missing], batch_size=batch_size, heatmaps=mode,
+        lazy_maps=lazy_maps,
+    )
+    for i, result in zip(missing, computed):
+        results[i] = result
+        _cache_result(cache, fingerprint, arrays[i], result)
+    return results
+
+def prediction_series(paths, batch_size=BATCH_SIZE, aggregate="max"):
+    """
+    Classifies a multi-frame DICOM or a series of DICOM files as one study.
+
+    Frames are streamed from disk in batches of `batch_size`; memory stays
+    bounded whatever the number of frames. No Grad-CAM is computed: use
+    `read_dicom` and `prediction` on the `peak_frame` to see its heatmap.
+
+    Args:
+        paths (str or list of str): One DICOM file or the files of a series.
+        batch_size (int): Number of frames per model call.
+        aggregate (str): "max" or "mean", see `prediction.predict_study`.
 
-def read_dicom(path):
+    Returns:
+        dict: Study result from `prediction.predict_study`, where
+        `peak_frame` is replaced by `peak_path` and `peak_index` (file and
+        frame within it).
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    # Primer cuadro de cada archivo, para ubicar el cuadro pico al final
+    starts = []
+
+    def frames():
+        for number, (path, index, frame) in enumerate(iter_series_frames(paths)):
+            if index == 0:
+                starts.append((number, path))
+            yield frame
+
+    result = predict_study(frames(), batch_size=batch_size, aggregate=aggregate)
+    peak = result.pop("peak_frame")
+    first, path = next((n, p) for n, p in reversed(starts) if n <= peak)
+    result["peak_path"], result["peak_index"] = path, peak - first
+    return result
+
+def render_heatmap(array, heatmap, size=None):
+    """
+    Draws a Grad-CAM map returned by `prediction` over its image.
+
+    Args:
+        array (numpy.ndarray): The image given to `prediction`.
+        heatmap (numpy.ndarray or LazyHeatmap): The raw Grad-CAM map of the
+            prediction; a lazy one is computed here.
+        size (tuple, optional): (width, height) to render at, e.g.
+            DISPLAY_SIZE. None renders at the full image resolution, for
+            exporting.
+
+    Returns:
+        numpy.ndarray: RGB image with the heatmap superimposed.
+    """
+    return render_overlay(array, resolve_heatmap(heatmap), size)
+
+def model_version():
+    """
+    Identifies the model in use: file name and the start of its SHA-256.
+
+    Returns:
+        str: For example `conv_MLP_84.h5@1a2b3c4d5e6f`.
+    """
+    fingerprint = model_fingerprint(load_model.MODEL_PATH)
+    name = os.path.basename(load_model.MODEL_PATH)
+    return f"{name}@{fingerprint[:12]}" if fingerprint else name
+
+def get_store():
+    """
+    Returns the shared results history (see `results_store`).
+
+    The first time, an existing `historial.csv` in the working directory is
+    imported into it.
+
+    Returns:
+        ResultsStore: The database at results_store.DB_PATH.
+    """
+    global _store
+    if _store is None:
+        with _cache_lock:
+            if _store is None:
+                store = ResultsStore()
+                if os.path.exists("historial.csv"):
+                    store.import_historial("historial.csv")
+                _store = store
+    return _store
+
+def get_index():
+    """
+    Returns the shared DICOM header index (see `dicom_index`).
+
+    Returns:
+        DicomIndex: The database at dicom_index.DB_PATH.
+    """
+    global _index
+    if _index is None:
+        with _cache_lock:
+            if _index is None:
+                _index = DicomIndex()
+    return _index
+
+def indexed_studies(root, **filters):
+    """
+    Updates the DICOM index for a folder and returns its studies.
+
+    Only new or changed files have their headers read; no pixel data is
+    decoded.
+
+    Args:
+        root (str): Folder of studies.
+        **filters: Filters of `DicomIndex.query` (modality, chest,
+            patient_id, ...).
+
+    Returns:
+        list of dict: Index rows, sorted by path.
+    """
+    index = get_index()
+    index.update(root)
+    return index.query(root, **filters)
+
+def save_result(patient_id, array, label, proba):
+    """
+    Records a prediction in the results history.
+
+    Args:
+        patient_id (str): The patient ID typed in the interface.
+        array (numpy.ndarray): The image given to `prediction`.
+        label (str): Predicted class.
+        proba (float): Probability of the class, in percent.
+    """
+    get_store().add(
+        patient_id, label, proba, study_hash=study_hash(array),
+        model_version=model_version(), source="interfaz",
+    )
+
+def save_report(path, patient_id, array, heatmap, label, proba):
+    """
+    Writes the PDF report of a prediction (see `report.write_report`).
+
+    Args:
+        path (str): Destination `.pdf` file.
+        patient_id (str): The patient ID typed in the interface.
+        array (numpy.ndarray): The image given to `prediction`.
+        heatmap (numpy.ndarray or LazyHeatmap): The raw Grad-CAM map of the
+            prediction; a lazy one is computed here.
+        label (str): Predicted class.
+        proba (float): Probability of the class, in percent.
+
+    Returns:
+        str: `path`.
+    """
+    return write_report(path, array, resolve_heatmap(heatmap), patient_id,
+                        label, proba, model_version=model_version())
+
+def warm_up():
+    """
+    Loads and warms up the model and its Grad-CAM sub-model.
+
+    Meant to run in the background at application start, so the first
+    prediction doesn't pay for it.
+    """
+    load_model.preload()
+
+def read_dicom(path, full_resolution=False):
     """
     Reads a DICOM file from the specified path.
 
+    Unless `full_resolution` is True, the image is decoded straight to the
+    model resolution and the displayable image to the preview size, which
+    avoids the full-resolution copies of large films.
+
     Args:
         path (str): The file path to the DICOM file.
+        full_resolution (bool): Keep the full resolution of the file.
 
     Returns:
         DICOM object: The DICOM file read from the specified path.
     """
-    return read_dicom_file(path)
+    if full_resolution:
+        return read_dicom_file(path)
+    return read_dicom_file(path, target_size=MODEL_SIZE, display_size=DISPLAY_SIZE)
 
-def read_jpg(path):
+def read_jpg(path, full_resolution=None):
     """
     Reads a JPG file from the specified path.
 
+    In the low-memory mode (LOW_MEMORY) the image is decoded at a reduced
+    scale straight to the model resolution, with a preview-sized image, and
+    no full-resolution copy is kept.
+
     Args:
         path (str): The file path to the JPG image.
+        full_resolution (bool, optional): Keep the full resolution of the
+            file. Defaults to False in the low-memory mode, True otherwise.
 
     Returns:
         Image: The image object read from the file.
     """
-    return read_jpg_file(path)
+    if full_resolution is None:
+        full_resolution = not LOW_MEMORY
+    if full_resolution:
+        return read_jpg_file(path)
+    return read_jpg_file(path, target_size=MODEL_SIZE, display_size=DISPLAY_SIZE)
+
+def release_memory():
+    """
+    Returns the memory of the idle batch buffers and collects garbage.
+
+    Called when the interface clears its study, so large buffers do not
+    outlive it.
+    """
+    buffer_pool.clear()
+    gc.collect()
 
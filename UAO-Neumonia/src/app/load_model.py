@@ -1,20 +1,402 @@
 # Módulo encargado de cargar el modelo entrenado
-import tensorflow as tf
-from tensorflow.keras.models import load_model
+import os
+import threading
+
+import numpy as np
 
 
 """
 This module is responsible for loading the trained model.
 
+The model is kept in a process-wide registry: each `.h5` file is deserialized
+only once per process, warmed up with a dummy forward pass and shared by every
+caller (prediction, Grad-CAM, batch tools). Access is thread-safe.
+
+TensorFlow is only imported when the first model is loaded, so importing this
+module (and `prediction`/`integrator`) is cheap and the GUI can open its
+window before TensorFlow has initialized.
+
+Predictions without Grad-CAM can run on an exported copy of the model
+(SavedModel or TFLite, see `export_model.py`) selected with `NEUMONIA_BACKEND`
+or the `backend` argument of `get_predictor`. Grad-CAM always uses the
+full-precision Keras graph.
+
+The TensorFlow thread pools are sized once, before the first model is
+loaded: NEUMONIA_INTRA_OP_THREADS and NEUMONIA_INTER_OP_THREADS (or
+`configure_threads`). TFLite interpreters use the intra-op count too.
+`inference_pool.py` runs several replicas in worker processes.
+
 Functions:
-    get_model: Loads and returns a pre-trained model from a specified file.
+    configure_threads: Sets the TensorFlow intra/inter-op thread counts.
+    get_model: Returns the cached pre-trained model, loading it on first use.
+    get_grad_model: Returns the cached Grad-CAM sub-model of a model.
+    get_predictor: Returns a cached batch predictor on the selected backend.
+    available_backends: Lists the backends exported next to a model.
+    exported_path: Path of the exported copy of a model for a backend.
+    preload: Loads (and warms up) a model eagerly, e.g. at application start.
+    reload: Discards the cached model and loads it again from disk.
+    evict: Removes one or all models from the registry.
+    is_loaded: Tells whether a model is already in the registry.
 
 Dependencies:
     tensorflow
     tensorflow.keras.models.load_model
 """
-def get_model():
-    # Carga un modelo ya entrenado
-    model = load_model("Modelo de Neumonia .h5-20250126/conv_MLP_84.h5", 
-                       compile=False)
+
+# Ruta por defecto del modelo; se puede sobrescribir con NEUMONIA_MODEL_PATH
+MODEL_PATH = os.environ.get(
+    "NEUMONIA_MODEL_PATH", "Modelo de Neumonia .h5-20250126/conv_MLP_84.h5"
+)
+# Capa convolucional usada por Grad-CAM
+LAST_CONV_LAYER = "conv10_thisone"
+# Forma de entrada del modelo (sin la dimensión de lote)
+INPUT_SHAPE = (512, 512, 1)
+# Motor de las predicciones sin Grad-CAM: uno de BACKENDS o "auto"
+BACKEND = os.environ.get("NEUMONIA_BACKEND", "keras")
+BACKENDS = ("keras", "savedmodel", "tflite", "tflite-fp16", "tflite-int8")
+# Preferencia de "auto": el primero exportado junto al .h5. int8 solo se usa
+# si se pide explícitamente, después de revisar su paridad.
+AUTO_ORDER = ("tflite-fp16", "tflite", "savedmodel", "keras")
+
+# Hilos de TensorFlow; 0 deja el valor por defecto (todos los núcleos)
+INTRA_OP_THREADS = int(os.environ.get("NEUMONIA_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("NEUMONIA_INTER_OP_THREADS", "0"))
+
+_lock = threading.RLock()
+_threads_configured = False
+_models = {}
+_grad_models = {}
+_predictors = {}
+
+
+def _key(path):
+    return os.path.abspath(path)
+
+
+def configure_threads(intra=None, inter=None):
+    """
+    Sets the intra-op and inter-op thread counts of TensorFlow.
+
+    Must run before TensorFlow executes anything; it is called automatically
+    (with INTRA_OP_THREADS and INTER_OP_THREADS) before the first model is
+    loaded. Passing values changes those defaults too.
+
+    Args:
+        intra (int, optional): Threads used inside one operation
+            (convolutions, matrix products). 0 keeps TensorFlow's default.
+        inter (int, optional): Operations run in parallel. 0 keeps the
+            default.
+
+    Returns:
+        bool: False if TensorFlow was already running and the thread pools
+        could not be changed.
+    """
+    global INTRA_OP_THREADS, INTER_OP_THREADS, _threads_configured
+    import tensorflow as tf
+
+    with _lock:
+        if intra is not None:
+            INTRA_OP_THREADS = intra
+        if inter is not None:
+            INTER_OP_THREADS = inter
+        _threads_configured = True
+        try:
+            if INTRA_OP_THREADS:
+                tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+            if INTER_OP_THREADS:
+                tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+        except RuntimeError:
+            # TensorFlow ya se inicializó: los hilos quedan como estaban
+            return False
+    return True
+
+
+def _ensure_threads():
+    if not _threads_configured:
+        configure_threads()
+
+
+def load_model(path, compile=False):
+    """Deserializes a Keras model, importing TensorFlow on first use."""
+    _ensure_threads()
+    from tensorflow.keras.models import load_model as keras_load_model
+
+    return keras_load_model(path, compile=compile)
+
+
+def _warm_up(model):
+    # Un primer paso hacia adelante inicializa los kernels y el grafo de TF
+    dummy = np.zeros((1,) + INPUT_SHAPE, dtype=np.float32)
+    model(dummy, training=False)
+
+
+def get_model(path=None, warm_up=True):
+    """
+    Returns the pre-trained model stored at `path`, loading it only once.
+
+    The first call deserializes the file (compile=False) and, if `warm_up`
+    is True, runs a forward pass on a 512x512x1 zero image. Later calls
+    return the same object without touching the disk.
+
+    Args:
+        path (str, optional): Path to the `.h5` file. Defaults to MODEL_PATH.
+        warm_up (bool): Run a dummy forward pass right after loading.
+
+    Returns:
+        tensorflow.keras.Model: The cached model.
+    """
+    key = _key(path or MODEL_PATH)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            # Carga un modelo ya entrenado
+            model = load_model(key, compile=False)
+            if warm_up:
+                _warm_up(model)
+            _models[key] = model
     return model
+
+
+def get_grad_model(path=None, warm_up=True):
+    """
+    Returns the Grad-CAM sub-model, built only once per loaded model.
+
+    The sub-model shares weights with `get_model(path)` and outputs
+    `[conv10_thisone activations, class probabilities]`.
+
+    Args:
+        path (str, optional): Path to the `.h5` file. Defaults to MODEL_PATH.
+        warm_up (bool): Run a dummy forward pass right after building it.
+
+    Returns:
+        tensorflow.keras.Model: The cached Grad-CAM sub-model.
+    """
+    key = _key(path or MODEL_PATH)
+    grad_model = _grad_models.get(key)
+    if grad_model is not None:
+        return grad_model
+    with _lock:
+        grad_model = _grad_models.get(key)
+        if grad_model is None:
+            from tensorflow.keras.models import Model
+
+            model = get_model(key, warm_up=warm_up)
+            last_conv_layer = model.get_layer(LAST_CONV_LAYER)
+            grad_model = Model(
+                inputs=model.input,
+                outputs=[last_conv_layer.output, model.output]
+            )
+            if warm_up:
+                _warm_up(grad_model)
+            _grad_models[key] = grad_model
+    return grad_model
+
+
+def exported_path(path, backend):
+    """
+    Returns where `export_model.py` writes the `backend` copy of a model.
+
+    Args:
+        path (str): Path to the `.h5` file.
+        backend (str): One of BACKENDS other than "keras".
+
+    Returns:
+        str: `<model>.savedmodel`, `<model>.tflite`, `<model>.fp16.tflite`
+        or `<model>.int8.tflite`.
+    """
+    stem = os.path.splitext(path)[0]
+    suffixes = {
+        "savedmodel": ".savedmodel",
+        "tflite": ".tflite",
+        "tflite-fp16": ".fp16.tflite",
+        "tflite-int8": ".int8.tflite",
+    }
+    if backend not in suffixes:
+        raise ValueError(f"Backend desconocido: {backend}")
+    return stem + suffixes[backend]
+
+
+def available_backends(path=None):
+    """Returns the backends whose exported copy exists next to the model."""
+    key = _key(path or MODEL_PATH)
+    return [
+        backend for backend in BACKENDS
+        if backend == "keras" or os.path.exists(exported_path(key, backend))
+    ]
+
+
+class _KerasPredictor:
+    def __init__(self, path):
+        self.model = get_model(path)
+
+    def __call__(self, batch):
+        return np.asarray(self.model(batch, training=False))
+
+
+class _SavedModelPredictor:
+    def __init__(self, path):
+        import tensorflow as tf
+
+        _ensure_threads()
+        self.tf = tf
+        # Conservar el objeto cargado: es el dueño de las variables
+        self.loaded = tf.saved_model.load(path)
+        self.serve = self.loaded.serve
+
+    def __call__(self, batch):
+        return self.serve(self.tf.constant(batch, dtype=self.tf.float32)).numpy()
+
+
+class _TFLitePredictor:
+    def __init__(self, path):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(
+            model_path=path, num_threads=INTRA_OP_THREADS or os.cpu_count()
+        )
+        self.input = self.interpreter.get_input_details()[0]["index"]
+        self.output = self.interpreter.get_output_details()[0]["index"]
+        self.batch_size = None
+        # Un intérprete de TFLite no se puede usar desde dos hilos a la vez
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self.lock:
+            if len(batch) != self.batch_size:
+                self.interpreter.resize_tensor_input(
+                    self.input, (len(batch),) + INPUT_SHAPE
+                )
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(batch)
+            self.interpreter.set_tensor(self.input, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output).copy()
+
+
+def _resolve_backend(key, backend):
+    backend = backend or BACKEND
+    if backend == "auto":
+        available = available_backends(key)
+        return next(b for b in AUTO_ORDER if b in available)
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend}")
+    return backend
+
+
+def get_predictor(path=None, backend=None):
+    """
+    Returns a batch predictor for the model, built only once per backend.
+
+    The predictor takes a preprocessed float32 batch (N, 512, 512, 1) and
+    returns the class probabilities (N, 3) as a NumPy array. It runs on the
+    Keras model, or on the SavedModel/TFLite copy written by
+    `export_model.py`.
+
+    Args:
+        path (str, optional): Path to the `.h5` file. Defaults to MODEL_PATH.
+        backend (str, optional): One of BACKENDS, or "auto" for the first of
+            AUTO_ORDER that has been exported. Defaults to BACKEND.
+
+    Returns:
+        Callable: The cached predictor.
+
+    Raises:
+        ValueError: If the backend is unknown.
+        FileNotFoundError: If the backend was not exported for this model.
+    """
+    key = _key(path or MODEL_PATH)
+    backend = _resolve_backend(key, backend)
+    predictor = _predictors.get((key, backend))
+    if predictor is not None:
+        return predictor
+    with _lock:
+        predictor = _predictors.get((key, backend))
+        if predictor is None:
+            if backend == "keras":
+                predictor = _KerasPredictor(key)
+            else:
+                exported = exported_path(key, backend)
+                if not os.path.exists(exported):
+                    raise FileNotFoundError(
+                        f"No se ha exportado {exported}; use export_model.py."
+                    )
+                if backend == "savedmodel":
+                    predictor = _SavedModelPredictor(exported)
+                else:
+                    predictor = _TFLitePredictor(exported)
+                predictor(np.zeros((1,) + INPUT_SHAPE, dtype=np.float32))
+            _predictors[(key, backend)] = predictor
+    return predictor
+
+
+def preload(path=None, background=False):
+    """
+    Loads and warms up the model and its Grad-CAM sub-model eagerly.
+
+    Args:
+        path (str, optional): Path to the `.h5` file. Defaults to MODEL_PATH.
+        background (bool): If True, load in a daemon thread and return it.
+
+    Returns:
+        threading.Thread or None: The loader thread when `background` is True.
+    """
+    if background:
+        thread = threading.Thread(
+            target=preload, args=(path,), name="model-preload", daemon=True
+        )
+        thread.start()
+        return thread
+    get_grad_model(path)
+    return None
+
+
+def is_loaded(path=None):
+    """Returns True if the model at `path` is already in the registry."""
+    return _key(path or MODEL_PATH) in _models
+
+
+def evict(path=None):
+    """
+    Removes a model (and its Grad-CAM sub-model) from the registry.
+
+    Args:
+        path (str, optional): Model to evict. If None, the registry is cleared.
+    """
+    with _lock:
+        if path is None:
+            _models.clear()
+            _grad_models.clear()
+            _predictors.clear()
+        else:
+            key = _key(path)
+            _models.pop(key, None)
+            _grad_models.pop(key, None)
+            for cached in [k for k in _predictors if k[0] == key]:
+                del _predictors[cached]
+
+
+def reload(path=None, warm_up=True):
+    """
+    Discards the cached model and loads it again from disk.
+
+    Useful after replacing the `.h5` file while the application is running.
+
+    Args:
+        path (str, optional): Path to the `.h5` file. Defaults to MODEL_PATH.
+        warm_up (bool): Run a dummy forward pass right after loading.
+
+    Returns:
+        tensorflow.keras.Model: The freshly loaded model.
+    """
+    with _lock:
+        evict(path or MODEL_PATH)
+        return get_model(path, warm_up=warm_up)
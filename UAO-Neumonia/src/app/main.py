@@ -1,15 +1,21 @@
 # script principal de la interfaz gráfica y de la integración de las funciones.
 
 import os
-import csv
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import tkinter as tk
 from tkinter import END, Image, StringVar, Text, Tk, ttk, font, filedialog
-from PIL import ImageTk, Image, ImageGrab
+from PIL import ImageTk, Image
 from tkinter.messagebox import askokcancel, showinfo, WARNING
 
-import tkcap
+from integrator import (HEATMAP_MODE, read_dicom, read_jpg, prediction,
+                        render_heatmap, release_memory, save_report, save_result,
+                        warm_up)
 
-from integrator import read_dicom, read_jpg, prediction
+#   INTERVALO (ms) CON EL QUE LA INTERFAZ RECOGE LOS RESULTADOS DE LOS HILOS
+POLL_MS = 15
 
 class App:
     def __init__(self):
@@ -43,8 +49,19 @@ class App:
             button3 (ttk.Button): Button to clear the inputs.
             button4 (ttk.Button): Button to save the result as a PDF.
             button6 (ttk.Button): Button to save the results to a CSV file.
+            button5 (ttk.Button): Button to cancel the queued inference jobs.
+            progress (ttk.Progressbar): Busy indicator while work is running.
+            status (StringVar): Model readiness / queue status text.
             array (None): Placeholder for an array element.
             reportID (int): Identification number for generating the PDF report.
+            decoder (ThreadPoolExecutor): Worker that decodes the image files.
+            worker (ThreadPoolExecutor): Worker that loads the model and runs
+                the inference jobs, one at a time and in order.
+            loaded (deque): Decoded studies waiting to be sent to inference.
+
+        The model starts loading in the background as soon as the window is
+        created; decoding and inference never run on the Tk main thread, and
+        their results are handed back through `root.after` polling.
         """
         self.root = Tk()
         self.root.title("(MAIN)Herramienta para la detección rápida de neumonía")
@@ -95,6 +112,16 @@ class App:
         self.button6 = ttk.Button(
             self.root, text="Guardar", command=self.save_results_csv
         )
+        self.button5 = ttk.Button(
+            self.root, text="Cancelar", state="disabled", command=self.cancel
+        )
+
+        #   BUSY INDICATOR AND STATUS
+        self.status = StringVar(value="Cargando modelo...")
+        self.lab7 = ttk.Label(self.root, textvariable=self.status)
+        self.progress = ttk.Progressbar(
+            self.root, mode="indeterminate", length=430
+        )
 
         #   WIDGETS POSITIONS
         self.lab1.place(x=110, y=65)
@@ -113,33 +140,200 @@ class App:
         self.text3.place(x=610, y=400, width=90, height=30)
         self.text_img1.place(x=65, y=90)
         self.text_img2.place(x=500, y=90)
+        #   MAPA DE CALOR BAJO DEMANDA (MODO DE TRIAJE)
+        self.text_img2.bind("<Double-Button-1>", self.show_heatmap)
+        self.lab7.place(x=65, y=512)
+        self.progress.place(x=220, y=510)
+        self.button5.place(x=670, y=505)
 
         #   FOCUS ON PATIENT ID
         self.text1.focus_set()
 
         #  se reconoce como un elemento de la clase
         self.array = None
+        self.label = ""
+        self.proba = 0.0
+        self.heatmap = None
+        self.img2 = None
 
         #   NUMERO DE IDENTIFICACIÓN PARA GENERAR PDF
         self.reportID = 0
 
+        #   HILOS DE TRABAJO: decodificación e inferencia fuera del hilo de Tk
+        self.decoder = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="decodificar"
+        )
+        self.worker = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="inferencia"
+        )
+        self.events = queue.Queue()
+        self.loaded = deque()
+        self.jobs = []
+        self.generation = 0
+        self.busy = False
+        self.model_future = self.worker.submit(warm_up)
+        self.model_future.add_done_callback(
+            lambda f: self.events.put((self._on_model_ready, f, None))
+        )
+        self._update_status()
+        self.root.after(POLL_MS, self._poll_events)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
         #   RUN LOOP
         self.root.mainloop()
 
     #   METHODS
+    def _submit(self, executor, fn, callback, *args):
+        """
+        Runs `fn(*args)` on a worker executor and schedules `callback(result)`
+        on the Tk main thread once it finishes.
+
+        Jobs submitted before the last `cancel()` are discarded on arrival.
+        """
+        future = executor.submit(fn, *args)
+        generation = self.generation
+        future.add_done_callback(
+            lambda f: self.events.put((callback, f, generation))
+        )
+        self.jobs.append(future)
+        self._update_status()
+        return future
+
+    def _poll_events(self):
+        """
+        Delivers the finished background jobs to their callbacks.
+
+        Runs on the Tk main thread every POLL_MS milliseconds, so widgets are
+        only ever touched from this thread.
+        """
+        while True:
+            try:
+                callback, future, generation = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if future in self.jobs:
+                self.jobs.remove(future)
+            if future.cancelled():
+                continue
+            if generation is not None and generation != self.generation:
+                continue
+            error = future.exception()
+            if error is not None:
+                self.mostrarDato(f"Error: {error}")
+                continue
+            callback(future.result())
+        self._update_status()
+        self.root.after(POLL_MS, self._poll_events)
+
+    def _update_status(self):
+        """Refreshes the busy indicator, the cancel button and the status text."""
+        pending = sum(1 for job in self.jobs if not job.done())
+        model_loaded = self.model_future.done()
+        busy = pending > 0 or not model_loaded
+        if busy and not self.busy:
+            self.progress.start(10)
+        elif not busy and self.busy:
+            self.progress.stop()
+        self.busy = busy
+        self.button5["state"] = "enabled" if pending else "disabled"
+        if pending:
+            self.status.set(f"Procesando ({pending})...")
+        elif not model_loaded:
+            self.status.set("Cargando modelo...")
+        elif self.model_future.exception() is not None:
+            self.status.set("Modelo no disponible")
+        else:
+            self.status.set("Modelo listo")
+
+    def _on_model_ready(self, _):
+        """Called on the Tk main thread once the background model load succeeds."""
+        self._update_status()
+
+    def cancel(self):
+        """
+        Cancels the queued decode and inference jobs.
+
+        Jobs that have not started are dropped; the result of the job that is
+        already running is discarded when it arrives.
+        """
+        self.generation += 1
+        for job in self.jobs:
+            job.cancel()
+        self.jobs = [job for job in self.jobs if not job.cancelled()]
+        self._update_status()
+
+    def close(self):
+        """Stops the background workers and closes the window."""
+        self.generation += 1
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+        self.worker.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+    @staticmethod
+    def _read_study(reader, filepath):
+        """Decodes a file and builds its 250x250 preview. Runs on a worker."""
+        array, img2show = reader(filepath)
+        if array is None:
+            raise ValueError(f"No se pudo leer el archivo {filepath}.")
+        preview = img2show.resize((250, 250), Image.LANCZOS)
+        return {"path": filepath, "array": array, "preview": preview}
+
+    @staticmethod
+    def _infer(study):
+        """
+        Runs the prediction of a study and its heatmap preview. Runs on a worker.
+
+        With the triage modes (`NEUMONIA_HEATMAP`), the heatmap may be a lazy
+        handle that was not computed; the preview is then None.
+        """
+        label, proba, heatmap = prediction(study["array"], heatmap=HEATMAP_MODE)
+        heatmap_preview = None
+        if isinstance(heatmap, np.ndarray):
+            heatmap_preview = App._render_preview(study["array"], heatmap)
+        return study, label, proba, heatmap, heatmap_preview
+
+    @staticmethod
+    def _render_preview(array, heatmap):
+        """Draws the heatmap at the preview size, computing it if lazy. Runs on a worker."""
+        # El mapa crudo se dibuja directamente al tamaño de la vista
+        return Image.fromarray(render_heatmap(array, heatmap, (250, 250)))
+
+    def _show_original(self, study):
+        self.img1 = ImageTk.PhotoImage(study["preview"])
+        self.text_img1.delete(1.0, "end")
+        self.text_img1.image_create(END, image=self.img1)
+
+    def _on_image_loaded(self, study):
+        self.array = study["array"]
+        self.loaded.append(study)
+        self._show_original(study)
+        # El resultado anterior no corresponde a la nueva imagen: no se puede
+        # guardar ni reportar con ella
+        self._clear_result()
+        self.button1["state"] = "enabled"
+
+    def _clear_result(self):
+        """Forgets the shown prediction (label, probability and heatmap)."""
+        self.label = ""
+        self.proba = 0.0
+        self.heatmap = None
+        self.img2 = None
+        self.text2.delete(1.0, "end")
+        self.text3.delete(1.0, "end")
+        self.text_img2.delete(1.0, "end")
+
     def load_img_file(self):
         """
-        Prompts the user to select an image file and loads it.
-        This method opens a file dialog for the user to select an image file. 
+        Prompts the user to select one or more image files and loads them.
+        This method opens a file dialog for the user to select image files. 
         Supported file types are DICOM (.dcm), JPEG (.jpeg, .jpg), and PNG (.png). 
         Depending on the file extension, the appropriate function is called to read the image.
-        The image is then resized and displayed in the GUI.
-        Raises:
-            Exception: If there is an error reading a DICOM file.
+        Decoding runs on a background worker; each image is then displayed and
+        queued until "Predecir" is pressed.
         Displays:
             A message if the file format is not supported or if no file is selected.
         """
-        filepath = filedialog.askopenfilename(
+        filepaths = filedialog.askopenfilenames(
             initialdir="/",
             title="Select image",
             filetypes=(
@@ -150,43 +344,25 @@ class App:
             ),
         )
 
+        if not filepaths:
+            self.mostrarDato("filepath es nulo")
+            return
 
-            
-        if filepath:
-
+        for filepath in filepaths:
             ext = os.path.splitext(filepath)[1].lower()
 
             if ext == ".dcm":
-                try:
-                    self.array, img2show = read_dicom(filepath)
-                except Exception as e:
-                    return
-            elif ext in (".jpg", ".jpeg", ".png",".JPG",".JPEG"):
-                self.array, img2show = read_jpg(filepath)
+                reader = read_dicom
+            elif ext in (".jpg", ".jpeg", ".png"):
+                reader = read_jpg
             else:
                 self.mostrarDato("Formato de archivo no soportado.")
-                return
-
-            #self.img1 = img2show.resize((250, 250), Image.ANTIALIAS)
-            self.img1 = img2show.resize((250, 250), Image.LANCZOS)
-            self.img1 = ImageTk.PhotoImage(self.img1)
-            self.text_img1.image_create(END, image=self.img1)
-            self.button1["state"] = "enabled"
-        else:
-            self.mostrarDato("filepath es nulo")
-            return
-
-    def create_pdf(self):
-            cap = tkcap.CAP(self.root)
-            ID = "Reporte" + str(self.reportID) + ".jpg"
-            img = cap.capture(ID)
-            img = Image.open(ID)
-            img = img.convert("RGB")
-            pdf_path = r"Reporte" + str(self.reportID) + ".pdf"
-            img.save(pdf_path)
-            self.reportID += 1
-            showinfo(title="PDF", message="El PDF fue generado con éxito.")
+                continue
 
+            self._submit(
+                self.decoder, self._read_study, self._on_image_loaded,
+                reader, filepath,
+            )
 
     def guardar_jpeg(self):
         """
@@ -199,6 +375,9 @@ class App:
         """
         # Nombre de salida
         filename = "mi_formulario.jpg"
+        # tkcap (y pyautogui) solo se importan al capturar, no al abrir la ventana
+        import tkcap
+
         # Creamos el objeto de captura
         cap = tkcap.CAP(self.root)
         # Capturamos la ventana principal y guardamos
@@ -207,97 +386,124 @@ class App:
 
     def run_model(self):       
         """
-        Runs the prediction model on the input array, updates the UI with the prediction results.
+        Queues the loaded studies for inference on the background worker.
+
+        Each queued study goes through the `prediction` function off the Tk
+        main thread (after the model finished loading); results are shown by
+        `_on_prediction` in the order the studies were loaded. The heatmap
+        follows `NEUMONIA_HEATMAP` (`auto` by default): it is only computed
+        up front for abnormal or low-confidence results, and on double click
+        otherwise.
+        """
+        while self.loaded:
+            study = self.loaded.popleft()
+            self._submit(self.worker, self._infer, self._on_prediction, study)
+        self.button1["state"] = "disabled"
 
-        This method performs the following steps:
-        1. Calls the `prediction` function with the input array to get the label, probability, and heatmap.
-        2. Converts the heatmap array to an image and resizes it to 250x250 pixels.
-        3. Converts the resized image to a PhotoImage object.
-        4. Updates the UI with the heatmap image, prediction label, and probability.
+    def _on_prediction(self, result):
+        """
+        Updates the UI with the prediction results of one study.
 
         Attributes:
             self.label (str): The predicted label from the model.
             self.proba (float): The probability of the prediction.
-            self.heatmap (numpy.ndarray): The heatmap array from the prediction.
-            self.img2 (ImageTk.PhotoImage): The PhotoImage object of the resized heatmap.
+            self.heatmap (numpy.ndarray or LazyHeatmap): The raw Grad-CAM map
+                from the prediction, or the handle that computes it on demand.
+            self.img2 (ImageTk.PhotoImage): The PhotoImage object of the resized
+                heatmap, or None until a lazy heatmap is requested.
         """
-        self.label, self.proba, self.heatmap = prediction(self.array) 
-        self.img2 = Image.fromarray(self.heatmap)
-        #self.img2 = self.img2.resize((250, 250), Image.ANTIALIAS)
-
-        self.img2 = self.img2.resize((250, 250), Image.LANCZOS)
-        self.img2 = ImageTk.PhotoImage(self.img2)
-        print("OK")
-        self.text_img2.image_create(END, image=self.img2)
+        study, self.label, self.proba, self.heatmap, heatmap_preview = result
+        self.array = study["array"]
+        self._show_original(study)
+        self.text_img2.delete(1.0, "end")
+        if heatmap_preview is None:
+            self.img2 = None
+            self.text_img2.insert(END, "Mapa de calor bajo demanda\n(doble clic)")
+        else:
+            self._show_heatmap(heatmap_preview)
+        self.text2.delete(1.0, "end")
         self.text2.insert(END, self.label)
+        self.text3.delete(1.0, "end")
         self.text3.insert(END, "{:.2f}".format(self.proba) + "%")
 
-    def save_results_csv(self):
+    def show_heatmap(self, event=None):
         """
-        Save the results to a CSV file.
+        Computes and shows the heatmap of the current result when the triage
+        mode skipped it (double click on the heatmap box).
 
-        This method appends the current results to a CSV file named 'historial.csv'.
-        The results include text from `self.text1`, a label, and a probability value
-        formatted as a percentage.
+        Grad-CAM runs on the inference worker; nothing happens if the heatmap
+        is already shown or there is no result.
+        """
+        if self.array is None or self.heatmap is None or self.img2 is not None:
+            return
+        heatmap = self.heatmap
+        self._submit(
+            self.worker, self._render_preview,
+            # Se descarta si mientras tanto cambió el resultado mostrado
+            lambda preview: heatmap is self.heatmap and self._show_heatmap(preview),
+            self.array, heatmap,
+        )
+
+    def _show_heatmap(self, heatmap_preview):
+        self.img2 = ImageTk.PhotoImage(heatmap_preview)
+        self.text_img2.delete(1.0, "end")
+        self.text_img2.image_create(END, image=self.img2)
 
-        The CSV file uses a hyphen ('-') as the delimiter.
+    def save_results_csv(self):
+        """
+        Save the results to the history database.
 
-        After successfully saving the data, a message box is shown to inform the user.
+        The current patient ID, label and probability are recorded in the
+        indexed history (`results_store`), together with the study hash and
+        the model version. The write runs on the decoding thread; a message
+        box informs the user when it is done.
 
-        Raises:
-            IOError: If the file cannot be opened or written to.
+        The old `historial.csv` is imported into the database the first
+        time it is used.
         """
-        with open("historial.csv", "a") as csvfile:
-            w = csv.writer(csvfile, delimiter="-")
-            w.writerow(
-                [self.text1.get(), self.label, "{:.2f}".format(self.proba) + "%"]
-            )
-            showinfo(title="Guardar", message="Los datos se guardaron con éxito.")
+        if self.array is None or not self.label:
+            return
+        self._submit(
+            self.decoder, save_result, self._on_saved,
+            self.text1.get(), self.array, self.label, self.proba,
+        )
+
+    def _on_saved(self, _):
+        showinfo(title="Guardar", message="Los datos se guardaron con éxito.")
 
     def create_pdf(self):
         """
-        Captures the current state of the application's root window, saves it as a JPEG image,
-        converts the image to a PDF, and increments the report ID.
-
-        The method uses the tkcap library to capture the window and the PIL library to handle
-        image conversion and saving.
-
-        Raises:
-            IOError: If there is an error in saving the image or PDF.
-
-        Side Effects:
-            - Saves a JPEG image file with the current report ID.
-            - Saves a PDF file with the current report ID.
-            - Increments the report ID.
-            - Displays a message box indicating the PDF was generated successfully.
-        """       
-       
+        Writes the PDF report of the current result.
+
+        The report is laid out from the data (original image, heatmap,
+        patient ID, label and probability) by `report.write_report`, on the
+        decoding thread; no screenshot of the window is taken. The user
+        picks the destination file and a message box confirms the result.
+        """
+        if self.array is None or not self.label:
+            return
+
         # Pedir ubicación para guardar el PDF
         file_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
+            initialfile="Reporte" + str(self.reportID) + ".pdf",
             filetypes=[("PDF files", "*.pdf")],
             title="Guardar PDF"
         )
-        
+
         if not file_path:
             return  # Si el usuario cancela, no hace nada
 
-        # Capturar la ventana principal (self.root)
-        x = self.root.winfo_rootx()
-        y = self.root.winfo_rooty()
-        width = self.root.winfo_width()
-        height = self.root.winfo_height()
-
-        # Tomar captura de la ventana completa
-        img = ImageGrab.grab(bbox=(x, y, x + width, y + height))
-
-        # Guardar la imagen capturada como un PDF
-        img.save(file_path, "PDF", resolution=100)
+        self.reportID += 1
+        self._submit(
+            self.decoder, save_report, self._on_report,
+            file_path, self.text1.get(), self.array, self.heatmap,
+            self.label, self.proba,
+        )
 
+    def _on_report(self, _):
         showinfo(title="PDF", message="El PDF fue generado con éxito.")
 
-       
-
     def delete(self):
         """
         Deletes the content of multiple text and image fields after user confirmation.
@@ -316,10 +522,30 @@ class App:
             self.text1.delete(0, "end")
             self.text2.delete(1.0, "end")
             self.text3.delete(1.0, "end")
-            self.text_img1.delete(self.img1, "end")
-            self.text_img2.delete(self.img2, "end")
+            self.text_img1.delete(1.0, "end")
+            self.text_img2.delete(1.0, "end")
+            self._release_study()
             showinfo(title="Borrar", message="Los datos se borraron con éxito")
 
+    def _release_study(self):
+        """
+        Drops every reference to the current and queued studies (arrays,
+        heatmap, PhotoImages) and the pending jobs, so their memory is
+        returned right away; the garbage collection runs on the decoding
+        thread.
+        """
+        self.cancel()
+        self.loaded.clear()
+        self.button1["state"] = "disabled"
+        self.array = None
+        self.heatmap = None
+        self.label = ""
+        self.proba = 0.0
+        self.img1 = None
+        self.img2 = None
+        # gc.collect() con TensorFlow cargado puede tardar: fuera del hilo de Tk
+        self.decoder.submit(release_memory)
+
 
     def mostrarDato(self,filepath):
         """
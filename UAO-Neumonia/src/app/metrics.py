@@ -0,0 +1,249 @@
+# Módulo de métricas: tiempos por etapa, contadores e histogramas de latencia
+"""
+Lightweight instrumentation of the read → preprocess → predict → Grad-CAM
+pipeline.
+
+Instrumentation is off by default. Set `NEUMONIA_METRICS=1` or call `enable()`
+to turn it on. While it is off, `span()` returns a shared no-op context
+manager, and `timed` wrappers and `inc()` return after one flag check.
+
+With `NEUMONIA_METRICS_FILE` set, the metrics are written to that file when
+the process exits. Files ending in `.prom` or `.txt` get the Prometheus text
+format; any other file gets JSON.
+
+Functions:
+    enable / disable / is_enabled: Turn instrumentation on and off.
+    span: Context manager that times one stage.
+    timed: Decorator that times every call of a function as one stage.
+    inc: Adds to a counter.
+    observe: Records one stage duration, in seconds.
+    snapshot: Returns all metrics as a dict.
+    to_prometheus: Returns all metrics in Prometheus text format.
+    write: Writes the metrics to a JSON or Prometheus file.
+    reset: Clears every metric.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Prefijo de los nombres exportados
+PREFIX = "neumonia_"
+# Límites superiores (segundos) de los buckets del histograma de latencia
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+_enabled = os.environ.get("NEUMONIA_METRICS", "0") not in ("", "0")
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_NOOP = contextlib.nullcontext()
+
+
+def enable():
+    """Turns instrumentation on."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Turns instrumentation off; the recorded metrics are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Returns True if instrumentation is on."""
+    return _enabled
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Adds `value` to a counter.
+
+    Args:
+        name (str): Counter name, without the `neumonia_` prefix.
+        value (float): Amount to add.
+        **labels: Label values, e.g. `format="dicom"`.
+    """
+    if not _enabled:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(stage, seconds):
+    """
+    Records one duration in the latency histogram of a stage.
+
+    Args:
+        stage (str): Stage name, e.g. "read_dicom".
+        seconds (float): Duration.
+    """
+    if not _enabled:
+        return
+    key = ("stage_seconds", (("stage", stage),))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                "buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0,
+            }
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def span(stage):
+    """
+    Times a block of code as one stage.
+
+    Usage:
+        with metrics.span("preprocess"):
+            ...
+
+    Args:
+        stage (str): Stage name.
+
+    Returns:
+        A context manager; a shared no-op one while instrumentation is off.
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(stage)
+
+
+def timed(stage):
+    """Decorator that times every call of the decorated function as `stage`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Returns every metric.
+
+    Returns:
+        dict: `counters` (name, labels, value) and `histograms` (name, labels,
+        count, sum, mean and cumulative bucket counts keyed by upper bound).
+    """
+    with _lock:
+        counters = [
+            {"name": PREFIX + name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        histograms = []
+        for (name, labels), h in sorted(_histograms.items()):
+            cumulative, buckets = 0, {}
+            for bound, count in zip(BUCKETS, h["buckets"]):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = h["count"]
+            histograms.append({
+                "name": PREFIX + name,
+                "labels": dict(labels),
+                "count": h["count"],
+                "sum": h["sum"],
+                "mean": h["sum"] / h["count"] if h["count"] else 0.0,
+                "buckets": buckets,
+            })
+    return {"counters": counters, "histograms": histograms}
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def to_prometheus():
+    """Returns every metric in the Prometheus text exposition format."""
+    data = snapshot()
+    lines, typed = [], set()
+    for c in data["counters"]:
+        if c["name"] not in typed:
+            lines.append(f"# TYPE {c['name']} counter")
+            typed.add(c["name"])
+        lines.append(f"{c['name']}{_format_labels(c['labels'])} {c['value']}")
+    for h in data["histograms"]:
+        if h["name"] not in typed:
+            lines.append(f"# TYPE {h['name']} histogram")
+            typed.add(h["name"])
+        for bound, count in h["buckets"].items():
+            labels = _format_labels(h["labels"], ("le", bound))
+            lines.append(f"{h['name']}_bucket{labels} {count}")
+        labels = _format_labels(h["labels"])
+        lines.append(f"{h['name']}_sum{labels} {h['sum']}")
+        lines.append(f"{h['name']}_count{labels} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path):
+    """
+    Writes the metrics to `path`, atomically.
+
+    Args:
+        path (str): Destination; `.prom`/`.txt` get Prometheus text, any
+            other extension gets JSON.
+    """
+    if path.endswith((".prom", ".txt")):
+        content = to_prometheus()
+    else:
+        content = json.dumps(snapshot(), indent=2)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def reset():
+    """Clears every counter and histogram."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _write_at_exit():
+    path = os.environ.get("NEUMONIA_METRICS_FILE")
+    if path and (_counters or _histograms):
+        write(path)
+
+
+atexit.register(_write_at_exit)
@@ -1,44 +1,332 @@
 # Módulo prediction que se encarga de ejecutar la predicción del modelo
+import os
+import threading
+
 import numpy as np
 
-from grad_cam import grad_cam
-from load_model import get_model
-from preprocess_img import preprocess
+import metrics
+
+from load_model import get_predictor
+from preprocess_img import buffer_pool, preprocess, preprocess_batch, preprocess_into
+
+# Etiquetas en el orden de las salidas del modelo
+LABELS = ("bacteriana", "normal", "viral")
+# Tamaño de lote por defecto para predict_batch
+BATCH_SIZE = 16
+# Formas de combinar las probabilidades de los cuadros de un estudio
+AGGREGATES = ("max", "mean")
+# Políticas de Grad-CAM: siempre, nunca, bajo demanda o solo si hace falta
+HEATMAP_MODES = ("always", "never", "lazy", "auto")
+# En modo "auto" el Grad-CAM se calcula si la clase no es normal o si la
+# probabilidad (en porcentaje) es menor que este umbral
+CONFIDENCE_THRESHOLD = float(os.environ.get("NEUMONIA_HEATMAP_THRESHOLD", "90"))
+NORMAL_LABEL = "normal"
+
+
+def _label_and_proba(probabilities):
+    # Clase con mayor probabilidad y su probabilidad en porcentaje
+    prediction = int(np.argmax(probabilities))
+    return LABELS[prediction], float(probabilities[prediction]) * 100
+
+
+def needs_heatmap(label, proba, threshold=None):
+    """
+    Decides whether a prediction deserves its Grad-CAM in "auto" mode.
+
+    Args:
+        label (str): Predicted class.
+        proba (float): Its probability, in percent.
+        threshold (float, optional): Defaults to CONFIDENCE_THRESHOLD.
+
+    Returns:
+        bool: True if the class is abnormal or the confidence is low.
+    """
+    if threshold is None:
+        threshold = CONFIDENCE_THRESHOLD
+    return label != NORMAL_LABEL or proba < threshold
+
+
+class LazyHeatmap:
+    """
+    Grad-CAM map computed on first access.
+
+    Holds a copy of the preprocessed image (1 MB) until `get` is called;
+    then runs the Grad-CAM engine once, keeps the map and drops the image.
+    Safe to share between threads. Pickling keeps the image or the map, not
+    the `on_compute` callback, and `get` runs in the process that calls it.
+
+    Args:
+        tensor (numpy.ndarray): Preprocessed image, (1, 512, 512, 1) float32.
+        on_compute (callable, optional): Called with the map once computed,
+            e.g. to store it in the result cache.
+        class_index (int, optional): Class of the map, in LABELS order;
+            defaults to the one the Keras model predicts.
+    """
+
+    def __init__(self, tensor, on_compute=None, class_index=None):
+        self._tensor = tensor
+        self._value = None
+        self._lock = threading.Lock()
+        self.on_compute = on_compute
+        self.class_index = class_index
+
+    @property
+    def computed(self):
+        return self._value is not None
+
+    def get(self):
+        """Returns the raw Grad-CAM map, computing it the first time."""
+        with self._lock:
+            if self._value is None:
+                from grad_cam import compute_heatmaps
+
+                classes = None if self.class_index is None else [self.class_index]
+                _, cams = compute_heatmaps(self._tensor, classes)
+                self._value, self._tensor = cams[0], None
+                metrics.inc("heatmaps_lazy_total")
+                if self.on_compute is not None:
+                    self.on_compute(self._value)
+            return self._value
 
+    def __getstate__(self):
+        return {"tensor": self._tensor, "value": self._value,
+                "class_index": self.class_index}
 
+    def __setstate__(self, state):
+        self.__init__(state["tensor"], class_index=state["class_index"])
+        self._value = state["value"]
 
 
-def predict(array):
+def resolve_heatmap(heatmap):
+    """Returns the map of a `LazyHeatmap` (computing it) or `heatmap` as is."""
+    if isinstance(heatmap, LazyHeatmap):
+        return heatmap.get()
+    return heatmap
+
+
+def heatmap_mode(heatmaps):
+    """
+    Normalizes a heatmap option: True is "always", False or None "never".
+
+    Raises:
+        ValueError: If it is not a bool, None or one of HEATMAP_MODES.
+    """
+    if heatmaps is True:
+        return "always"
+    if heatmaps is False or heatmaps is None:
+        return "never"
+    if heatmaps not in HEATMAP_MODES:
+        raise ValueError(f"El modo de Grad-CAM debe ser uno de {HEATMAP_MODES}.")
+    return heatmaps
+
+
+@metrics.timed("predict")
+def predict(array, heatmap="always"):
     """
     Predicts the class of a given image array and generates a Grad-CAM heatmap.
 
+    The image is preprocessed once and goes through a single tape-recorded
+    forward pass (the compiled Grad-CAM engine) that yields the class
+    probabilities together with the Grad-CAM heatmap. The heatmap is the raw
+    low-resolution map; `heatmap.render_overlay` draws it over the image at
+    the size it will be shown.
+
+    The other modes take the fast path, a plain forward pass through the
+    backend selected in load_model, and pay for Grad-CAM only when needed:
+    "never" returns no heatmap, "lazy" returns a `LazyHeatmap` computed on
+    first access, and "auto" computes the map right away when
+    `needs_heatmap` says so and returns a `LazyHeatmap` otherwise.
+
     Args:
         array (numpy.ndarray): The input image array to be predicted.
+        heatmap (str or bool): One of HEATMAP_MODES, see `heatmap_mode`.
 
     Returns:
         tuple: A tuple containing:
             - label (str): The predicted class label ('bacteriana', 'normal', 'viral').
             - proba (float): The probability of the predicted class in percentage.
-            - heatmap (numpy.ndarray): The Grad-CAM heatmap superimposed on the input image.
+            - heatmap (numpy.ndarray, LazyHeatmap or None): The raw Grad-CAM
+              map (h, w), float32 between 0 and 1, at the resolution of
+              `conv10_thisone`.
     """
+    # grad_cam importa TensorFlow: se carga en el primer uso, no al importar
+    from grad_cam import compute_heatmaps
+
     #   1. call function to pre-process image: it returns image in batch format
     batch_array_img = preprocess(array)
-    #   2. call function to load model and predict: it returns predicted class
-    #  and probability
-    model = get_model()
-    # model_cnn = tf.keras.models.load_model('conv_MLP_84.h5')
-    prediction = np.argmax(model.predict(batch_array_img))
-    proba = np.max(model.predict(batch_array_img)) * 100
-    label = ""
-    if prediction == 0:
-        label = "bacteriana"
-    if prediction == 1:
-        label = "normal"
-    if prediction == 2:
-        label = "viral"
-    #   3. call function to generate Grad-CAM: it returns an image with a 
-    # superimposed heatmap
-    heatmap = grad_cam(array)
-    return (label, proba, heatmap)
+    mode = heatmap_mode(heatmap)
+    if mode != "always":
+        return predict_preprocessed(batch_array_img, 1, heatmaps=mode)[0]
+    #   2. one forward pass: class probabilities and the Grad-CAM of the
+    #  predicted class
+    predictions, heatmaps = compute_heatmaps(batch_array_img)
+    label, proba = _label_and_proba(predictions[0])
+    metrics.inc("images_predicted_total")
+    return (label, proba, heatmaps[0])
+
+
+def predict_preprocessed(batch, batch_size=BATCH_SIZE, heatmaps=True,
+                         lazy_maps=True):
+    """
+    Runs the model over an already preprocessed batch, in fixed-size chunks.
+
+    Args:
+        batch (numpy.ndarray): Preprocessed images with shape (N, 512, 512, 1).
+        batch_size (int): Number of images per model call.
+        heatmaps (bool or str): Grad-CAM mode, see `predict`. With False
+            ("never"), Grad-CAM is skipped and heatmap is None. Except in
+            "always" mode, the probabilities come from the backend selected
+            in load_model (Keras, SavedModel or TFLite), and in "auto" mode
+            the maps of the images that need one are computed together,
+            with one more model call per chunk. Those maps, and the lazy
+            ones, are computed for the class the backend predicted.
+        lazy_maps (bool): In "lazy" and "auto" modes, False leaves None
+            instead of a `LazyHeatmap` (and its 1 MB copy of the image),
+            for callers that discard the maps they did not get.
+
+    Returns:
+        list of tuple: One (label, proba, heatmap) per image, in input order;
+        heatmap is the raw Grad-CAM map, a `LazyHeatmap` or None, see
+        `predict`.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size debe ser mayor que cero.")
+    mode = heatmap_mode(heatmaps)
+    from grad_cam import compute_heatmaps
+
+    results = []
+    for start in range(0, len(batch), batch_size):
+        chunk = batch[start:start + batch_size]
+        if mode == "always":
+            probabilities, cams = compute_heatmaps(chunk)
+        else:
+            with metrics.span("forward"):
+                probabilities = get_predictor()(chunk)
+            cams = [None] * len(chunk)
+        metrics.inc("images_predicted_total", len(chunk))
+        labels = [_label_and_proba(row) for row in probabilities]
+        # Los mapas explican la clase que predijo el motor, no la de Keras
+        classes = [LABELS.index(label) for label, _ in labels]
+        if mode == "auto":
+            wanted = [i for i, (label, proba) in enumerate(labels)
+                      if needs_heatmap(label, proba)]
+            if wanted:
+                _, computed = compute_heatmaps(
+                    chunk[wanted], [classes[i] for i in wanted]
+                )
+                for i, cam in zip(wanted, computed):
+                    cams[i] = cam
+        if mode in ("lazy", "auto") and lazy_maps:
+            # Copia: el lote puede ser un búfer que se reutiliza
+            cams = [cam if cam is not None
+                    else LazyHeatmap(chunk[i:i + 1].copy(), class_index=classes[i])
+                    for i, cam in enumerate(cams)]
+        for (label, proba), cam in zip(labels, cams):
+            results.append((label, proba, cam))
+    return results
+
+
+def predict_batch(arrays, batch_size=BATCH_SIZE, heatmaps=True, lazy_maps=True):
+    """
+    Predicts the class of many images in one call.
+
+    All images are preprocessed into one contiguous float32 tensor with shape
+    (N, 512, 512, 1) that goes through the model in chunks of `batch_size`.
+    Grad-CAM heatmaps of a chunk come from the same forward pass.
+
+    Args:
+        arrays (list of numpy.ndarray): The input image arrays.
+        batch_size (int): Number of images per model call.
+        heatmaps (bool or str): Grad-CAM mode, see `predict_preprocessed`.
+        lazy_maps (bool): See `predict_preprocessed`.
+
+    Returns:
+        list of tuple: One (label, proba, heatmap) per image, in input order;
+        heatmap is the raw Grad-CAM map, a `LazyHeatmap` or None, see
+        `predict`.
+    """
+    if len(arrays) == 0:
+        return []
+    buffer = buffer_pool.acquire(len(arrays))
+    try:
+        batch = preprocess_batch(arrays, out=buffer)
+        return predict_preprocessed(
+            batch, batch_size=batch_size, heatmaps=heatmaps, lazy_maps=lazy_maps
+        )
+    finally:
+        buffer_pool.release(buffer)
+
+
+def predict_study(frames, batch_size=BATCH_SIZE, aggregate="max"):
+    """
+    Classifies a study made of many frames (multi-frame DICOM or a series).
+
+    Frames are consumed lazily from `frames` and preprocessed into one
+    reused (batch_size, 512, 512, 1) buffer; each full buffer goes through
+    the backend selected in load_model, without Grad-CAM. Only the running
+    sum and maximum of the class probabilities are kept, so memory depends
+    on `batch_size`, not on the number of frames.
+
+    Args:
+        frames (iterable of numpy.ndarray): Frames of the study, e.g. from
+            `read_img.iter_dicom_frames`.
+        batch_size (int): Number of frames per model call.
+        aggregate (str): "max" takes, for each class, its highest
+            probability over the frames (a single suspicious frame is
+            enough); "mean" averages them.
+
+    Returns:
+        dict: `label` and `proba` (percentage) of the study, `frames`
+        (number of frames), `max` and `mean` (per-class probabilities, 0-1,
+        in the order of LABELS) and `peak_frame` (index of the frame with
+        the highest probability of `label`).
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size debe ser mayor que cero.")
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"aggregate debe ser uno de {AGGREGATES}.")
+
+    buffer = buffer_pool.acquire(batch_size)
+    total = np.zeros(len(LABELS), dtype=np.float64)
+    peak = np.zeros(len(LABELS), dtype=np.float64)
+    peak_frame = np.zeros(len(LABELS), dtype=np.int64)
+    count = 0
+
+    def run(n):
+        nonlocal count
+        with metrics.span("forward"):
+            probabilities = np.asarray(get_predictor()(buffer[:n]))
+        metrics.inc("images_predicted_total", n)
+        total[:] += probabilities.sum(axis=0)
+        best = probabilities.argmax(axis=0)
+        better = probabilities[best, range(len(LABELS))] > peak
+        peak[better] = probabilities[best, range(len(LABELS))][better]
+        peak_frame[better] = count + best[better]
+        count += n
 
+    try:
+        n = 0
+        for frame in frames:
+            preprocess_into(frame, buffer[n])
+            n += 1
+            if n == batch_size:
+                run(n)
+                n = 0
+        if n:
+            run(n)
+    finally:
+        buffer_pool.release(buffer)
 
+    if count == 0:
+        raise ValueError("El estudio no tiene cuadros.")
+    mean = total / count
+    scores = peak if aggregate == "max" else mean
+    label, proba = _label_and_proba(scores)
+    return {
+        "label": label,
+        "proba": proba,
+        "frames": count,
+        "max": peak.tolist(),
+        "mean": mean.tolist(),
+        "peak_frame": int(peak_frame[LABELS.index(label)]),
+    }
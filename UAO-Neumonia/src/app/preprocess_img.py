@@ -1,24 +1,180 @@
 # Módulo encragado de recibir el arreglo de imagen (en BGR) y transformarlo
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
-def preprocess(array):
+import metrics
+
+# Parámetros del preprocesamiento que espera el modelo
+TARGET_SIZE = (512, 512)
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (4, 4)
+
+# Objetos por hilo: un CLAHE y los buffers intermedios se reutilizan
+_local = threading.local()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _thread_state():
+    state = getattr(_local, "state", None)
+    if state is None:
+        state = {
+            "clahe": cv2.createCLAHE(
+                clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID
+            ),
+            "gray": np.empty(TARGET_SIZE[::-1], dtype=np.uint8),
+            "equalized": np.empty(TARGET_SIZE[::-1], dtype=np.uint8),
+            "resized": {},
+        }
+        _local.state = state
+    return state
+
+
+def _resized(array, state):
+    # Buffer de destino del redimensionado según el número de canales
+    channels = 1 if array.ndim == 2 else array.shape[2]
+    key = (channels, array.dtype.str)
+    buf = state["resized"].get(key)
+    if buf is None:
+        shape = TARGET_SIZE[::-1] if channels == 1 else TARGET_SIZE[::-1] + (channels,)
+        buf = np.empty(shape, dtype=array.dtype)
+        state["resized"][key] = buf
+    return cv2.resize(array, TARGET_SIZE, dst=buf)
+
+
+@metrics.timed("preprocess")
+def preprocess_into(array, out):
     """
-    Preprocesses an input image array by resizing, converting to grayscale, 
-    applying CLAHE (Contrast Limited Adaptive Histogram Equalization), 
-    normalizing, and expanding dimensions.
+    Preprocesses one image and writes the result into `out`.
+
+    Accepts grayscale (H, W), BGR (H, W, 3) and BGRA (H, W, 4) images. Uses the
+    calling thread's CLAHE instance and scratch buffers, so it allocates no
+    new image arrays.
 
     Parameters:
     array (numpy.ndarray): Input image array.
+    out (numpy.ndarray): Destination with shape (512, 512, 1) or (512, 512)
+        and dtype float32.
+
+    Returns:
+    numpy.ndarray: `out`.
+    """
+    state = _thread_state()
+    array = _resized(array, state)
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[:, :, 0]
+    if array.ndim == 3:
+        code = cv2.COLOR_BGRA2GRAY if array.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        array = cv2.cvtColor(array, code, dst=state["gray"])
+    if array.dtype != np.uint8:
+        # CLAHE necesita 8 bits: reescalar imágenes de 16 bits o flotantes
+        array = cv2.normalize(array, state["gray"], 0, 255, cv2.NORM_MINMAX,
+                              dtype=cv2.CV_8U)
+    array = state["clahe"].apply(array, state["equalized"])
+    np.divide(array, np.float32(255), out=out[:, :, 0] if out.ndim == 3 else out)
+    return out
+
+
+def preprocess(array, out=None):
+    """
+    Preprocesses an input image array by resizing, converting to grayscale,
+    applying CLAHE (Contrast Limited Adaptive Histogram Equalization),
+    normalizing, and expanding dimensions.
+
+    Parameters:
+    array (numpy.ndarray): Input image array (grayscale, BGR or BGRA).
+    out (numpy.ndarray, optional): float32 buffer with shape (1, 512, 512, 1)
+        to write into; a new one is created if omitted.
+
+    Returns:
+    numpy.ndarray: Preprocessed float32 image array with shape (1, 512, 512, 1).
+    """
+    if out is None:
+        out = np.empty((1,) + TARGET_SIZE[::-1] + (1,), dtype=np.float32)
+    preprocess_into(array, out[0])
+    return out
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=os.cpu_count() or 1,
+                    thread_name_prefix="preprocess",
+                )
+    return _executor
+
+
+def preprocess_batch(arrays, out=None, parallel=True):
+    """
+    Preprocesses many images into one contiguous float32 batch.
+
+    The images are processed in parallel by a shared thread pool (OpenCV
+    releases the GIL), each thread with its own CLAHE instance.
+
+    Parameters:
+    arrays (list of numpy.ndarray): Input images (grayscale, BGR or BGRA).
+    out (numpy.ndarray, optional): float32 buffer with shape (N', 512, 512, 1),
+        N' >= N, e.g. from a BufferPool; a new one is created if omitted.
+    parallel (bool): Use the thread pool; False processes in the caller.
 
     Returns:
-    numpy.ndarray: Preprocessed image array with shape (1, 512, 512, 1).
-    """
-    array = cv2.resize(array, (512, 512))
-    array = cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4))
-    array = clahe.apply(array)
-    array = array / 255
-    array = np.expand_dims(array, axis=-1)
-    array = np.expand_dims(array, axis=0)
-    return array
+    numpy.ndarray: The first N rows of `out`, shape (N, 512, 512, 1).
+    """
+    n = len(arrays)
+    if out is None:
+        out = np.empty((n,) + TARGET_SIZE[::-1] + (1,), dtype=np.float32)
+    elif out.shape[0] < n:
+        raise ValueError("El buffer de salida es más pequeño que el lote.")
+    batch = out[:n]
+    if parallel and n > 1 and (os.cpu_count() or 1) > 1:
+        list(_get_executor().map(preprocess_into, arrays, batch))
+    else:
+        for array, row in zip(arrays, batch):
+            preprocess_into(array, row)
+    return batch
+
+
+class BufferPool:
+    """
+    Pool of reusable float32 (N, 512, 512, 1) batch buffers.
+
+    `acquire(n)` returns a buffer with at least `n` rows; hand it back with
+    `release(buffer)` once the batch is no longer needed. Buffers larger than
+    `max_rows` are not kept, so one huge batch doesn't pin its memory.
+    """
+
+    def __init__(self, max_buffers=4, max_rows=64):
+        self.max_buffers = max_buffers
+        self.max_rows = max_rows
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, n):
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if buf.shape[0] >= n:
+                    return self._free.pop(i)
+        return np.empty((n,) + TARGET_SIZE[::-1] + (1,), dtype=np.float32)
+
+    def release(self, buffer):
+        with self._lock:
+            if (len(self._free) < self.max_buffers
+                    and buffer.shape[0] <= self.max_rows):
+                self._free.append(buffer)
+
+    def clear(self):
+        """Drops the idle buffers, returning their memory."""
+        with self._lock:
+            self._free.clear()
+
+
+# Pool compartido por las rutas de predicción por lotes
+buffer_pool = BufferPool()
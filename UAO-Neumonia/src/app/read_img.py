@@ -3,14 +3,141 @@ import cv2
 import numpy as np
 import pydicom as dicom
 from PIL import Image
+from pydicom.misc import is_dicom
 import os
 
-def read_dicom_file(path):
+import metrics
+
+# Resolución de entrada del modelo y de las vistas previas de la interfaz
+MODEL_SIZE = (512, 512)
+DISPLAY_SIZE = (250, 250)
+
+# Tipos que cv2.resize acepta directamente, sin convertir a float
+_RESIZABLE_DTYPES = (np.uint8, np.uint16, np.int16, np.float32, np.float64)
+
+try:
+    # pydicom >= 3: decodifica un cuadro a la vez, leyendo solo sus bytes
+    from pydicom.pixels import iter_pixels
+except ImportError:
+    iter_pixels = None
+
+
+def _to_uint8(img_array, size):
+    """
+    Downsamples a raw pixel array to `size` and rescales it to 0-255 uint8.
+
+    The resize runs on the native dtype (INTER_AREA) before any conversion,
+    and the min-max normalization is a single `convertScaleAbs` pass, so no
+    full-resolution float copy is ever created.
+    """
+    lo, hi = float(img_array.min()), float(img_array.max())
+    if img_array.dtype.type not in _RESIZABLE_DTYPES:
+        img_array = img_array.astype(np.float32)
+    if (img_array.shape[1], img_array.shape[0]) != tuple(size):
+        img_array = cv2.resize(img_array, tuple(size), interpolation=cv2.INTER_AREA)
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    return cv2.convertScaleAbs(img_array, alpha=scale, beta=-lo * scale)
+
+
+def _grayscale(frame):
+    # Cuadros a color (RGB, ya convertidos por pydicom) pasan a gris
+    if frame.ndim == 3:
+        if frame.dtype.type not in _RESIZABLE_DTYPES:
+            frame = frame.astype(np.float32)
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    return frame
+
+
+def count_frames(path):
+    """
+    Returns the number of frames of a DICOM file, reading only its header.
+
+    Args:
+        path (str): The DICOM file.
+
+    Returns:
+        int: NumberOfFrames, or 1 for single-frame objects.
+    """
+    header = dicom.dcmread(path, stop_before_pixels=True,
+                           specific_tags=["NumberOfFrames"])
+    return int(header.get("NumberOfFrames", 1) or 1)
+
+
+def _frames(source, indices=None):
+    """Yields the raw frames of a DICOM file or dataset, lazily if possible."""
+    if iter_pixels is not None:
+        yield from iter_pixels(source, indices=indices)
+        return
+    # pydicom < 3: lectura diferida del archivo, pero pixel_array decodifica todo
+    ds = source if isinstance(source, dicom.Dataset) else dicom.dcmread(
+        source, defer_size="1 KB"
+    )
+    pixels = ds.pixel_array
+    if int(ds.get("NumberOfFrames", 1) or 1) == 1:
+        pixels = pixels[np.newaxis]
+    for i in (range(len(pixels)) if indices is None else indices):
+        yield pixels[i]
+
+
+def iter_dicom_frames(path, target_size=MODEL_SIZE):
+    """
+    Yields the frames of a DICOM file one at a time, ready for the model.
+
+    Single-frame and multi-frame objects are read the same way. Each frame
+    is decoded on its own (pydicom's `iter_pixels` reads only the bytes of
+    that frame), downsampled and normalized like `read_dicom_file` with
+    `target_size`, so memory does not grow with the number of frames.
+
+    Args:
+        path (str): The DICOM file.
+        target_size (tuple): (width, height) of each frame.
+
+    Yields:
+        numpy.ndarray: uint8 RGB frame with shape (height, width, 3).
+    """
+    for frame in _frames(path):
+        metrics.inc("images_decoded_total", format="dicom")
+        metrics.inc("bytes_decoded_total", frame.nbytes, format="dicom")
+        frame = _to_uint8(_grayscale(frame), target_size)
+        yield cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+
+
+def iter_series_frames(paths, target_size=MODEL_SIZE):
+    """
+    Yields the frames of a series of DICOM files, file after file.
+
+    Args:
+        paths (list of str): The files of the series, in order.
+        target_size (tuple): (width, height) of each frame.
+
+    Yields:
+        tuple: (path, frame index within the file, frame), see
+        `iter_dicom_frames`.
+    """
+    for path in paths:
+        for index, frame in enumerate(iter_dicom_frames(path, target_size)):
+            yield path, index, frame
+
+
+@metrics.timed("read_dicom")
+def read_dicom_file(path, target_size=None, display_size=None):
     """
     Reads a DICOM file from the specified path and returns the image in RGB format and the original image array.
 
+    By default both outputs keep the full resolution of the file. With
+    `target_size` the pixel data is downsampled first, straight to the size
+    the model needs, and normalized without float64 temporaries; the
+    displayable image is then produced at `display_size` (or `target_size`).
+
     Args:
         path (str): The file path to the DICOM file.
+        target_size (tuple, optional): (width, height) of the returned RGB
+            array, e.g. MODEL_SIZE. None keeps the full resolution.
+        display_size (tuple, optional): (width, height) of the returned PIL
+            image, e.g. DISPLAY_SIZE. Only used together with `target_size`.
+
+    Multi-frame objects return their first frame; use `iter_dicom_frames`
+    to go through all of them.
 
     Returns:
         tuple: A tuple containing:
@@ -26,7 +153,24 @@ def read_dicom_file(path):
             raise FileNotFoundError(f"El archivo {path} no existe.")
 
         img = dicom.dcmread(path)
-        img_array = img.pixel_array
+        if int(img.get("NumberOfFrames", 1) or 1) > 1:
+            img_array = _grayscale(next(_frames(img, indices=[0])))
+        else:
+            img_array = _grayscale(img.pixel_array)
+        metrics.inc("images_decoded_total", format="dicom")
+        metrics.inc("bytes_decoded_total", img_array.nbytes, format="dicom")
+
+        if target_size is not None:
+            # Decodificación liviana: reducir primero, normalizar en uint8
+            img2 = _to_uint8(img_array, target_size)
+            del img, img_array
+            if display_size is None or tuple(display_size) == tuple(target_size):
+                img2show = Image.fromarray(img2)
+            else:
+                img2show = Image.fromarray(
+                    cv2.resize(img2, tuple(display_size), interpolation=cv2.INTER_AREA)
+                )
+            return cv2.cvtColor(img2, cv2.COLOR_GRAY2RGB), img2show
 
         # Normalización a 0-255 solo si es necesario
         img2 = img_array.astype(float)
@@ -40,17 +184,44 @@ def read_dicom_file(path):
         return img_RGB, Image.fromarray(img_array)
 
     except Exception as e:
+        metrics.inc("decode_errors_total", format="dicom")
         print(f"Error al leer el archivo DICOM: {e}")
         return None, None
 
 
-def read_jpg_file(path):
+def _reduced_flag(path, target_size):
+    """
+    Picks the largest decoder-side reduction (1/2, 1/4, 1/8) that still
+    keeps the image at least as large as `target_size`.
+    """
+    with Image.open(path) as header:
+        width, height = header.size
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                         (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                         (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if width // factor >= target_size[0] and height // factor >= target_size[1]:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+@metrics.timed("read_jpg")
+def read_jpg_file(path, target_size=None, display_size=None):
     """
     Reads a JPG image file from the specified path, converts it to grayscale if necessary,
     normalizes the pixel values, and returns the processed image along with the original image.
 
+    With `target_size` the image is decoded straight to grayscale at a
+    reduced scale (JPEG decoders can skip 1/2, 1/4 or 1/8 of the work),
+    downsampled to `target_size` and normalized; the second output is then a
+    grayscale image at `display_size` (or `target_size`) instead of the
+    full-resolution original. No full-resolution copy is kept.
+
     Args:
         path (str): The file path to the JPG image.
+        target_size (tuple, optional): (width, height) of the returned
+            array, e.g. MODEL_SIZE. None keeps the full resolution.
+        display_size (tuple, optional): (width, height) of the returned PIL
+            image, e.g. DISPLAY_SIZE. Only used together with `target_size`.
 
     Returns:
         tuple: A tuple containing:
@@ -66,12 +237,28 @@ def read_jpg_file(path):
         if not os.path.exists(path):
             raise FileNotFoundError(f"El archivo {path} no existe.")
 
-        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if target_size is not None:
+            img = cv2.imread(path, _reduced_flag(path, target_size))
+        else:
+            img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
         if img is None:
             raise ValueError(
                 "No se pudo leer la imagen. Verifica que el archivo sea válido."
                 )
 
+        metrics.inc("images_decoded_total", format="image")
+        metrics.inc("bytes_decoded_total", img.nbytes, format="image")
+
+        if target_size is not None:
+            # Decodificación liviana: ya viene en gris y reducida
+            img2 = _to_uint8(img, target_size)
+            del img
+            if display_size is None or tuple(display_size) == tuple(target_size):
+                return img2, Image.fromarray(img2)
+            return img2, Image.fromarray(
+                cv2.resize(img2, tuple(display_size), interpolation=cv2.INTER_AREA)
+            )
+
         # Convertir a escala de grises si es necesario
         if len(img.shape) == 2:  # Imagen en escala de grises
             img2 = img
@@ -87,30 +274,38 @@ def read_jpg_file(path):
         return img2, Image.fromarray(img)
 
     except Exception as e:
+        metrics.inc("decode_errors_total", format="image")
         print(f"Error al leer el archivo de imagen: {e}")
         return None, None
 
 
-def read_image_file(path):
+def read_image_file(path, target_size=None, display_size=None):
     """
     Reads an image file from the given path and returns its content based on the file extension.
     Parameters:
     path (str): The file path to the image.
+    target_size (tuple, optional): Downsampled decode size (see `read_dicom_file` and `read_jpg_file`).
+    display_size (tuple, optional): Size of the displayable image (see `read_dicom_file` and `read_jpg_file`).
     Returns:
     tuple: A tuple containing the image data and metadata if the file is successfully read.
            Returns (None, None) if the file format is not supported.
     Supported formats:
     - DICOM: 'dcm', 'dicom'
     - Image: 'jpg', 'jpeg', 'png', 'bmp', 'tiff'
+    - Files without a known extension that carry the DICOM preamble (as in
+      archives indexed by `dicom_index`)
     Note:
     This function relies on `read_dicom_file` and `read_jpg_file` functions to read the respective file formats.
     """
     extension = path.lower().split('.')[-1]
     
     if extension in ['dcm', 'dicom']:
-        return read_dicom_file(path)
+        return read_dicom_file(path, target_size, display_size)
     elif extension in ['jpg', 'jpeg', 'png', 'bmp', 'tiff']:
-        return read_jpg_file(path)
+        return read_jpg_file(path, target_size, display_size)
+    elif os.path.isfile(path) and is_dicom(path):
+        # Archivos DICOM sin extensión, comunes en los archivos PACS
+        return read_dicom_file(path, target_size, display_size)
     else:
         print(f"Formato no soportado: {extension}")
         return None, None
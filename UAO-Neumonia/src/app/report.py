@@ -0,0 +1,336 @@
+# Módulo encargado de generar los reportes PDF sin capturar la pantalla
+"""
+PDF reports rendered directly from the data, without a display.
+
+A report is one A4 page with the original image, the Grad-CAM overlay, the
+patient ID, the predicted class, the probability, the date and the model
+version. The page is drawn with PIL and embedded as a JPEG by `img2pdf`,
+without re-encoding. No window, screenshot or X display is involved, so the
+reports can be produced in containers and in batch.
+
+`render_reports` renders a whole set of results in a process pool. The
+command line builds that set from a `batch_scan.py` results file. The
+workers only decode images and draw; they never import TensorFlow.
+
+Usage (from UAO-Neumonia/):
+    python src/app/report.py resultados.csv -o reportes/ \\
+        --heatmaps heatmaps/ --root /ruta/exportacion --workers 4
+
+Functions:
+    render_page: Lays out one report page as a PIL image.
+    save_pdf: Writes a page as a one-page PDF.
+    write_report: Renders and saves the report of one prediction.
+    render_reports: Renders many reports in parallel.
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import img2pdf
+from PIL import Image, ImageDraw, ImageFont
+
+from heatmap import render_overlay
+from read_img import read_image_file
+
+# Página A4 a 150 ppp
+PAGE_DPI = 150
+PAGE_SIZE = (1240, 1754)
+# Tamaño de cada imagen en la página
+IMAGE_SIZE = (540, 540)
+MARGIN = 60
+JPEG_QUALITY = 90
+TITLE = "Reporte de detección rápida de neumonía"
+
+
+def _font(size):
+    # Pillow >= 10.1 escala la fuente por defecto; las versiones antiguas no
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _to_rgb(array, size):
+    # Misma convención que heatmap.render_overlay: gris o BGR
+    if (array.shape[1], array.shape[0]) != tuple(size):
+        array = cv2.resize(array, tuple(size), interpolation=cv2.INTER_AREA)
+    code = cv2.COLOR_GRAY2RGB if array.ndim == 2 else cv2.COLOR_BGR2RGB
+    return cv2.cvtColor(array, code)
+
+
+def render_page(original, overlay, patient_id, label, proba, date=None,
+                model_version=None):
+    """
+    Lays out a report page.
+
+    Args:
+        original (numpy.ndarray): RGB image of the study, IMAGE_SIZE.
+        overlay (numpy.ndarray or None): RGB Grad-CAM overlay, IMAGE_SIZE.
+        patient_id (str): Patient ID.
+        label (str): Predicted class.
+        proba (float): Probability of the class, in percent.
+        date (str, optional): Date shown on the report. Defaults to now.
+        model_version (str, optional): Model that produced the result.
+
+    Returns:
+        PIL.Image.Image: RGB page of PAGE_SIZE pixels.
+    """
+    page = Image.new("RGB", PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(page)
+    title, text, small = _font(40), _font(30), _font(22)
+
+    y = MARGIN
+    draw.text((MARGIN, y), TITLE, fill="black", font=title)
+    y += 70
+    draw.line((MARGIN, y, PAGE_SIZE[0] - MARGIN, y), fill="black", width=2)
+    y += 30
+    if date is None:
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    for name, value in (
+        ("Cédula del paciente", patient_id or "-"),
+        ("Resultado", label),
+        ("Probabilidad", "{:.2f}%".format(proba)),
+        ("Fecha", date),
+    ):
+        draw.text((MARGIN, y), f"{name}:", fill="black", font=text)
+        draw.text((MARGIN + 360, y), str(value), fill="black", font=text)
+        y += 50
+
+    y += 30
+    gap = PAGE_SIZE[0] - 2 * MARGIN - 2 * IMAGE_SIZE[0]
+    columns = (MARGIN, MARGIN + IMAGE_SIZE[0] + gap)
+    for x, caption in zip(columns, ("Imagen radiográfica", "Imagen con Heatmap")):
+        draw.text((x, y), caption, fill="black", font=text)
+    y += 50
+    page.paste(Image.fromarray(original), (columns[0], y))
+    if overlay is not None:
+        page.paste(Image.fromarray(overlay), (columns[1], y))
+    else:
+        draw.rectangle((columns[1], y, columns[1] + IMAGE_SIZE[0],
+                        y + IMAGE_SIZE[1]), outline="gray", width=2)
+        draw.text((columns[1] + 20, y + 20), "Sin mapa de calor",
+                  fill="gray", font=text)
+
+    footer = "Resultado de apoyo al diagnóstico; no reemplaza el criterio médico."
+    if model_version:
+        footer = f"Modelo: {model_version}. " + footer
+    draw.text((MARGIN, PAGE_SIZE[1] - MARGIN - 30), footer, fill="gray",
+              font=small)
+    return page
+
+
+def save_pdf(page, path, quality=JPEG_QUALITY):
+    """
+    Writes a page as a one-page PDF.
+
+    The page is compressed once as JPEG and `img2pdf` embeds those bytes
+    as they are, at PAGE_DPI.
+
+    Args:
+        page (PIL.Image.Image): The page from `render_page`.
+        path (str): Destination `.pdf` file.
+        quality (int): JPEG quality.
+
+    Returns:
+        str: `path`.
+    """
+    buffer = io.BytesIO()
+    page.save(buffer, "JPEG", quality=quality, dpi=(PAGE_DPI, PAGE_DPI))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(img2pdf.convert(buffer.getvalue()))
+    os.replace(tmp, path)
+    return path
+
+
+def write_report(path, array, heatmap, patient_id, label, proba,
+                 model_version=None, date=None):
+    """
+    Renders and saves the report of one prediction.
+
+    Args:
+        path (str): Destination `.pdf` file.
+        array (numpy.ndarray): The image given to the prediction.
+        heatmap (numpy.ndarray or None): Its raw Grad-CAM map.
+        patient_id (str): Patient ID.
+        label (str): Predicted class.
+        proba (float): Probability of the class, in percent.
+        model_version (str, optional): Model that produced the result.
+        date (str, optional): Date shown on the report. Defaults to now.
+
+    Returns:
+        str: `path`.
+    """
+    original = _to_rgb(array, IMAGE_SIZE)
+    overlay = None
+    if heatmap is not None:
+        overlay = render_overlay(array, heatmap, IMAGE_SIZE)
+    page = render_page(original, overlay, patient_id, label, proba, date,
+                       model_version)
+    return save_pdf(page, path)
+
+
+def _render_job(job):
+    """
+    Renders one report. Runs inside the worker processes.
+
+    `job` is a dict with `output`, `path` (the study), `patient_id`,
+    `label`, `proba` and optionally `cam` (raw Grad-CAM map), `heatmap`
+    (an overlay image saved by batch_scan), `model_version` and `date`.
+
+    Returns:
+        tuple: (output, error message or None).
+    """
+    output = job["output"]
+    try:
+        array, _ = read_image_file(job["path"], target_size=IMAGE_SIZE)
+        if array is None:
+            return output, "No se pudo leer el archivo."
+        original = _to_rgb(array, IMAGE_SIZE)
+        overlay = None
+        if job.get("cam") is not None:
+            overlay = render_overlay(array, job["cam"], IMAGE_SIZE)
+        elif job.get("heatmap") and os.path.exists(job["heatmap"]):
+            saved = cv2.imread(job["heatmap"], cv2.IMREAD_COLOR)
+            overlay = _to_rgb(saved, IMAGE_SIZE)
+        page = render_page(original, overlay, job.get("patient_id"),
+                           job["label"], float(job["proba"]), job.get("date"),
+                           job.get("model_version"))
+        save_pdf(page, output)
+        return output, None
+    except Exception as e:
+        return output, str(e)
+
+
+def render_reports(jobs, workers=None, log=None):
+    """
+    Renders many reports in parallel.
+
+    Args:
+        jobs (list of dict): One dict per report, see `_render_job`.
+        workers (int, optional): Processes; 0 renders in-process. Defaults
+            to the number of CPUs.
+        log (file, optional): Stream where failures are reported.
+
+    Returns:
+        dict: Counters with the `written` and `failed` reports.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stats = {"written": 0, "failed": 0}
+    executor = None
+    if workers == 0 or len(jobs) <= 1:
+        results = map(_render_job, jobs)
+    else:
+        # spawn: igual que batch_scan, los procesos no heredan el estado del padre
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        chunksize = max(1, len(jobs) // (4 * workers))
+        results = executor.map(_render_job, jobs, chunksize=chunksize)
+    try:
+        for output, error in results:
+            if error is None:
+                stats["written"] += 1
+            else:
+                stats["failed"] += 1
+                if log is not None:
+                    print(f"{output}: {error}", file=log)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return stats
+
+
+def read_results(path):
+    """
+    Reads a `batch_scan.py` results file (CSV or JSONL), skipping the rows
+    that failed.
+
+    Returns:
+        list of dict: Rows with `path`, `label` and `proba`.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue
+        else:
+            rows = list(csv.DictReader(f))
+    return [r for r in rows if not r.get("error") and r.get("label")]
+
+
+def jobs_from_results(rows, output_dir, heatmap_dir=None, root=None):
+    """
+    Builds one report job per result row.
+
+    Args:
+        rows (list of dict): Rows from `read_results`.
+        output_dir (str): Folder for the PDFs (same layout as the studies).
+        heatmap_dir (str, optional): `--heatmaps` folder of batch_scan.
+        root (str, optional): Input folder given to batch_scan; the PDFs
+            and heatmaps are found relative to it.
+
+    Returns:
+        list of dict: Jobs for `render_reports`.
+    """
+    from batch_scan import patient_id
+
+    jobs = []
+    for row in rows:
+        path = row["path"]
+        relative = os.path.relpath(path, root) if root else os.path.basename(path)
+        stem = os.path.splitext(relative)[0]
+        job = {
+            "path": path,
+            "output": os.path.join(output_dir, stem + ".pdf"),
+            "patient_id": patient_id(path),
+            "label": row["label"],
+            "proba": float(row["proba"]),
+        }
+        if heatmap_dir:
+            job["heatmap"] = os.path.join(heatmap_dir, stem + ".png")
+        jobs.append(job)
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Genera los reportes PDF de un archivo de resultados de batch_scan."
+    )
+    parser.add_argument("results", help="Resultados de batch_scan (.csv o .jsonl)")
+    parser.add_argument("-o", "--output", default="reportes",
+                        help="Carpeta donde escribir los PDF")
+    parser.add_argument("--heatmaps", metavar="DIR", default=None,
+                        help="Carpeta --heatmaps usada en batch_scan")
+    parser.add_argument("--root", default=None,
+                        help="Carpeta de entrada usada en batch_scan")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Procesos de renderizado (0 = en el proceso principal)")
+    args = parser.parse_args(argv)
+
+    jobs = jobs_from_results(read_results(args.results), args.output,
+                             args.heatmaps, args.root)
+    start = time.perf_counter()
+    stats = render_reports(jobs, args.workers, log=sys.stderr)
+    elapsed = time.perf_counter() - start
+    rate = stats["written"] / elapsed if elapsed > 0 else 0.0
+    print(f"{stats['written']} reportes en {elapsed:.1f} s ({rate:.1f}/s), "
+          f"errores: {stats['failed']}", file=sys.stderr)
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# Módulo encargado de guardar en disco los resultados de predicción ya calculados
+"""
+Content-addressed on-disk cache for prediction results.
+
+Each entry is keyed by a SHA-256 of the decoded pixel data plus a fingerprint
+of the model file, so replacing the `.h5` automatically invalidates every
+previous entry. Entries are compressed `.npz` files holding label, probability
+and the raw Grad-CAM map. The cache has a size cap with least-recently-used eviction. It
+can be shared by several processes: writes are atomic (`os.replace`);
+the size is tracked per write and measured again on disk, under a file
+lock, near the cap or every SYNC_EVERY writes, and eviction runs under
+that lock.
+
+Classes:
+    ResultCache: The cache itself, with hit/miss counters.
+
+Functions:
+    study_hash: Hash of the decoded pixel data of a study.
+    model_fingerprint: Hash of the contents of a model file.
+"""
+import contextlib
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Versión del contenido de las entradas; cambiarla invalida las anteriores
+FORMAT_VERSION = 2
+# Escrituras entre dos mediciones del directorio en disco, que corrigen el
+# tamaño con lo escrito o desalojado por otros procesos
+SYNC_EVERY = 256
+# Fracción de max_bytes a partir de la cual cada escritura mide el disco
+SYNC_MARGIN = 0.95
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def study_hash(array):
+    """
+    Returns the SHA-256 of a decoded image (dtype, shape and pixel bytes).
+
+    Args:
+        array (numpy.ndarray): Decoded image.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha256()
+    digest.update(f"{array.dtype.str}{array.shape}".encode())
+    digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+
+def model_fingerprint(path):
+    """
+    Returns the SHA-256 of a model file, memoized by size and mtime.
+
+    Args:
+        path (str): Path to the model file.
+
+    Returns:
+        str or None: Hexadecimal digest, or None if the file does not exist.
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(key)
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint = digest.hexdigest()
+        with _fingerprints_lock:
+            _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+class ResultCache:
+    """
+    On-disk cache of `(label, proba, heatmap)` results.
+
+    Args:
+        directory (str): Folder for the entries (created if needed).
+        max_bytes (int): Size cap; the least recently used entries are
+            evicted when it is exceeded.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None
+        self._unsynced = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, array, fingerprint):
+        """Returns the cache key of a study for the given model fingerprint."""
+        return hashlib.sha256(
+            f"{study_hash(array)}:{fingerprint}:{FORMAT_VERSION}".encode()
+        ).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def get(self, array, fingerprint):
+        """
+        Looks up a study.
+
+        Args:
+            array (numpy.ndarray): Decoded image.
+            fingerprint (str): Model fingerprint, see `model_fingerprint`.
+
+        Returns:
+            tuple or None: `(label, proba, heatmap)` on a hit, None on a miss.
+        """
+        path = self._path(self.key(array, fingerprint))
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                heatmap = data["heatmap"] if data["has_heatmap"] else None
+                result = (str(data["label"]), float(data["proba"]), heatmap)
+            # LRU: la fecha de modificación marca el último uso
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            # Entrada inexistente, desalojada por otro proceso o incompleta
+            with self._lock:
+                self.misses += 1
+            metrics.inc("cache_misses_total")
+            return None
+        with self._lock:
+            self.hits += 1
+        metrics.inc("cache_hits_total")
+        return result
+
+    def put(self, array, fingerprint, result):
+        """
+        Stores a `(label, proba, heatmap)` result atomically.
+
+        Args:
+            array (numpy.ndarray): Decoded image.
+            fingerprint (str): Model fingerprint, see `model_fingerprint`.
+            result (tuple): `(label, proba, heatmap)`; heatmap may be None.
+        """
+        label, proba, heatmap = result
+        path = self._path(self.key(array, fingerprint))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Primera medición antes de escribir, para no contar la entrada dos veces
+        self._current_size()
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    label=np.array(label),
+                    proba=np.array(proba, dtype=np.float64),
+                    has_heatmap=np.array(heatmap is not None),
+                    heatmap=heatmap if heatmap is not None else np.zeros(0),
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        added = os.path.getsize(path) - replaced
+        with self._lock:
+            self.writes += 1
+            self._size += added
+            self._unsynced += 1
+            sync = (self._unsynced >= SYNC_EVERY
+                    or self._size > self.max_bytes * SYNC_MARGIN)
+        if sync:
+            self._enforce_cap()
+
+    def _entries(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def _current_size(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            return self._size
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Bloqueo entre procesos del directorio (sin efecto si no hay fcntl)
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict_entries(self, entries, target_bytes):
+        # Borra las entradas más antiguas hasta bajar de target_bytes; se
+        # llama con el bloqueo tomado y devuelve el tamaño resultante
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._size = total
+        return total
+
+    def _enforce_cap(self):
+        # El tamaño se vuelve a medir en disco bajo el bloqueo, con las
+        # escrituras de otros procesos; se llama cerca del límite o cada
+        # SYNC_EVERY escrituras, no en cada una
+        with self._locked():
+            with self._lock:
+                self._unsynced = 0
+            entries = self._entries()
+            if sum(size for _, size, _ in entries) > self.max_bytes:
+                self._evict_entries(entries, int(self.max_bytes * 0.9))
+            else:
+                with self._lock:
+                    self._size = sum(size for _, size, _ in entries)
+
+    def evict(self, target_bytes=None):
+        """
+        Deletes least recently used entries until the cache fits.
+
+        Args:
+            target_bytes (int, optional): Size to shrink to. Defaults to 90%
+                of `max_bytes`, so eviction doesn't run on every write.
+        """
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        with self._locked():
+            self._evict_entries(self._entries(), target_bytes)
+
+    def clear(self):
+        """Deletes every entry."""
+        self.evict(target_bytes=0)
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: hits, misses, writes, evictions, size in bytes and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+        stats["bytes"] = self._current_size()
+        return stats
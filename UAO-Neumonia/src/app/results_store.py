@@ -0,0 +1,375 @@
+# Módulo encargado de guardar el historial de resultados en una base SQLite indexada
+"""
+Indexed history of prediction results, replacing the append-only
+`historial.csv`.
+
+Each row holds the patient ID, a UTC timestamp, the hash of the study pixels
+(see `result_cache.study_hash`), label, probability and the model version.
+Rows live in an SQLite database in WAL mode, indexed by patient and date and
+by study hash. Lookups by patient or by date range do not scan the whole
+history. Writes can be grouped: `BatchWriter` commits every N rows in a
+single transaction. Export to CSV streams the rows with a cursor, so even a
+large history is written without loading it in memory. `import_historial`
+loads an old `historial.csv`, whose fields were separated by `-`.
+The `journal` table records which input files were already processed; it
+is written in the same transaction as their results (see `add_many`), so a
+file is never recorded twice nor lost across restarts.
+
+Classes:
+    ResultsStore: The database.
+    BatchWriter: Buffered, transactional writer returned by
+        `ResultsStore.writer()`.
+"""
+import csv
+import datetime
+import os
+import sqlite3
+import threading
+
+# Base de datos por defecto; se puede cambiar con NEUMONIA_RESULTS_DB
+DB_PATH = os.environ.get("NEUMONIA_RESULTS_DB", "historial.db")
+# Columnas exportadas, en orden
+FIELDS = ("patient_id", "timestamp", "study_hash", "label", "proba",
+          "model_version", "source")
+# Versión del esquema (PRAGMA user_version)
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    study_hash TEXT,
+    label TEXT NOT NULL,
+    proba REAL NOT NULL,
+    model_version TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS results_patient ON results (patient_id, timestamp);
+CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS results_study ON results (study_hash);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    PRIMARY KEY (path, size, mtime_ns)
+);
+CREATE TABLE IF NOT EXISTS journal (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    error TEXT
+);
+"""
+
+
+def now():
+    """Returns the current UTC time as an ISO 8601 string (sortable)."""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(
+        timespec="seconds"
+    )
+
+
+def _timestamp(value):
+    # Acepta datetime o texto ISO 8601; guarda siempre texto ordenable
+    if value is None:
+        return now()
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.astimezone(datetime.timezone.utc).isoformat(timespec="seconds")
+    return str(value)
+
+
+class ResultsStore:
+    """
+    SQLite history of prediction results.
+
+    Args:
+        path (str, optional): Database file. Defaults to DB_PATH.
+
+    The object can be shared by several threads; each write is one
+    transaction.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_many(self, records, journal=()):
+        """
+        Stores several results in a single transaction.
+
+        Args:
+            records (iterable of dict): Keys from FIELDS; `patient_id`,
+                `label` and `proba` are required, `timestamp` defaults to now.
+            journal (iterable of tuple, optional): (path, size, mtime_ns,
+                error) of the input files these results come from. They are
+                marked as processed in the same transaction.
+
+        Returns:
+            int: Number of rows written.
+        """
+        rows = [
+            (
+                str(r["patient_id"]), _timestamp(r.get("timestamp")),
+                r.get("study_hash"), r["label"], float(r["proba"]),
+                r.get("model_version"), r.get("source"),
+            )
+            for r in records
+        ]
+        stamp = now()
+        entries = [(path, size, mtime_ns, stamp, error)
+                   for path, size, mtime_ns, error in journal]
+        if not rows and not entries:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO results (patient_id, timestamp, study_hash, label,"
+                " proba, model_version, source) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO journal (path, size, mtime_ns,"
+                " timestamp, error) VALUES (?, ?, ?, ?, ?)",
+                entries,
+            )
+        return len(rows)
+
+    def processed(self):
+        """
+        Returns the input files marked as processed (see `add_many`).
+
+        Returns:
+            dict: path -> (size, mtime_ns) of the processed version.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM journal"
+            ).fetchall()
+        return {row["path"]: (row["size"], row["mtime_ns"]) for row in rows}
+
+    def add(self, patient_id, label, proba, study_hash=None,
+            model_version=None, timestamp=None, source=None):
+        """Stores one result. See `add_many`."""
+        return self.add_many([{
+            "patient_id": patient_id, "label": label, "proba": proba,
+            "study_hash": study_hash, "model_version": model_version,
+            "timestamp": timestamp, "source": source,
+        }])
+
+    def writer(self, batch_size=500):
+        """
+        Returns a buffered writer that commits every `batch_size` rows.
+
+        Usage:
+            with store.writer() as w:
+                for ...:
+                    w.add(...)
+        """
+        return BatchWriter(self, batch_size)
+
+    def _query(self, where, params, limit=None):
+        sql = f"SELECT {', '.join(FIELDS)} FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp, id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    @staticmethod
+    def _filters(patient_id=None, start=None, end=None):
+        where, params = [], []
+        if patient_id is not None:
+            where.append("patient_id = ?")
+            params.append(str(patient_id))
+        if start is not None:
+            where.append("timestamp >= ?")
+            params.append(_timestamp(start))
+        if end is not None:
+            where.append("timestamp < ?")
+            params.append(_timestamp(end))
+        return where, params
+
+    def by_patient(self, patient_id, start=None, end=None, limit=None):
+        """
+        Returns the results of a patient, oldest first (indexed lookup).
+
+        Args:
+            patient_id (str): Patient ID.
+            start, end (datetime or str, optional): Date range [start, end).
+            limit (int, optional): Maximum number of rows.
+
+        Returns:
+            list of dict: Rows with the keys in FIELDS.
+        """
+        return self._query(*self._filters(patient_id, start, end), limit=limit)
+
+    def between(self, start=None, end=None, limit=None):
+        """Returns the results in the date range [start, end), oldest first."""
+        return self._query(*self._filters(None, start, end), limit=limit)
+
+    def by_study(self, study_hash):
+        """Returns every result stored for the same pixel data."""
+        return self._query(["study_hash = ?"], [study_hash])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def export_csv(self, destination, patient_id=None, start=None, end=None,
+                   chunk=1000):
+        """
+        Streams results to a CSV file (comma-separated, with header).
+
+        Rows are read from a separate connection in chunks, so the export
+        neither loads the history in memory nor blocks the writers.
+
+        Args:
+            destination (str or file): Path or open text file.
+            patient_id, start, end: Optional filters, see `by_patient`.
+            chunk (int): Rows fetched per round trip.
+
+        Returns:
+            int: Number of rows written.
+        """
+        where, params = self._filters(patient_id, start, end)
+        sql = f"SELECT {', '.join(FIELDS)} FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp, id"
+
+        own = isinstance(destination, (str, os.PathLike))
+        f = open(destination, "w", newline="", encoding="utf-8") if own else destination
+        reader = sqlite3.connect(self.path)
+        written = 0
+        try:
+            out = csv.writer(f)
+            out.writerow(FIELDS)
+            cursor = reader.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    break
+                out.writerows(rows)
+                written += len(rows)
+        finally:
+            reader.close()
+            if own:
+                f.close()
+        return written
+
+    def import_historial(self, path="historial.csv"):
+        """
+        Imports an old `historial.csv` written by `App.save_results_csv`.
+
+        Its rows are `ID-label-proba%` separated by `-`. IDs that contain
+        hyphens are rebuilt from the leading fields, because label and
+        probability never contain one. The old file has no dates, so the
+        rows get the file modification time. Importing the same
+        (unchanged) file again does nothing.
+
+        Args:
+            path (str): The CSV file.
+
+        Returns:
+            int: Number of rows imported.
+        """
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            seen = self._conn.execute(
+                "SELECT 1 FROM imports WHERE path = ? AND size = ? AND mtime_ns = ?",
+                key,
+            ).fetchone()
+        if seen:
+            return 0
+
+        timestamp = _timestamp(datetime.datetime.fromtimestamp(
+            stat.st_mtime, datetime.timezone.utc
+        ))
+        records = []
+        with open(path, newline="", encoding="utf-8", errors="replace") as f:
+            for fields in csv.reader(f, delimiter="-"):
+                if len(fields) < 3:
+                    continue
+                proba = fields[-1].strip().rstrip("%")
+                try:
+                    proba = float(proba)
+                except ValueError:
+                    continue
+                records.append({
+                    "patient_id": "-".join(fields[:-2]).strip(),
+                    "label": fields[-2].strip(),
+                    "proba": proba,
+                    "timestamp": timestamp,
+                    "source": "historial.csv",
+                })
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO results (patient_id, timestamp, study_hash, label,"
+                " proba, model_version, source) VALUES (?, ?, NULL, ?, ?, NULL, ?)",
+                [(r["patient_id"], r["timestamp"], r["label"], r["proba"],
+                  r["source"]) for r in records],
+            )
+            self._conn.execute("INSERT INTO imports VALUES (?, ?, ?, ?)",
+                               key + (len(records),))
+        return len(records)
+
+
+class BatchWriter:
+    """
+    Buffers results and writes them in transactions of `batch_size` rows.
+
+    Used as a context manager, pending rows are committed on exit.
+    """
+
+    def __init__(self, store, batch_size=500):
+        self.store = store
+        self.batch_size = batch_size
+        self.pending = []
+        self.written = 0
+
+    def add(self, patient_id, label, proba, study_hash=None,
+            model_version=None, timestamp=None, source=None):
+        self.pending.append({
+            "patient_id": patient_id, "label": label, "proba": proba,
+            "study_hash": study_hash, "model_version": model_version,
+            "timestamp": _timestamp(timestamp), "source": source,
+        })
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.written += self.store.add_many(self.pending)
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        return False
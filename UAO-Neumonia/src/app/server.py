@@ -0,0 +1,455 @@
+# Servicio HTTP local (asyncio) para consultar el clasificador desde otras herramientas
+"""
+Local asyncio HTTP inference service with dynamic micro-batching.
+
+The service wraps `integrator.read_dicom`/`read_jpg`/`prediction_batch`.
+Requests wait in a bounded queue. A batcher collects them until `max_batch`
+requests are waiting or `max_wait_ms` have passed, and then makes one model
+call. When the queue is full, new requests get `503` (backpressure). A
+semaphore bounds the number of requests in flight, and once
+`max_concurrency + max_queue` prediction requests are admitted, new ones
+get `503` before their body is read.
+
+Endpoints:
+    POST /predict   Body: the DICOM or image file. Format comes from
+                    `?format=dcm|jpg` or the Content-Type header;
+                    `?heatmap=1` adds the Grad-CAM as a base64 PNG, at
+                    the decoded image size or at `?size=WxH`;
+                    `?heatmap=auto` only for abnormal or low-confidence
+                    results (see `prediction.needs_heatmap`).
+    GET  /health    Liveness and model readiness.
+    GET  /metrics   Counters, batch sizes and latency percentiles (JSON);
+                    `?format=prometheus` returns the pipeline metrics of
+                    the `metrics` module in Prometheus text format.
+
+Usage (from UAO-Neumonia/):
+    python src/app/server.py --port 8080 --max-batch 16 --max-wait-ms 10
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+
+import integrator
+import metrics
+
+# Tamaño máximo del cuerpo de una petición
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Latencias recientes usadas para los percentiles de /metrics
+LATENCY_WINDOW = 2048
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class Overloaded(Exception):
+    """The request queue is full."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class MicroBatcher:
+    """
+    Groups concurrent prediction requests into batched model calls.
+
+    Args:
+        predict_fn (callable): `fn(arrays, heatmaps) -> list of results`,
+            run in a worker thread.
+        max_batch (int): Largest batch sent to the model.
+        max_wait_ms (float): Longest time the first request of a batch waits
+            for others to join.
+        max_queue (int): Queued requests before new ones are rejected.
+    """
+
+    def __init__(self, predict_fn, max_batch=16, max_wait_ms=10.0, max_queue=256):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix="modelo")
+        self.batches = 0
+        self.batched_items = 0
+        self.rejected = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, array, heatmap):
+        """
+        Queues one image and waits for its `(label, proba, heatmap)` result.
+
+        Raises:
+            Overloaded: If the queue is full.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((array, heatmap, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Overloaded("Cola de inferencia llena.")
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.batches += 1
+            self.batched_items += len(batch)
+            # Cada modo de Grad-CAM va en una llamada separada
+            for wants_heatmap in (False, "auto", True):
+                group = [item for item in batch if item[1] == wants_heatmap]
+                group = [item for item in group if not item[2].cancelled()]
+                if not group:
+                    continue
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, self.predict_fn,
+                        [item[0] for item in group], wants_heatmap,
+                    )
+                except Exception as e:
+                    for _, _, future in group:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), result in zip(group, results):
+                    if not future.done():
+                        future.set_result(result)
+
+
+def _predict_batch(arrays, heatmaps):
+    # Los mapas no calculados en modo "auto" no se devuelven: sin copias diferidas
+    return integrator.prediction_batch(
+        arrays, batch_size=len(arrays), heatmaps=heatmaps, lazy_maps=False
+    )
+
+
+def _decode(body, fmt):
+    # read_dicom/read_jpg leen desde una ruta: se usa un archivo temporal
+    suffix = ".dcm" if fmt == "dcm" else ".img"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        reader = integrator.read_dicom if fmt == "dcm" else integrator.read_jpg
+        array, _ = reader(path)
+    finally:
+        os.remove(path)
+    if array is None:
+        raise HTTPError(400, "No se pudo decodificar la imagen.")
+    return array
+
+
+def _encode_heatmap(array, heatmap, size):
+    # El mapa crudo se dibuja solo al tamaño pedido y se codifica como PNG
+    overlay = integrator.render_heatmap(array, heatmap, size)
+    ok, png = cv2.imencode(".png", overlay[:, :, ::-1])
+    return base64.b64encode(png.tobytes()).decode()
+
+
+class InferenceServer:
+    """
+    The HTTP service.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): TCP port; 0 picks a free one (see `self.port`).
+        max_batch (int): Largest model batch.
+        max_wait_ms (float): Micro-batching window.
+        max_queue (int): Queued requests before answering 503.
+        max_concurrency (int): Requests decoded/predicted at the same time.
+            Prediction requests beyond `max_concurrency + max_queue` (in
+            flight or waiting) are answered 503 without reading the body.
+        decode_workers (int): Threads that decode uploads.
+        predict_fn (callable, optional): Replaces the model call (tests).
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, max_batch=16,
+                 max_wait_ms=10.0, max_queue=256, max_concurrency=64,
+                 decode_workers=2, predict_fn=None):
+        self.host = host
+        self.port = port
+        self.batcher = MicroBatcher(predict_fn or _predict_batch, max_batch,
+                                    max_wait_ms, max_queue)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Peticiones /predict admitidas (leyendo el cuerpo, esperando o en curso)
+        self.max_admitted = max_concurrency + max_queue
+        self.admitted = 0
+        self.rejected = 0
+        self.decoder = ThreadPoolExecutor(max_workers=decode_workers,
+                                          thread_name_prefix="decodificar")
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+        self.model_ready = None
+        self._server = None
+
+    async def start(self):
+        self.batcher.start()
+        # Cargar el modelo sin bloquear el bucle de eventos
+        self.model_ready = asyncio.get_running_loop().run_in_executor(
+            self.batcher.executor, integrator.warm_up
+        )
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.stop()
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        latencies = list(self.latencies)
+        batches = self.batcher.batches
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": self.rejected + self.batcher.rejected,
+            "queue_depth": self.batcher.queue.qsize(),
+            "batches": batches,
+            "mean_batch_size": (self.batcher.batched_items / batches
+                                if batches else 0.0),
+            "latency_p50_ms": _percentile(latencies, 50) * 1000,
+            "latency_p99_ms": _percentile(latencies, 99) * 1000,
+            "uptime_s": time.time() - self.started,
+            "cache": integrator.cache_stats(),
+            "pipeline": metrics.snapshot() if metrics.is_enabled() else None,
+        }
+
+    async def _predict(self, query, headers, body):
+        fmt = query.get("format", [""])[0].lower()
+        if not fmt:
+            content_type = headers.get("content-type", "")
+            fmt = "dcm" if "dicom" in content_type else "jpg"
+        if fmt in ("dicom", "dcm"):
+            fmt = "dcm"
+        elif fmt in ("jpg", "jpeg", "png", "image"):
+            fmt = "jpg"
+        else:
+            raise HTTPError(400, f"Formato no soportado: {fmt}")
+        if not body:
+            raise HTTPError(400, "El cuerpo de la petición está vacío.")
+        wants_heatmap = query.get("heatmap", ["0"])[0]
+        wants_heatmap = "auto" if wants_heatmap == "auto" else wants_heatmap in ("1", "true")
+        size = None
+        if "size" in query:
+            try:
+                size = tuple(int(v) for v in query["size"][0].lower().split("x"))
+            except ValueError:
+                size = ()
+            if len(size) != 2 or min(size) < 1:
+                raise HTTPError(400, "size debe tener la forma ANCHOxALTO.")
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            array = await loop.run_in_executor(self.decoder, _decode, body, fmt)
+            try:
+                label, proba, heatmap = await self.batcher.submit(
+                    array, wants_heatmap
+                )
+            except Overloaded as e:
+                raise HTTPError(503, str(e))
+            response = {"label": label, "proba": proba}
+            # En modo "auto" los mapas no seleccionados quedan sin calcular
+            if heatmap is not None:
+                response["heatmap_png"] = await loop.run_in_executor(
+                    self.decoder, _encode_heatmap, array, heatmap, size
+                )
+        return response
+
+    async def _route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path == "/predict":
+            if method != "POST":
+                raise HTTPError(405, "Use POST.")
+            return await self._predict(query, headers, body)
+        if url.path == "/health":
+            ready = self.model_ready is not None and self.model_ready.done()
+            failed = ready and self.model_ready.exception() is not None
+            return {"status": "error" if failed else "ok",
+                    "model_loaded": ready and not failed,
+                    "queue_depth": self.batcher.queue.qsize()}
+        if url.path == "/metrics":
+            if query.get("format", [""])[0] == "prometheus":
+                return metrics.to_prometheus()
+            return self.metrics()
+        raise HTTPError(404, f"Ruta desconocida: {url.path}")
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Petición inválida."})
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "Content-Length inválido."})
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "Archivo demasiado grande."})
+                    break
+                # Admisión acotada antes de leer el cuerpo: sin ella, cada
+                # petición en espera retiene hasta MAX_BODY_BYTES en memoria
+                predicting = urlsplit(target).path == "/predict"
+                if predicting and self.admitted >= self.max_admitted:
+                    self.rejected += 1
+                    self.errors += 1
+                    await self._respond(writer, 503, {"error": "Servidor ocupado."})
+                    break
+                if predicting:
+                    self.admitted += 1
+                try:
+                    body = await reader.readexactly(length) if length else b""
+
+                    start = time.perf_counter()
+                    self.requests += 1
+                    try:
+                        status, payload = 200, await self._route(method, target,
+                                                                 headers, body)
+                    except HTTPError as e:
+                        status, payload = e.status, {"error": str(e)}
+                    except Exception as e:
+                        status, payload = 500, {"error": str(e)}
+                finally:
+                    if predicting:
+                        self.admitted -= 1
+                if status >= 400:
+                    self.errors += 1
+                elif target.startswith("/predict"):
+                    self.latencies.append(time.perf_counter() - start)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive=False):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Servicio HTTP local para el clasificador de neumonía."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=16,
+                        help="Tamaño máximo de lote por llamada al modelo")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="Espera máxima para completar un lote")
+    parser.add_argument("--max-queue", type=int, default=256,
+                        help="Peticiones en cola antes de responder 503")
+    parser.add_argument("--max-concurrency", type=int, default=64,
+                        help="Peticiones procesándose a la vez")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                        help="Hilos de decodificación")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Activar la instrumentación del pipeline")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+
+    async def run():
+        server = InferenceServer(
+            args.host, args.port, args.max_batch, args.max_wait_ms,
+            args.max_queue, args.max_concurrency, args.decode_workers,
+        )
+        await server.start()
+        print(f"Escuchando en http://{server.host}:{server.port}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# Módulo encargado de pasar los tensores preprocesados entre procesos sin copiarlos
+"""
+Zero-copy handoff of preprocessed tensors from decode workers to the
+inference process.
+
+With a plain `ProcessPoolExecutor`, every (512, 512, 1) float32 tensor
+(1 MB) is pickled in the worker, sent through a pipe, unpickled and then
+copied again by `np.stack` to build the batch. Here the tensors never leave
+shared memory: `SharedRing` is one `multiprocessing.shared_memory` block
+split into slots, the workers preprocess straight into their slot
+(`preprocess(array, out=...)`) and only send back the path, the error
+message and the patient information. The inference process reads each
+batch as a NumPy view of consecutive slots; TensorFlow's own input
+conversion is the only copy left.
+
+Slots are assigned in ring order by the inference process: task `k` uses
+slot `k % slots`, and new tasks are submitted only for the slots of batches
+already consumed, so a slot is never rewritten while its batch is in use.
+The ring holds `depth` batches: while one is predicted, the next ones are
+being filled.
+
+The block is created by the inference process and unlinked when the
+iteration ends, on errors (including a worker that dies, which breaks the
+pool) and when the consumer stops early. If the inference process itself
+is killed, the `multiprocessing` resource tracker unlinks it.
+
+`benchmarks/bench_shm_ring.py` compares it with the pickling pool.
+
+Classes:
+    SharedRing: Shared-memory array of tensor slots.
+
+Functions:
+    ring_batches: Decodes and preprocesses files into the ring, in
+        parallel, and yields whole batches as views.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from preprocess_img import TARGET_SIZE, preprocess
+from read_img import MODEL_SIZE, read_image_file
+from result_cache import study_hash
+
+# Forma de un tensor preprocesado
+TENSOR_SHAPE = TARGET_SIZE[::-1] + (1,)
+# Lotes que caben en el anillo: uno en inferencia y los demás llenándose
+DEPTH = 3
+
+# En cada proceso decodificador: el anillo abierto por nombre
+_ring = None
+
+
+class SharedRing:
+    """
+    Array of `slots` tensors in one shared-memory block.
+
+    Args:
+        slots (int): Number of tensors.
+        shape (tuple): Shape of one tensor.
+        dtype: Type of the tensors.
+        name (str, optional): Attach to an existing block instead of
+            creating one.
+    """
+
+    def __init__(self, slots, shape=TENSOR_SHAPE, dtype=np.float32, name=None):
+        self.slots = slots
+        self.owner = name is None
+        size = slots * int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=size if self.owner else 0)
+        self.array = np.ndarray((slots,) + tuple(shape), dtype=dtype,
+                                buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def slot(self, index):
+        """Returns slot `index` as a view with a leading batch axis of 1."""
+        return self.array[index:index + 1]
+
+    def batch(self, start, count):
+        """Returns `count` consecutive slots as one view, without copying."""
+        if start + count > self.slots:
+            raise ValueError("El lote no cabe en el anillo a partir de ese slot.")
+        return self.array[start:start + count]
+
+    def close(self):
+        """Detaches from the block and, in its creator, removes it."""
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Aún hay vistas vivas; la memoria se libera cuando desaparezcan
+            pass
+        if self.owner:
+            self.owner = False
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach(name, slots):
+    """Opens the ring in a decode worker."""
+    global _ring
+    _ring = SharedRing(slots, name=name)
+
+
+def _fill(path, slot, keep_original=False):
+    """
+    Decodes and preprocesses one file into a slot of the ring.
+
+    Returns:
+        tuple: (path, error message or None, dict with `patient_id` and
+        `study_hash` or None, decoded image if `keep_original` or None).
+    """
+    from batch_scan import patient_id
+
+    try:
+        array, _ = read_image_file(path, target_size=MODEL_SIZE)
+        if array is None:
+            return path, "No se pudo leer el archivo.", None, None
+        preprocess(array, out=_ring.slot(slot))
+        info = {"patient_id": patient_id(path), "study_hash": study_hash(array)}
+        return path, None, info, array if keep_original else None
+    except Exception as e:
+        return path, str(e), None, None
+
+
+def ring_batches(paths, workers=None, batch_size=16, depth=DEPTH,
+                 keep_original=False):
+    """
+    Decodes and preprocesses files into a shared ring, in parallel, and
+    yields them in batches.
+
+    Args:
+        paths (list of str): Files, in the order of the results.
+        workers (int, optional): Decode processes; 0 decodes in-process.
+            Defaults to the number of CPUs.
+        batch_size (int): Files per batch.
+        depth (int): Batches held by the ring (at least 2).
+        keep_original (bool): Also return the decoded images (pickled).
+
+    Yields:
+        tuple: (tensors, results). `tensors` is a (n, 512, 512, 1) view of
+        the ring, valid until the next batch is requested; `results` holds
+        one (path, error, info, original) per row. Rows whose `error` is
+        not None contain stale data.
+    """
+    global _ring
+    if batch_size < 1 or depth < 2:
+        raise ValueError("batch_size debe ser mayor que cero y depth al menos 2.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    slots = batch_size * depth
+    ring = SharedRing(slots)
+    executor = None
+    if workers == 0:
+        _ring = ring
+    else:
+        # spawn: igual que batch_scan, los procesos no heredan TensorFlow
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_attach,
+            initargs=(ring.name, slots),
+        )
+    pending = deque()
+    submitted = 0
+
+    def submit_until(limit):
+        nonlocal submitted
+        while submitted < min(limit, len(paths)):
+            args = (paths[submitted], submitted % slots, keep_original)
+            if executor is None:
+                pending.append(_fill(*args))
+            else:
+                pending.append(executor.submit(_fill, *args))
+            submitted += 1
+
+    try:
+        submit_until(slots)
+        for start in range(0, len(paths), batch_size):
+            count = min(batch_size, len(paths) - start)
+            results = [pending.popleft() for _ in range(count)]
+            if executor is not None:
+                results = [future.result() for future in results]
+            yield ring.batch(start % slots, count), results
+            # El lote ya se usó: sus slots pueden recibir los siguientes archivos
+            submit_until(start + batch_size + slots)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        else:
+            _ring = None
+        ring.close()
@@ -0,0 +1,482 @@
+# Módulo encargado de guardar los tensores preprocesados para volver a evaluarlos
+"""
+Persistent store of preprocessed tensors, for re-scoring studies without
+decoding them again.
+
+When the model is replaced or re-validated, decoding and CLAHE take most
+of the time of a full pass. The store keeps the output of `preprocess` of
+every study in sharded `.npy` files that are read back memory-mapped. By
+default they are stored as uint8, which is lossless: `preprocess` divides
+an 8-bit CLAHE image by 255, so a tensor takes 256 KB instead of 1 MB.
+float16 is also available.
+
+A manifest (SQLite) maps each study hash (`result_cache.study_hash`) to
+its shard and row, and each source file (path, size, mtime) to its study
+hash, so `build` only decodes new or changed files. Shards live in one
+folder per preprocessing fingerprint (target size, CLAHE clip limit and
+tile grid, storage type): when a parameter changes, the old entries are no
+longer returned and `prune` removes them.
+
+Rows are appended in order, so `batches` returns runs of consecutive rows
+as views of the memory map; the only copy left is the float32 conversion,
+done into a reused buffer just before `predict_preprocessed`.
+
+Usage (from UAO-Neumonia/):
+    python src/app/tensor_store.py build /ruta/exportacion --store tensores/
+    python src/app/tensor_store.py rescore --store tensores/ -o resultados.csv
+
+Classes:
+    TensorStore: The store.
+
+Functions:
+    preprocess_fingerprint: Fingerprint of the preprocessing parameters.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+import preprocess_img
+
+# Formatos de almacenamiento admitidos
+DTYPES = ("uint8", "float16")
+# Tensores por archivo .npy
+SHARD_CAPACITY = 1024
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    params TEXT NOT NULL,
+    file TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shards_params ON shards (params, id);
+CREATE TABLE IF NOT EXISTS entries (
+    study_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (study_hash, params)
+);
+CREATE INDEX IF NOT EXISTS entries_position ON entries (params, shard, row);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    study_hash TEXT NOT NULL,
+    PRIMARY KEY (path, params)
+);
+"""
+
+
+def preprocess_fingerprint(dtype="uint8"):
+    """
+    Returns a short fingerprint of the preprocessing parameters.
+
+    Args:
+        dtype (str): Storage type, part of the fingerprint.
+
+    Returns:
+        str: 12 hex characters; changes with TARGET_SIZE, CLAHE_CLIP_LIMIT,
+        CLAHE_TILE_GRID or `dtype`.
+    """
+    params = (preprocess_img.TARGET_SIZE, float(preprocess_img.CLAHE_CLIP_LIMIT),
+              tuple(preprocess_img.CLAHE_TILE_GRID), dtype)
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+
+
+def as_float32(tensors, out=None):
+    """
+    Converts stored tensors to the float32 input of the model.
+
+    Args:
+        tensors (numpy.ndarray): A batch from `TensorStore.batches`.
+        out (numpy.ndarray, optional): float32 buffer with room for the batch.
+
+    Returns:
+        numpy.ndarray: float32 tensors in [0, 1], a view of `out` if given.
+    """
+    if out is None:
+        out = np.empty(tensors.shape, dtype=np.float32)
+    else:
+        out = out[:len(tensors)]
+    if tensors.dtype == np.uint8:
+        np.multiply(tensors, np.float32(1 / 255), out=out)
+    else:
+        out[...] = tensors
+    return out
+
+
+class TensorStore:
+    """
+    Sharded, memory-mapped store of preprocessed tensors.
+
+    Args:
+        root (str): Folder of the store (created if missing).
+        dtype (str): Storage type, "uint8" (lossless) or "float16".
+        shard_capacity (int): Tensors per shard file.
+    """
+
+    def __init__(self, root, dtype="uint8", shard_capacity=SHARD_CAPACITY):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype debe ser uno de {DTYPES}.")
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        self.shard_capacity = shard_capacity
+        self.params = preprocess_fingerprint(dtype)
+        self.shape = preprocess_img.TARGET_SIZE[::-1] + (1,)
+        os.makedirs(os.path.join(root, self.params), exist_ok=True)
+        self._maps = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "manifest.db"),
+                                     check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            for array in self._maps.values():
+                if array.mode != "r":
+                    array.flush()
+            self._maps.clear()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _map(self, shard, writable=False):
+        # Una sola memoria mapeada por archivo; se reabre para escribir
+        key = (shard, writable)
+        array = self._maps.get(key)
+        if array is None:
+            file = self._conn.execute("SELECT file FROM shards WHERE id = ?",
+                                      (shard,)).fetchone()[0]
+            path = os.path.join(self.root, self.params, file)
+            array = np.load(path, mmap_mode="r+" if writable else "r")
+            self._maps[key] = array
+        return array
+
+    def _open_shard(self):
+        row = self._conn.execute(
+            "SELECT id, used, capacity FROM shards WHERE params = ? "
+            "ORDER BY id DESC LIMIT 1", (self.params,),
+        ).fetchone()
+        if row is not None and row[1] < row[2]:
+            return row
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO shards (params, file, capacity, used) VALUES (?, '', ?, 0)",
+                (self.params, self.shard_capacity),
+            )
+            shard = cursor.lastrowid
+            file = f"shard_{shard:05d}.npy"
+            np.lib.format.open_memmap(
+                os.path.join(self.root, self.params, file), mode="w+",
+                dtype=self.dtype, shape=(self.shard_capacity,) + self.shape,
+            ).flush()
+            self._conn.execute("UPDATE shards SET file = ? WHERE id = ?",
+                               (file, shard))
+        return shard, 0, self.shard_capacity
+
+    def add_many(self, items):
+        """
+        Appends preprocessed tensors.
+
+        Tensors already stored (same study hash) are not written again. The
+        rows are flushed to disk before the manifest transaction that makes
+        them visible, so a crash never leaves entries pointing at missing
+        data.
+
+        Args:
+            items (iterable of tuple): (study_hash, tensor, source) where
+                `tensor` is a float32 (512, 512, 1) output of `preprocess`
+                and `source` is None or (path, size, mtime_ns).
+
+        Returns:
+            int: Number of tensors written.
+        """
+        written = 0
+        with self._lock:
+            pending = list(items)
+            studies = list({study for study, _, _ in pending})
+            known = set()
+            for i in range(0, len(studies), 500):
+                chunk = studies[i:i + 500]
+                known.update(row[0] for row in self._conn.execute(
+                    "SELECT study_hash FROM entries WHERE params = ? AND study_hash "
+                    f"IN ({', '.join('?' * len(chunk))})", [self.params] + chunk,
+                ))
+            while pending:
+                shard, used, capacity = self._open_shard()
+                array = self._map(shard, writable=True)
+                entries, sources, rest = [], [], []
+                for study, tensor, source in pending:
+                    if source is not None:
+                        sources.append((source[0], self.params, source[1],
+                                        source[2], study))
+                    if study in known:
+                        continue
+                    if used >= capacity:
+                        rest.append((study, tensor, None))
+                        continue
+                    if self.dtype == np.uint8:
+                        # Sin pérdida: el tensor es una imagen de 8 bits dividida por 255
+                        np.copyto(array[used], np.rint(tensor * 255), casting="unsafe")
+                    else:
+                        np.copyto(array[used], tensor, casting="same_kind")
+                    entries.append((study, self.params, shard, used))
+                    known.add(study)
+                    used += 1
+                array.flush()
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", entries
+                    )
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", sources
+                    )
+                    self._conn.execute("UPDATE shards SET used = ? WHERE id = ?",
+                                       (used, shard))
+                written += len(entries)
+                pending = rest
+        return written
+
+    def add(self, study_hash, tensor, source=None):
+        """Appends one tensor. See `add_many`."""
+        return self.add_many([(study_hash, tensor, source)])
+
+    def sources(self):
+        """
+        Returns the source files stored with the current parameters.
+
+        Returns:
+            dict: path -> (size, mtime_ns).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM sources WHERE params = ?",
+                (self.params,),
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE params = ?", (self.params,)
+            ).fetchone()[0]
+
+    def __contains__(self, study_hash):
+        return self._position(study_hash) is not None
+
+    def _position(self, study_hash):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT shard, row FROM entries WHERE study_hash = ? AND params = ?",
+                (study_hash, self.params),
+            ).fetchone()
+
+    def get(self, study_hash):
+        """
+        Returns the stored tensor of a study, as a read-only view with a
+        leading batch axis of 1, or None if it is not stored with the
+        current preprocessing parameters.
+        """
+        position = self._position(study_hash)
+        if position is None:
+            return None
+        shard, row = position
+        with self._lock:
+            return self._map(shard)[row:row + 1]
+
+    def batches(self, batch_size=32, hashes=None):
+        """
+        Yields stored tensors in batches, as views of the memory maps.
+
+        Args:
+            batch_size (int): Maximum tensors per batch.
+            hashes (iterable of str, optional): Only these studies. Defaults
+                to every study stored with the current parameters.
+
+        Yields:
+            tuple: (list of study hashes, read-only (n, 512, 512, 1) view in
+            the storage type). A batch holds consecutive rows of one shard,
+            so it may be shorter than `batch_size`.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT study_hash, shard, row FROM entries WHERE params = ? "
+                "ORDER BY shard, row", (self.params,),
+            ).fetchall()
+        if hashes is not None:
+            wanted = set(hashes)
+            rows = [r for r in rows if r[0] in wanted]
+
+        run = []
+        for study, shard, row in rows:
+            if run and (shard != run[0][1] or row != run[-1][2] + 1
+                        or len(run) == batch_size):
+                yield self._run(run)
+                run = []
+            run.append((study, shard, row))
+        if run:
+            yield self._run(run)
+
+    def _run(self, run):
+        shard, first = run[0][1], run[0][2]
+        with self._lock:
+            view = self._map(shard)[first:first + len(run)]
+        return [study for study, _, _ in run], view
+
+    def prune(self):
+        """
+        Removes the entries and shards of other preprocessing parameters.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM entries WHERE params != ?", (self.params,)
+            ).rowcount
+            self._conn.execute("DELETE FROM sources WHERE params != ?", (self.params,))
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT params FROM shards WHERE params != ?", (self.params,)
+            )]
+            self._conn.execute("DELETE FROM shards WHERE params != ?", (self.params,))
+        for params in stale:
+            shutil.rmtree(os.path.join(self.root, params), ignore_errors=True)
+        return removed
+
+
+def build(store, root, workers=None, batch_size=16, log=None):
+    """
+    Decodes and preprocesses the new or changed studies of a folder into
+    the store.
+
+    Args:
+        store (TensorStore): Destination.
+        root (str): Folder of studies (see `batch_scan.find_images`).
+        workers (int, optional): Decode processes; 0 decodes in-process.
+        batch_size (int): Files per transaction.
+        log (file, optional): Stream for a summary line.
+
+    Returns:
+        dict: Counters of `stored`, `unchanged` and `failed` files.
+    """
+    from batch_scan import find_images
+    from shm_ring import ring_batches
+
+    start = time.perf_counter()
+    known = store.sources()
+    todo, stats = [], {"stored": 0, "unchanged": 0, "failed": 0}
+    for path in find_images(root):
+        stat = os.stat(path)
+        if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+            stats["unchanged"] += 1
+        else:
+            todo.append((path, stat.st_size, stat.st_mtime_ns))
+
+    paths = [path for path, _, _ in todo]
+    keys = {path: (path, size, mtime_ns) for path, size, mtime_ns in todo}
+    for tensors, results in ring_batches(paths, workers, batch_size):
+        items = []
+        for tensor, (path, error, info, _) in zip(tensors, results):
+            if error is not None:
+                stats["failed"] += 1
+                continue
+            items.append((info["study_hash"], tensor, keys[path]))
+        store.add_many(items)
+        stats["stored"] += len(items)
+
+    if log is not None:
+        print(f"{stats['stored']} tensores guardados, {stats['unchanged']} sin "
+              f"cambios, {stats['failed']} errores en "
+              f"{time.perf_counter() - start:.1f} s", file=log)
+    return stats
+
+
+def rescore(store, batch_size=32, hashes=None, heatmaps=False):
+    """
+    Runs the current model over stored tensors, without decoding.
+
+    Args:
+        store (TensorStore): The store.
+        batch_size (int): Images per model call.
+        hashes (iterable of str, optional): Only these studies.
+        heatmaps (bool): Also compute the Grad-CAM maps.
+
+    Yields:
+        tuple: (study_hash, label, proba, heatmap) per study.
+    """
+    from prediction import predict_preprocessed
+
+    buffer = np.empty((batch_size,) + store.shape, dtype=np.float32)
+    for studies, tensors in store.batches(batch_size, hashes):
+        batch = as_float32(tensors, buffer)
+        for study, (label, proba, cam) in zip(
+            studies, predict_preprocessed(batch, batch_size, heatmaps=heatmaps)
+        ):
+            yield study, label, proba, cam
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Guarda los tensores preprocesados y vuelve a evaluarlos sin decodificar."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    building = commands.add_parser("build", help="Agregar los estudios de una carpeta")
+    building.add_argument("input", help="Carpeta con los estudios")
+    building.add_argument("--workers", type=int, default=None,
+                          help="Procesos de decodificación (0 = en el proceso principal)")
+    scoring = commands.add_parser("rescore", help="Evaluar los tensores guardados")
+    scoring.add_argument("-o", "--output", default="reevaluacion.csv",
+                         help="Archivo CSV de resultados")
+    pruning = commands.add_parser("prune", help="Borrar los tensores de otros parámetros")
+    for sub in (building, scoring, pruning):
+        sub.add_argument("--store", default="tensores", help="Carpeta del almacén")
+        sub.add_argument("--dtype", choices=DTYPES, default="uint8",
+                         help="Tipo de almacenamiento")
+    for sub in (building, scoring):
+        sub.add_argument("--batch-size", type=int, default=16,
+                         help="Imágenes por lote")
+    args = parser.parse_args(argv)
+
+    with TensorStore(args.store, args.dtype) as store:
+        if args.command == "build":
+            if not os.path.isdir(args.input):
+                parser.error(f"La carpeta {args.input} no existe.")
+            build(store, args.input, args.workers, args.batch_size, log=sys.stderr)
+        elif args.command == "rescore":
+            start = time.perf_counter()
+            count = 0
+            with open(args.output, "w", newline="", encoding="utf-8") as f:
+                out = csv.writer(f)
+                out.writerow(("study_hash", "label", "proba"))
+                for study, label, proba, _ in rescore(store, args.batch_size):
+                    out.writerow((study, label, round(proba, 4)))
+                    count += 1
+            print(f"{count} estudios reevaluados en "
+                  f"{time.perf_counter() - start:.1f} s", file=sys.stderr)
+        else:
+            print(f"{store.prune()} entradas eliminadas", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
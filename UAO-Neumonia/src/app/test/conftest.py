@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def stand_in_model_path(tmp_path_factory):
+    """
+    Crea un modelo Keras pequeño con la misma entrada (512x512x1), la misma
+    salida (3 clases) y una capa `conv10_thisone`, para probar sin el `.h5` real.
+    Es el mismo modelo sustituto de los benchmarks (`benchmarks/common.py`).
+    """
+    from common import build_stand_in_model
+
+    path = tmp_path_factory.mktemp("modelo") / "stand_in.h5"
+    build_stand_in_model(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def stand_in_model(stand_in_model_path, monkeypatch):
+    """Apunta el registro de load_model al modelo de prueba y lo limpia al final."""
+    import load_model
+
+    monkeypatch.setattr(load_model, "MODEL_PATH", stand_in_model_path)
+    load_model.evict()
+    yield stand_in_model_path
+    load_model.evict()
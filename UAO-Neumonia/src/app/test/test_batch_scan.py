@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+
+import numpy as np
+import pytest
+
+from batch_scan import find_images, main, read_checkpoint, scan
+
+
+@pytest.fixture
+def study_dir(tmp_path):
+    """Carpeta con estudios DICOM de prueba en subcarpetas y un archivo ajeno."""
+    import pydicom
+    from pydicom.dataset import FileDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    root = tmp_path / "exportacion"
+    for i in range(5):
+        folder = root / f"serie{i % 2}"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"estudio{i}.dcm"
+        meta = pydicom.dataset.FileMetaDataset()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+        ds.Modality = "CR"
+        ds.PixelData = np.random.randint(0, 256, (64, 64), dtype=np.uint8).tobytes()
+        ds.Rows = 64
+        ds.Columns = 64
+        ds.BitsAllocated = 8
+        ds.BitsStored = 8
+        ds.HighBit = 7
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.SamplesPerPixel = 1
+        ds.PixelRepresentation = 0
+        ds.save_as(str(path))
+    (root / "notas.txt").write_text("no es una imagen")
+    (root / "roto.dcm").write_bytes(b"no es un DICOM")
+    return root
+
+
+def test_find_images(study_dir):
+    """Solo se recogen las extensiones soportadas."""
+    paths = find_images(str(study_dir))
+
+    assert len(paths) == 6
+    assert all(p.endswith(".dcm") for p in paths)
+
+
+def test_scan_writes_csv_and_heatmaps(stand_in_model, study_dir, tmp_path):
+    """Cada estudio produce una fila; los archivos ilegibles quedan como error."""
+    output = tmp_path / "resultados.csv"
+    heatmaps = tmp_path / "heatmaps"
+
+    stats = scan(str(study_dir), str(output), workers=0, batch_size=2,
+                 heatmap_dir=str(heatmaps), log=io.StringIO())
+
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert stats["processed"] == 5
+    assert stats["failed"] == 1
+    assert len(rows) == 6
+    assert sum(1 for r in rows if r["error"]) == 1
+    assert len(list(heatmaps.rglob("*.png"))) == 5
+
+
+def test_scan_resume_skips_processed(stand_in_model, study_dir, tmp_path):
+    """Con resume solo se procesan los estudios que faltan en el checkpoint."""
+    output = tmp_path / "resultados.jsonl"
+    first = sorted(find_images(str(study_dir)))[:2]
+    with open(output, "w") as f:
+        for path in first:
+            f.write(json.dumps({"path": path, "label": "normal",
+                                "proba": 90.0, "error": ""}) + "\n")
+        f.write('{"path": "incompleta')
+
+    assert read_checkpoint(str(output)) == set(first)
+
+    stats = scan(str(study_dir), str(output), workers=0, resume=True,
+                 log=io.StringIO())
+
+    assert stats["skipped"] == 2
+    assert stats["processed"] + stats["failed"] == 4
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 6
+
+
+def test_main_with_worker_pool(stand_in_model, study_dir, tmp_path):
+    """La CLI decodifica con un pool de procesos y registra en el historial."""
+    from results_store import ResultsStore
+
+    output = tmp_path / "resultados.csv"
+    db = tmp_path / "historial.db"
+
+    assert main([str(study_dir), "-o", str(output), "--workers", "1",
+                 "--store", str(db)]) == 0
+
+    with open(output, newline="") as f:
+        assert len(list(csv.DictReader(f))) == 6
+    with ResultsStore(str(db)) as store:
+        assert store.count() == 5
+        row = store.by_patient("estudio3")[0]
+        assert row["study_hash"] and row["model_version"].startswith("stand_in.h5@")
+
+
+def test_scan_picks_studies_from_index(stand_in_model, study_dir, tmp_path):
+    """Con --index solo se decodifican los DICOM del índice, aun sin extensión."""
+    import shutil
+
+    shutil.copy(study_dir / "serie0" / "estudio0.dcm", study_dir / "IM0001")
+    output = tmp_path / "resultados.csv"
+
+    assert main([str(study_dir), "-o", str(output), "--workers", "0",
+                 "--index", str(tmp_path / "indice.db")
+                 ]) == 0
+
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 6 and not any(r["error"] for r in rows)
+
+
+def test_scan_shared_memory_matches_pickling(stand_in_model, study_dir, tmp_path):
+    """Con memoria compartida los resultados son los mismos que con el pool normal."""
+    outputs = []
+    for flags in ([], ["--shared-memory"]):
+        output = tmp_path / f"resultados{len(flags)}.csv"
+        assert main([str(study_dir), "-o", str(output), "--workers", "1",
+                     "--batch-size", "2"] + flags) == 0
+        with open(output, newline="") as f:
+            outputs.append(sorted((r["path"], r["label"], r["error"] != "")
+                                  for r in csv.DictReader(f)))
+
+    assert outputs[0] == outputs[1]
+    assert len(outputs[1]) == 6
+
+
+def test_scan_auto_policy_skips_confident_heatmaps(stand_in_model, study_dir,
+                                                   tmp_path, monkeypatch):
+    """Con --heatmap-policy auto solo se guardan los Grad-CAM que hacen falta."""
+    import prediction
+
+    heatmaps = tmp_path / "heatmaps"
+    monkeypatch.setattr(prediction, "needs_heatmap", lambda label, proba: False)
+    output = tmp_path / "resultados.csv"
+    assert main([str(study_dir), "-o", str(output), "--workers", "0",
+                 "--heatmaps", str(heatmaps), "--heatmap-policy", "auto"]) == 0
+
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sum(1 for r in rows if r["label"]) == 5
+    assert not heatmaps.exists() or not list(heatmaps.rglob("*.png"))
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pytest
+
+import dicom_index
+from dicom_index import DicomIndex, main, read_header
+
+
+def _write(path, modality="CR", body_part="CHEST", patient="123", rows=64,
+           study="1.2.3"):
+    import pydicom
+    from pydicom.dataset import FileDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = pydicom.dataset.FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.StudyInstanceUID = study
+    ds.SeriesInstanceUID = study + ".1"
+    ds.SOPInstanceUID = generate_uid()
+    ds.Modality = modality
+    ds.BodyPartExamined = body_part
+    ds.PatientID = patient
+    ds.PixelData = np.zeros((rows, rows), dtype=np.uint8).tobytes()
+    ds.Rows = rows
+    ds.Columns = rows
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.SamplesPerPixel = 1
+    ds.PixelRepresentation = 0
+    ds.save_as(str(path))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Archivo con radiografías de tórax, un CT, un DICOM sin extensión y ruido."""
+    root = tmp_path / "archivo"
+    (root / "a").mkdir(parents=True)
+    (root / "b").mkdir()
+    _write(root / "a" / "torax1.dcm", patient="123")
+    _write(root / "a" / "torax2.dcm", modality="DX", patient="456", study="1.2.4")
+    _write(root / "b" / "IM0001", patient="123", rows=32)
+    _write(root / "b" / "craneo.dcm", modality="CT", body_part="HEAD")
+    (root / "b" / "notas.txt").write_text("no es un DICOM")
+    return root
+
+
+def test_read_header_skips_pixels(archive):
+    """El encabezado trae los UID y el tamaño sin leer los píxeles."""
+    record = read_header(str(archive / "a" / "torax1.dcm"))
+
+    assert record["is_dicom"] == 1 and record["chest"] == 1
+    assert record["study_uid"] == "1.2.3" and record["sop_uid"]
+    assert (record["rows"], record["columns"], record["bits_allocated"]) == (64, 64, 8)
+    assert record["frames"] == 1
+    assert read_header(str(archive / "b" / "notas.txt"))["is_dicom"] == 0
+
+
+def test_query_filters(archive, tmp_path):
+    """Las consultas filtran por modalidad, tórax, paciente y tamaño."""
+    with DicomIndex(str(tmp_path / "indice.db")) as index:
+        stats = index.update(str(archive), workers=0)
+
+        assert stats == {"files": 5, "parsed": 5, "unchanged": 0,
+                         "removed": 0, "dicom": 4}
+        names = [os.path.basename(p) for p in index.paths(str(archive))]
+        assert names == ["torax1.dcm", "torax2.dcm", "IM0001"]
+        assert len(index.paths(str(archive), modality=None)) == 4
+        assert len(index.query(patient_id="123")) == 2
+        assert len(index.paths(str(archive), min_size=64)) == 2
+        assert index.paths(str(archive), modality="CT", chest=True) == []
+
+
+def test_rescan_reads_only_changed_files(archive, tmp_path, monkeypatch):
+    """Una segunda pasada solo lee los archivos nuevos o modificados."""
+    db = str(tmp_path / "indice.db")
+    with DicomIndex(db) as index:
+        index.update(str(archive), workers=0)
+
+    read = []
+    original = dicom_index.read_header
+    monkeypatch.setattr(dicom_index, "read_header",
+                        lambda path: read.append(path) or original(path))
+    _write(archive / "a" / "torax1.dcm", modality="DX")
+    os.utime(archive / "a" / "torax1.dcm", ns=(1, 1))
+    _write(archive / "a" / "torax3.dcm")
+    os.remove(archive / "b" / "IM0001")
+
+    with DicomIndex(db) as index:
+        stats = index.update(str(archive), workers=0)
+
+        assert sorted(os.path.basename(p) for p in read) == ["torax1.dcm", "torax3.dcm"]
+        assert stats["unchanged"] == 3 and stats["removed"] == 1
+        assert index.query(str(archive), modality="DX")[0]["path"].endswith("torax1.dcm")
+        assert index.count() == 4
+
+
+def test_main_lists_chest_radiographs(archive, tmp_path, capsys):
+    """La CLI indexa la carpeta y lista las radiografías de tórax."""
+    assert main([str(archive), "--db", str(tmp_path / "indice.db"),
+                 "--workers", "0", "--list"]) == 0
+
+    listed = capsys.readouterr().out.split()
+    assert [os.path.basename(p) for p in listed] == ["torax1.dcm", "torax2.dcm", "IM0001"]
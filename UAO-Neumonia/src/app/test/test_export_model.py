@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+import pytest
+
+import load_model
+from export_model import export, main, parity_check, sample_batch
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    """Modelo pequeño sin convoluciones con paso grande, exportable a TFLite."""
+    from tensorflow.keras import Model, layers
+
+    inputs = layers.Input((512, 512, 1))
+    x = layers.MaxPooling2D(8)(inputs)
+    x = layers.Conv2D(4, 3, padding="same", activation="relu")(x)
+    x = layers.Conv2D(
+        8, 3, padding="same", activation="relu", name="conv10_thisone"
+    )(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    outputs = layers.Dense(3, activation="softmax")(x)
+    path = tmp_path_factory.mktemp("exportar") / "modelo.h5"
+    Model(inputs, outputs).save(str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def images_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp("calibracion")
+    rng = np.random.default_rng(12)
+    for i in range(6):
+        image = rng.integers(0, 256, (128, 128, 3), dtype=np.uint8)
+        cv2.imwrite(str(root / f"placa{i}.png"), image)
+    return str(root)
+
+
+@pytest.fixture
+def registry(model_path, monkeypatch):
+    monkeypatch.setattr(load_model, "MODEL_PATH", model_path)
+    load_model.evict()
+    yield
+    load_model.evict()
+
+
+def test_export_and_parity(model_path, images_dir, registry):
+    """Cada formato exportado coincide con el modelo Keras."""
+    batch = sample_batch(images_dir, 10)
+    written = export(model_path, calibration=batch)
+
+    assert sorted(load_model.available_backends()) == sorted(load_model.BACKENDS)
+    for fmt, path in written.items():
+        assert path == load_model.exported_path(model_path, fmt)
+        report = parity_check(model_path, fmt, batch)
+        assert report["images"] == 6
+        tolerance = 0.05 if fmt == "tflite-int8" else 1e-3
+        assert report["max_drift"] < tolerance
+        if fmt != "tflite-int8":
+            assert report["label_agreement"] == 1.0
+
+
+def test_backend_selector(model_path, images_dir, registry, monkeypatch):
+    """predict_batch sin mapas usa el backend elegido; auto toma el exportado."""
+    from prediction import predict_batch
+
+    export(model_path, formats=("tflite-fp16",))
+    rng = np.random.default_rng(13)
+    arrays = [rng.integers(0, 256, (64, 64, 3), dtype=np.uint8) for _ in range(3)]
+
+    reference = predict_batch(arrays, heatmaps=False)
+    monkeypatch.setattr(load_model, "BACKEND", "auto")
+    fast = predict_batch(arrays, heatmaps=False)
+
+    assert isinstance(load_model.get_predictor(), load_model._TFLitePredictor)
+    assert [r[0] for r in fast] == [r[0] for r in reference]
+    assert np.allclose([r[1] for r in fast], [r[1] for r in reference], atol=0.1)
+    with pytest.raises(ValueError):
+        load_model.get_predictor(backend="onnx")
+
+
+def test_int8_needs_calibration(model_path, registry):
+    with pytest.raises(SystemExit):
+        main(["--model", model_path, "--formats", "tflite-int8"])
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from grad_cam import compute_heatmaps, get_engine, grad_cam
+
+
+def _reference_gradients(image):
+    """Activaciones de conv10_thisone y gradientes de la clase predicha, sin compilar."""
+    import tensorflow as tf
+    from load_model import get_grad_model
+
+    with tf.GradientTape() as tape:
+        conv_outputs, predictions = get_grad_model()(image, training=False)
+        loss = predictions[:, int(tf.argmax(predictions[0]))]
+    return conv_outputs.numpy(), tape.gradient(loss, conv_outputs).numpy()
+
+
+def _reference_heatmap(conv_outputs, grads):
+    """Implementación original con NumPy y bucle por canal, para una imagen."""
+    pooled_grads = np.mean(grads, axis=(0, 1, 2))
+    conv_outputs = np.array(conv_outputs[0])
+    for i in range(pooled_grads.shape[-1]):
+        conv_outputs[:, :, i] *= pooled_grads[i]
+    heatmap = np.mean(conv_outputs, axis=-1)
+    heatmap = np.maximum(heatmap, 0)
+    heatmap /= np.max(heatmap)
+    return heatmap
+
+
+@pytest.fixture
+def batch():
+    rng = np.random.default_rng(2)
+    return rng.random((3, 512, 512, 1), dtype=np.float32)
+
+
+def test_engine_matches_reference(stand_in_model, batch):
+    """El motor vectorizado debe coincidir con la implementación original."""
+    predictions, heatmaps = compute_heatmaps(batch)
+
+    assert predictions.shape == (3, 3)
+    for i in range(len(batch)):
+        conv_outputs, grads = _reference_gradients(batch[i:i + 1])
+        expected = _reference_heatmap(conv_outputs, grads)
+        np.testing.assert_allclose(heatmaps[i], expected, atol=1e-4)
+
+
+def test_engine_traced_once(stand_in_model, batch):
+    """La firma fija evita volver a trazar con distintos tamaños de lote."""
+    engine = get_engine()
+    compute_heatmaps(batch[:1])
+    compute_heatmaps(batch)
+
+    assert engine.experimental_get_tracing_count() == 1
+
+
+def test_all_zero_heatmap(stand_in_model):
+    """Un mapa todo en cero no debe producir NaN (antes dividía por cero)."""
+    _, heatmaps = compute_heatmaps(np.zeros((1, 512, 512, 1), dtype=np.float32))
+
+    assert not np.isnan(heatmaps).any()
+    assert heatmaps.max() == 0
+
+
+def test_grad_cam_reuses_preprocessed(stand_in_model, monkeypatch):
+    """grad_cam no vuelve a preprocesar si recibe la imagen preprocesada."""
+    import grad_cam as module
+
+    array = np.full((100, 120, 3), 80, dtype=np.uint8)
+    preprocessed = module.preprocess(array)
+    monkeypatch.setattr(module, "preprocess", None)
+
+    assert grad_cam(array, preprocessed).shape == array.shape
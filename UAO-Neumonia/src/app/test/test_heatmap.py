@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+
+from heatmap import JET_LUT, colorize, render_overlay
+
+
+def _legacy_superimpose(array, heatmap):
+    """Superposición anterior: JET sobre BGR a resolución completa y volteo."""
+    if array.ndim == 2:
+        array = cv2.cvtColor(array, cv2.COLOR_GRAY2BGR)
+    heatmap = cv2.resize(heatmap, (array.shape[1], array.shape[0]))
+    heatmap = cv2.applyColorMap(np.uint8(255 * heatmap), cv2.COLORMAP_JET)
+    return cv2.addWeighted(array, 0.8, heatmap, 0.2, 0)[:, :, ::-1]
+
+
+def test_full_resolution_matches_legacy():
+    """A resolución completa el resultado es idéntico al anterior."""
+    rng = np.random.default_rng(14)
+    cam = rng.random((32, 32), dtype=np.float32)
+    for array in (rng.integers(0, 256, (300, 410, 3), dtype=np.uint8),
+                  rng.integers(0, 256, (300, 410), dtype=np.uint8)):
+        np.testing.assert_array_equal(render_overlay(array, cam),
+                                      _legacy_superimpose(array, cam))
+
+
+def test_display_size_and_lut():
+    """Con size se dibuja directamente al tamaño de la vista."""
+    rng = np.random.default_rng(15)
+    array = rng.integers(0, 256, (2000, 1800, 3), dtype=np.uint8)
+    cam = rng.random((32, 32), dtype=np.float32)
+
+    assert render_overlay(array, cam, (250, 250)).shape == (250, 250, 3)
+    assert colorize(cam).shape == (32, 32, 3)
+    expected = cv2.applyColorMap(np.uint8(255 * cam), cv2.COLORMAP_JET)[:, :, ::-1]
+    np.testing.assert_array_equal(JET_LUT[np.uint8(255 * cam)], expected)
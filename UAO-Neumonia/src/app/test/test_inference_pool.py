@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from inference_pool import InferencePool, cpu_sets
+
+
+@pytest.fixture
+def arrays():
+    rng = np.random.default_rng(9)
+    return [rng.integers(0, 256, (200, 220, 3), dtype=np.uint8) for _ in range(5)]
+
+
+def test_cpu_sets_are_disjoint():
+    """Los conjuntos de CPU no se superponen y cubren todas las disponibles."""
+    import os
+
+    available = sorted(os.sched_getaffinity(0))
+    sets = cpu_sets(len(available))
+
+    assert sorted(c for s in sets for c in s) == available
+    assert len(cpu_sets(len(available) + 2)) == len(available) + 2
+
+
+def test_in_process_pool_is_thread_safe(stand_in_model, arrays, monkeypatch):
+    """Varios hilos pueden compartir el pool y obtienen lo mismo que en serie."""
+    import integrator
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", False)
+
+    pool = InferencePool(workers=0, batch_size=2)
+    expected = pool.predict_batch(arrays)
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        results = list(callers.map(pool.predict, arrays * 2))
+
+    for (label, proba, cam), (label_e, proba_e, cam_e) in zip(results, expected * 2):
+        assert label == label_e
+        assert proba == pytest.approx(proba_e, abs=1e-3)
+        np.testing.assert_allclose(cam, cam_e, atol=1e-4)
+
+
+def test_replica_processes(stand_in_model, arrays, monkeypatch):
+    """Las réplicas en procesos aparte devuelven lo mismo, en el orden de entrada."""
+    import integrator
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", False)
+    # Las réplicas importan integrator de nuevo y leen la variable de entorno
+    monkeypatch.setenv("NEUMONIA_CACHE", "0")
+    expected = InferencePool(workers=0).predict_batch(arrays, heatmaps=False)
+
+    with InferencePool(workers=2, batch_size=2, pin=True,
+                       model_path=stand_in_model) as pool:
+        assert len(pool.start()) == 2
+        results = pool.predict_batch(arrays, heatmaps=False)
+        assert pool.submit([]).result(timeout=3) == []
+
+    assert [r[0] for r in results] == [r[0] for r in expected]
+    assert [r[1] for r in results] == pytest.approx([r[1] for r in expected], abs=1e-3)
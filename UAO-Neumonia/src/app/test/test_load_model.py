@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+
+import load_model
+
+
+def test_get_model_loads_once(stand_in_model, monkeypatch):
+    """Verifica que el modelo se deserialice una sola vez por proceso."""
+    calls = []
+    original = load_model.load_model
+
+    def counting_load(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(load_model, "load_model", counting_load)
+    first = load_model.get_model()
+    second = load_model.get_model()
+
+    assert first is second
+    assert len(calls) == 1
+    assert load_model.is_loaded()
+
+
+def test_get_model_thread_safe(stand_in_model):
+    """Verifica que varios hilos concurrentes obtengan la misma instancia."""
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(load_model.get_model()))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 4
+    assert all(m is results[0] for m in results)
+
+
+def test_get_grad_model_cached(stand_in_model):
+    """Verifica que el submodelo de Grad-CAM se construya una sola vez."""
+    grad_model = load_model.get_grad_model()
+
+    assert grad_model is load_model.get_grad_model()
+    conv, preds = grad_model(np.zeros((1, 512, 512, 1), dtype=np.float32))
+    assert preds.shape == (1, 3)
+    layer = load_model.get_model().get_layer("conv10_thisone")
+    assert conv.shape[-1] == layer.output.shape[-1]
+
+
+def test_evict_and_reload(stand_in_model):
+    """Verifica que evict() y reload() descarten el modelo en caché."""
+    first = load_model.get_model()
+    reloaded = load_model.reload()
+
+    assert reloaded is not first
+    assert load_model.get_model() is reloaded
+
+    load_model.evict()
+    assert not load_model.is_loaded()
+
+
+def test_imports_do_not_load_tensorflow():
+    """Importar integrator (lo que hace la interfaz) no carga TensorFlow."""
+    code = (
+        "import sys, integrator, prediction, load_model; "
+        "sys.exit('tensorflow' in sys.modules)"
+    )
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=app_dir)
+
+    assert result.returncode == 0
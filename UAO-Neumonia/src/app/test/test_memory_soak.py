@@ -0,0 +1,65 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+# Estudios cargados en secuencia; NEUMONIA_SOAK_STUDIES permite una prueba más larga
+STUDIES = int(os.environ.get("NEUMONIA_SOAK_STUDIES", "200"))
+WARM_UP = 20
+# Crecimiento tolerado del RSS después del calentamiento (MB)
+MAX_GROWTH_MB = 40
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise KeyError("VmRSS")
+
+
+@pytest.fixture
+def low_memory(monkeypatch):
+    import integrator
+    from preprocess_img import buffer_pool
+
+    monkeypatch.setattr(integrator, "LOW_MEMORY", True)
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", False)
+    monkeypatch.setattr(buffer_pool, "max_buffers", 1)
+    yield
+    integrator.release_memory()
+
+
+@pytest.fixture
+def studies(tmp_path):
+    """Cuatro radiografías JPG grandes, distintas entre sí."""
+    rng = np.random.default_rng(8)
+    paths = []
+    for i in range(4):
+        path = str(tmp_path / f"placa{i}.jpg")
+        cv2.imwrite(path, rng.integers(0, 256, (2048, 1792), dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="Solo Linux")
+def test_rss_stays_flat_over_many_studies(stand_in_model, low_memory, studies):
+    """Cargar cientos de estudios seguidos, como la interfaz, no hace crecer la memoria."""
+    from integrator import read_jpg, release_memory
+    from main import App
+
+    current = None
+    baseline = None
+    for i in range(STUDIES):
+        study = App._read_study(read_jpg, studies[i % len(studies)])
+        # Como en la interfaz: el estudio nuevo reemplaza al anterior
+        current = App._infer(study)
+        assert current[0]["array"].shape[:2] == (512, 512)
+        if i == WARM_UP:
+            release_memory()
+            baseline = _rss_mb()
+
+    release_memory()
+    growth = _rss_mb() - baseline
+    assert growth < MAX_GROWTH_MB, f"El RSS creció {growth:.1f} MB"
@@ -0,0 +1,81 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+@pytest.fixture
+def jpg_path(tmp_path):
+    rng = np.random.default_rng(11)
+    path = str(tmp_path / "placa.jpg")
+    cv2.imwrite(path, rng.integers(0, 256, (300, 300, 3), dtype=np.uint8))
+    return path
+
+
+def _stages():
+    return {h["labels"]["stage"]: h for h in metrics.snapshot()["histograms"]}
+
+
+def test_disabled_records_nothing():
+    """Sin activar, span es un contexto compartido y no se registra nada."""
+    metrics.reset()
+    assert not metrics.is_enabled()
+    assert metrics.span("a") is metrics.span("b")
+
+    with metrics.span("a"):
+        metrics.inc("images_decoded_total")
+
+    assert metrics.snapshot() == {"counters": [], "histograms": []}
+
+
+def test_pipeline_is_instrumented(stand_in_model, jpg_path, enabled):
+    """Lectura, preprocesamiento, predicción y Grad-CAM quedan medidos."""
+    from heatmap import render_overlay
+    from prediction import predict
+    from read_img import read_jpg_file
+
+    array, _ = read_jpg_file(jpg_path)
+    _, _, cam = predict(array)
+    render_overlay(array, cam, (250, 250))
+
+    stages = _stages()
+    for stage in ("read_jpg", "preprocess", "predict", "grad_cam_forward",
+                  "heatmap_render"):
+        assert stages[stage]["count"] == 1
+        assert stages[stage]["buckets"]["+Inf"] == 1
+    counters = {(c["name"], tuple(c["labels"].values())): c["value"]
+                for c in metrics.snapshot()["counters"]}
+    assert counters[("neumonia_images_decoded_total", ("image",))] == 1
+    assert counters[("neumonia_bytes_decoded_total", ("image",))] == 300 * 300 * 3
+    assert counters[("neumonia_images_predicted_total", ())] == 1
+
+
+def test_export_formats(tmp_path, enabled):
+    """Exporta en JSON y en formato de texto de Prometheus."""
+    metrics.observe("read_dicom", 0.003)
+    metrics.observe("read_dicom", 2.0)
+    metrics.inc("cache_hits_total", 2)
+
+    text = metrics.to_prometheus()
+    assert "# TYPE neumonia_stage_seconds histogram" in text
+    assert 'neumonia_stage_seconds_bucket{stage="read_dicom",le="0.005"} 1' in text
+    assert 'neumonia_stage_seconds_bucket{stage="read_dicom",le="+Inf"} 2' in text
+    assert "neumonia_cache_hits_total 2" in text
+
+    metrics.write(str(tmp_path / "m.json"))
+    metrics.write(str(tmp_path / "m.prom"))
+    data = json.loads((tmp_path / "m.json").read_text())
+    assert data["histograms"][0]["count"] == 2
+    assert (tmp_path / "m.prom").read_text() == text
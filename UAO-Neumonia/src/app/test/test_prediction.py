@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+
+import load_model
+from prediction import LABELS, predict, predict_batch
+from preprocess_img import preprocess
+
+
+@pytest.fixture
+def sample_array():
+    """Imagen BGR sintética como la que entrega read_dicom_file."""
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+
+
+def test_predict_contract(stand_in_model, sample_array):
+    """Verifica que predict mantenga el contrato (label, proba, heatmap)."""
+    label, proba, heatmap = predict(sample_array)
+
+    assert label in LABELS
+    assert 0.0 <= proba <= 100.0
+    # El mapa crudo, a la resolución de conv10_thisone
+    assert heatmap.shape == (64, 64)
+    assert heatmap.dtype == np.float32
+    assert 0.0 <= heatmap.min() and heatmap.max() <= 1.0
+
+
+def test_predict_matches_model_output(stand_in_model, sample_array):
+    """La pasada fusionada debe coincidir con una inferencia directa del modelo."""
+    model = load_model.get_model()
+    expected = model(preprocess(sample_array), training=False).numpy()[0]
+
+    label, proba, _ = predict(sample_array)
+
+    assert label == LABELS[int(np.argmax(expected))]
+    assert proba == pytest.approx(float(np.max(expected)) * 100, rel=1e-5)
+
+
+def test_predict_batch_matches_predict(stand_in_model):
+    """predict_batch debe devolver lo mismo que predict, en el orden de entrada."""
+    rng = np.random.default_rng(1)
+    arrays = [
+        rng.integers(0, 256, (200 + 10 * i, 240, 3), dtype=np.uint8)
+        for i in range(5)
+    ]
+
+    batched = predict_batch(arrays, batch_size=2)
+    single = [predict(a) for a in arrays]
+
+    assert len(batched) == len(arrays)
+    for (label_b, proba_b, heat_b), (label_s, proba_s, heat_s) in zip(batched, single):
+        assert label_b == label_s
+        assert proba_b == pytest.approx(proba_s, abs=1e-3)
+        np.testing.assert_allclose(heat_b, heat_s, atol=1e-4)
+
+
+def test_predict_batch_without_heatmaps(stand_in_model):
+    """Con heatmaps=False no se calcula el Grad-CAM."""
+    arrays = [np.full((128, 128, 3), 100, dtype=np.uint8)] * 3
+
+    results = predict_batch(arrays, batch_size=4, heatmaps=False)
+
+    assert [r[2] for r in results] == [None, None, None]
+    assert predict_batch([]) == []
+
+
+def test_predict_study_aggregates_frames(stand_in_model):
+    """predict_study combina por lotes las probabilidades de todos los cuadros."""
+    from prediction import predict_study
+    from preprocess_img import preprocess_batch
+
+    rng = np.random.default_rng(3)
+    frames = [rng.integers(0, 256, (256, 256, 3), dtype=np.uint8) for _ in range(7)]
+    expected = load_model.get_model()(preprocess_batch(frames)).numpy()
+
+    by_max = predict_study(iter(frames), batch_size=3, aggregate="max")
+    by_mean = predict_study(iter(frames), batch_size=3, aggregate="mean")
+
+    assert by_max["frames"] == 7
+    np.testing.assert_allclose(by_max["max"], expected.max(axis=0), atol=1e-5)
+    np.testing.assert_allclose(by_mean["mean"], expected.mean(axis=0), atol=1e-5)
+    assert by_max["label"] == LABELS[int(expected.max(axis=0).argmax())]
+    assert by_mean["label"] == LABELS[int(expected.mean(axis=0).argmax())]
+    column = LABELS.index(by_max["label"])
+    assert by_max["peak_frame"] == int(expected[:, column].argmax())
+    with pytest.raises(ValueError):
+        predict_study(iter([]))
+
+
+def test_needs_heatmap():
+    """En modo auto, el Grad-CAM se pide para clases anormales o baja confianza."""
+    from prediction import needs_heatmap
+
+    assert needs_heatmap("bacteriana", 99.0, threshold=90)
+    assert needs_heatmap("normal", 60.0, threshold=90)
+    assert not needs_heatmap("normal", 95.0, threshold=90)
+
+
+def test_heatmap_modes(stand_in_model, sample_array):
+    """never omite el mapa; lazy lo calcula al pedirlo e igual al de always."""
+    from prediction import LazyHeatmap, resolve_heatmap
+
+    label, proba, expected = predict(sample_array)
+    fast_label, fast_proba, none = predict(sample_array, heatmap="never")
+    assert none is None
+    assert fast_label == label and fast_proba == pytest.approx(proba, abs=1e-3)
+
+    _, _, lazy = predict(sample_array, heatmap="lazy")
+    assert isinstance(lazy, LazyHeatmap) and not lazy.computed
+    np.testing.assert_allclose(resolve_heatmap(lazy), expected, atol=1e-4)
+    assert lazy.computed and lazy.get() is lazy.get()
+
+    with pytest.raises(ValueError):
+        predict(sample_array, heatmap="a veces")
+
+
+def test_auto_policy(stand_in_model, monkeypatch):
+    """auto calcula ya los mapas que hacen falta y deja el resto bajo demanda."""
+    import prediction
+    from prediction import LazyHeatmap
+
+    arrays = [np.full((128, 128, 3), 30 * i, dtype=np.uint8) for i in range(3)]
+
+    # Umbral inalcanzable: todos los resultados son de baja confianza
+    monkeypatch.setattr(prediction, "CONFIDENCE_THRESHOLD", 101.0)
+    eager = predict_batch(arrays, batch_size=2, heatmaps="auto")
+    assert all(isinstance(r[2], np.ndarray) for r in eager)
+
+    # Ningún resultado necesita el mapa: todos quedan bajo demanda
+    monkeypatch.setattr(prediction, "needs_heatmap", lambda label, proba: False)
+    deferred = predict_batch(arrays, batch_size=2, heatmaps="auto")
+    assert all(isinstance(r[2], LazyHeatmap) and not r[2].computed for r in deferred)
+    for (_, _, cam), (_, _, lazy) in zip(eager, deferred):
+        np.testing.assert_allclose(lazy.get(), cam, atol=1e-4)
+
+
+def test_maps_follow_backend_class(stand_in_model, sample_array, monkeypatch):
+    """Los mapas de auto y lazy explican la clase del motor, no la de Keras."""
+    import prediction
+    from grad_cam import compute_heatmaps
+
+    batch = preprocess(sample_array)
+    keras_class = int(np.argmax(load_model.get_model()(batch).numpy()[0]))
+    # Una clase anormal distinta de la de Keras: "auto" calcula su mapa enseguida
+    other = next(i for i, label in enumerate(LABELS)
+                 if label != "normal" and i != keras_class)
+    probabilities = np.eye(len(LABELS), dtype=np.float32)[[other]]
+    monkeypatch.setattr(prediction, "get_predictor", lambda: lambda chunk: probabilities)
+    expected = compute_heatmaps(batch, [other])[1][0]
+
+    label, _, eager = prediction.predict_preprocessed(batch, heatmaps="auto")[0]
+    monkeypatch.setattr(prediction, "needs_heatmap", lambda label, proba: False)
+    _, _, lazy = prediction.predict_preprocessed(batch, heatmaps="auto")[0]
+
+    assert label == LABELS[other]
+    np.testing.assert_allclose(eager, expected, atol=1e-5)
+    np.testing.assert_allclose(lazy.get(), expected, atol=1e-5)
+    # Sin mapas diferidos: None, sin copia de la imagen
+    assert prediction.predict_preprocessed(batch, heatmaps="auto",
+                                           lazy_maps=False)[0][2] is None
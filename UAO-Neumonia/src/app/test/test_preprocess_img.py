@@ -0,0 +1,84 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from preprocess_img import BufferPool, preprocess, preprocess_batch
+
+
+def _legacy_preprocess(array):
+    """Preprocesamiento original, como referencia."""
+    array = cv2.resize(array, (512, 512))
+    array = cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4))
+    array = clahe.apply(array)
+    array = array / 255
+    array = np.expand_dims(array, axis=-1)
+    array = np.expand_dims(array, axis=0)
+    return array
+
+
+@pytest.fixture
+def bgr_image():
+    rng = np.random.default_rng(3)
+    return rng.integers(0, 256, (700, 600, 3), dtype=np.uint8)
+
+
+def test_preprocess_matches_legacy(bgr_image):
+    """El resultado en float32 coincide con el preprocesamiento original."""
+    result = preprocess(bgr_image)
+
+    assert result.shape == (1, 512, 512, 1)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, _legacy_preprocess(bgr_image), atol=1e-6)
+
+
+def test_preprocess_gray_input(bgr_image):
+    """Las imágenes de un canal (como las de read_jpg_file) también se aceptan."""
+    gray = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY)
+    as_bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    np.testing.assert_allclose(preprocess(gray), preprocess(as_bgr), atol=1e-6)
+
+
+def test_preprocess_writes_into_buffer(bgr_image):
+    """Con `out` el resultado se escribe en el buffer del llamador."""
+    out = np.zeros((1, 512, 512, 1), dtype=np.float32)
+
+    assert preprocess(bgr_image, out=out) is out
+    assert out.max() > 0
+
+
+def test_preprocess_batch(bgr_image):
+    """preprocess_batch llena un buffer contiguo en el orden de entrada."""
+    arrays = [bgr_image, cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY),
+              np.zeros((300, 300, 3), dtype=np.uint8)]
+    pool = BufferPool()
+    buffer = pool.acquire(4)
+
+    batch = preprocess_batch(arrays, out=buffer)
+
+    assert batch.shape == (3, 512, 512, 1)
+    assert batch.flags["C_CONTIGUOUS"]
+    for array, row in zip(arrays, batch):
+        np.testing.assert_array_equal(row, preprocess(array)[0])
+    pool.release(buffer)
+    assert pool.acquire(2) is buffer
+
+
+def test_preprocess_thread_safe(bgr_image):
+    """Cada hilo usa su propio CLAHE y sus propios buffers intermedios."""
+    expected = preprocess(bgr_image)
+    results = []
+
+    def work():
+        results.append(preprocess(bgr_image))
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(np.array_equal(r, expected) for r in results)
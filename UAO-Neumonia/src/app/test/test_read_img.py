@@ -145,3 +145,118 @@ def test_read_jpg_mock():
         assert img is not None
         assert img_pil is not None
         assert isinstance(img, np.ndarray)
+
+
+@pytest.fixture
+def sample_dicom16_path(tmp_path):
+    """Crea un DICOM de 16 bits, más grande que la entrada del modelo."""
+    dcm_path = tmp_path / "test16.dcm"
+
+    import pydicom
+    from pydicom.dataset import FileDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    meta = pydicom.dataset.FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = FileDataset(dcm_path, {}, file_meta=meta, preamble=b"\0" * 128)
+    pixels = np.random.randint(0, 4096, (768, 1024), dtype=np.uint16)
+    ds.PixelData = pixels.tobytes()
+    ds.Rows = 768
+    ds.Columns = 1024
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.SamplesPerPixel = 1
+    ds.PixelRepresentation = 0
+
+    ds.save_as(dcm_path)
+    return str(dcm_path)
+
+
+def test_read_dicom_file_downsampled(sample_dicom16_path):
+    """Con target_size la imagen se entrega ya reducida para el modelo y la vista."""
+    img_rgb, img_pil = read_dicom_file(
+        sample_dicom16_path, target_size=(512, 512), display_size=(250, 250)
+    )
+
+    assert img_rgb.shape == (512, 512, 3)
+    assert img_rgb.dtype == np.uint8
+    assert img_pil.size == (250, 250)
+
+
+def test_read_dicom_file_downsampled_matches_full(sample_dicom16_path):
+    """La ruta liviana debe parecerse a reducir el resultado completo."""
+    import cv2
+
+    full_rgb, _ = read_dicom_file(sample_dicom16_path)
+    lean_rgb, _ = read_dicom_file(sample_dicom16_path, target_size=(512, 512))
+    expected = cv2.resize(full_rgb, (512, 512), interpolation=cv2.INTER_AREA)
+
+    diff = np.abs(lean_rgb.astype(int) - expected.astype(int))
+    assert diff.max() <= 2
+
+
+@pytest.fixture
+def multiframe_dicom_path(tmp_path):
+    """Crea un DICOM multicuadro de 16 bits con 5 cuadros distintos."""
+    dcm_path = tmp_path / "multi.dcm"
+
+    import pydicom
+    from pydicom.dataset import FileDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    meta = pydicom.dataset.FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = FileDataset(dcm_path, {}, file_meta=meta, preamble=b"\0" * 128)
+    pixels = np.stack([np.full((96, 128), 100 * (i + 1), dtype=np.uint16)
+                       for i in range(5)])
+    pixels[:, :48] = 0
+    ds.PixelData = pixels.tobytes()
+    ds.NumberOfFrames = 5
+    ds.Rows = 96
+    ds.Columns = 128
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.SamplesPerPixel = 1
+    ds.PixelRepresentation = 0
+
+    ds.save_as(dcm_path)
+    return str(dcm_path)
+
+
+def test_iter_dicom_frames_multiframe(multiframe_dicom_path):
+    """Cada cuadro se entrega por separado, ya reducido y normalizado."""
+    from app.read_img import count_frames, iter_dicom_frames
+
+    frames = iter_dicom_frames(multiframe_dicom_path, target_size=(64, 64))
+
+    assert count_frames(multiframe_dicom_path) == 5
+    assert next(frames).shape == (64, 64, 3)
+    assert len(list(frames)) == 4
+
+
+def test_read_dicom_file_multiframe_first_frame(multiframe_dicom_path):
+    """Un DICOM multicuadro se lee como su primer cuadro."""
+    img_rgb, img_pil = read_dicom_file(multiframe_dicom_path)
+
+    assert img_rgb.shape == (96, 128, 3)
+    assert img_pil.size == (128, 96)
+
+
+def test_read_jpg_file_downsampled(tmp_path):
+    """Con target_size la JPG se decodifica reducida, sin copia a resolución completa."""
+    import cv2
+
+    path = str(tmp_path / "grande.jpg")
+    cv2.imwrite(path, np.random.randint(0, 256, (2400, 2000, 3), dtype=np.uint8))
+
+    img, img_pil = read_jpg_file(path, target_size=(512, 512), display_size=(250, 250))
+
+    assert img.shape == (512, 512)
+    assert img.dtype == np.uint8
+    assert img_pil.size == (250, 250)
@@ -0,0 +1,62 @@
+import csv
+
+import cv2
+import numpy as np
+import pytest
+
+from report import (PAGE_SIZE, jobs_from_results, read_results, render_page,
+                    render_reports, write_report)
+
+
+@pytest.fixture
+def study_dir(tmp_path):
+    """Carpeta con tres radiografías JPG de prueba."""
+    rng = np.random.default_rng(2)
+    root = tmp_path / "estudios"
+    root.mkdir()
+    for i in range(3):
+        cv2.imwrite(str(root / f"paciente{i}.jpg"),
+                    rng.integers(0, 256, (300, 280), dtype=np.uint8))
+    return root
+
+
+def test_write_report_without_display(tmp_path):
+    """El reporte se arma desde los datos: un PDF de una página, sin capturas."""
+    rng = np.random.default_rng(5)
+    array = rng.integers(0, 256, (512, 512, 3), dtype=np.uint8)
+    cam = rng.random((32, 32), dtype=np.float32)
+
+    path = write_report(str(tmp_path / "r.pdf"), array, cam, "123-A",
+                        "bacteriana", 97.43, model_version="m.h5@abc")
+
+    data = open(path, "rb").read()
+    assert data.startswith(b"%PDF")
+    assert data.count(b"/Type /Page") - data.count(b"/Type /Pages") == 1
+    page = render_page(np.zeros((540, 540, 3), np.uint8), None, "1", "normal", 50)
+    assert page.size == PAGE_SIZE
+
+
+def test_render_reports_from_results(study_dir, tmp_path):
+    """Los resultados de batch_scan se convierten en un PDF por estudio, en paralelo."""
+    results = tmp_path / "resultados.csv"
+    heatmaps = tmp_path / "heatmaps"
+    heatmaps.mkdir()
+    cv2.imwrite(str(heatmaps / "paciente0.png"),
+                np.full((300, 280, 3), 128, np.uint8))
+    with open(results, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=("path", "label", "proba", "error"))
+        w.writeheader()
+        for path in sorted(study_dir.iterdir()):
+            w.writerow({"path": str(path), "label": "normal", "proba": 88.5,
+                        "error": ""})
+        w.writerow({"path": str(study_dir / "roto.jpg"), "label": "",
+                    "proba": "", "error": "No se pudo leer el archivo."})
+
+    jobs = jobs_from_results(read_results(str(results)), str(tmp_path / "pdf"),
+                             str(heatmaps), str(study_dir))
+    assert [j["patient_id"] for j in jobs] == ["paciente0", "paciente1", "paciente2"]
+
+    stats = render_reports(jobs, workers=2)
+
+    assert stats == {"written": 3, "failed": 0}
+    assert len(list((tmp_path / "pdf").glob("*.pdf"))) == 3
@@ -0,0 +1,193 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from result_cache import ResultCache, model_fingerprint, study_hash
+
+
+@pytest.fixture
+def array():
+    rng = np.random.default_rng(4)
+    return rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def result():
+    heatmap = np.full((64, 64, 3), 7, dtype=np.uint8)
+    return ("viral", 87.5, heatmap)
+
+
+def test_get_put_and_counters(tmp_path, array, result):
+    """Una entrada guardada se recupera y se cuentan aciertos y fallos."""
+    cache = ResultCache(str(tmp_path))
+
+    assert cache.get(array, "modelo") is None
+    cache.put(array, "modelo", result)
+    label, proba, heatmap = cache.get(array, "modelo")
+
+    assert (label, proba) == ("viral", 87.5)
+    np.testing.assert_array_equal(heatmap, result[2])
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (1, 1, 1)
+
+
+def test_other_model_misses(tmp_path, array, result):
+    """Otra huella de modelo no reutiliza las entradas anteriores."""
+    cache = ResultCache(str(tmp_path))
+    cache.put(array, "modelo-a", result)
+
+    assert cache.get(array, "modelo-b") is None
+    assert cache.get(array.copy(), "modelo-a") is not None
+
+
+def test_model_fingerprint_changes_with_file(tmp_path):
+    """Cambiar el archivo del modelo cambia su huella."""
+    path = tmp_path / "modelo.h5"
+    path.write_bytes(b"pesos v1")
+    first = model_fingerprint(str(path))
+    path.write_bytes(b"pesos v2, distintos")
+
+    assert model_fingerprint(str(path)) != first
+    assert model_fingerprint(str(tmp_path / "no_existe.h5")) is None
+
+
+def test_lru_eviction(tmp_path, result):
+    """Al superar el límite se desalojan las entradas menos usadas."""
+    rng = np.random.default_rng(5)
+    noisy = ("normal", 50.0, rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+    arrays = [np.full((8, 8), i, dtype=np.uint8) for i in range(6)]
+    cache = ResultCache(str(tmp_path), max_bytes=10 ** 9)
+    cache.put(arrays[0], "m", noisy)
+    entry_size = cache.stats()["bytes"]
+    cache.max_bytes = int(entry_size * 3.5)
+
+    for i, array in enumerate(arrays[1:], start=1):
+        # La primera entrada se sigue usando, así que no debe desalojarse
+        recent = time.time_ns() + i * 10 ** 9
+        os.utime(cache._path(cache.key(arrays[0], "m")), ns=(recent, recent))
+        cache.put(array, "m", noisy)
+
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.stats()["evictions"] > 0
+    assert cache.get(arrays[0], "m") is not None
+    assert cache.get(arrays[1], "m") is None
+
+
+def test_size_is_shared_between_processes(tmp_path, monkeypatch):
+    """Reemplazar una clave no suma dos veces y el límite cuenta a otros procesos."""
+    import result_cache
+
+    monkeypatch.setattr(result_cache, "SYNC_EVERY", 4)
+    rng = np.random.default_rng(6)
+    noisy = ("normal", 50.0, rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+    arrays = [np.full((8, 8), i, dtype=np.uint8) for i in range(4)]
+    first = ResultCache(str(tmp_path), max_bytes=10 ** 9)
+    first.put(arrays[0], "m", noisy)
+    entry_size = first.stats()["bytes"]
+    first.put(arrays[0], "m", noisy)
+    assert first.stats()["bytes"] == entry_size
+
+    # Otra instancia (otro proceso) llena el directorio compartido
+    other = ResultCache(str(tmp_path), max_bytes=10 ** 9)
+    for array in arrays[1:3]:
+        other.put(array, "m", noisy)
+    first.max_bytes = int(entry_size * 3.5)
+    walks = []
+    original = first._entries
+    monkeypatch.setattr(first, "_entries", lambda: walks.append(1) or original())
+
+    # Lejos del límite estimado no se recorre el directorio en cada escritura
+    first.put(arrays[3], "m", noisy)
+    assert walks == [] and first.stats()["evictions"] == 0
+    # La medición periódica ve las entradas del otro proceso y desaloja
+    first.put(arrays[3], "m", noisy)
+    assert walks == [1]
+    assert first.stats()["evictions"] > 0
+    assert first.stats()["bytes"] <= first.max_bytes
+
+
+def test_corrupt_entry_is_a_miss(tmp_path, array, result):
+    """Una entrada dañada se trata como un fallo, sin lanzar excepciones."""
+    cache = ResultCache(str(tmp_path))
+    cache.put(array, "m", result)
+    with open(cache._path(cache.key(array, "m")), "wb") as f:
+        f.write(b"incompleto")
+
+    assert cache.get(array, "m") is None
+
+
+def test_integrator_uses_cache(stand_in_model, tmp_path, monkeypatch, array):
+    """integrator.prediction reutiliza el resultado guardado."""
+    import integrator
+
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", True)
+    monkeypatch.setattr(integrator, "_cache", ResultCache(str(tmp_path)))
+    calls = []
+    original = integrator.predict
+    monkeypatch.setattr(
+        integrator, "predict", lambda a, *args: calls.append(1) or original(a, *args)
+    )
+
+    first = integrator.prediction(array)
+    second = integrator.prediction(array)
+
+    assert len(calls) == 1
+    assert first[0] == second[0]
+    assert first[1] == pytest.approx(second[1])
+    assert integrator.cache_stats()["hits"] == 1
+    assert study_hash(array) == study_hash(array.copy())
+
+
+def test_integrator_caches_lazy_heatmap(stand_in_model, tmp_path, monkeypatch, array):
+    """Sin mapa se guardan clase y probabilidad; el mapa se agrega al calcularse."""
+    import integrator
+    from prediction import LazyHeatmap
+
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", True)
+    monkeypatch.setattr(integrator, "_cache", ResultCache(str(tmp_path)))
+    calls = []
+    original = integrator.predict
+    monkeypatch.setattr(
+        integrator, "predict", lambda a, *args: calls.append(1) or original(a, *args)
+    )
+
+    label, _, lazy = integrator.prediction(array, heatmap="lazy")
+    assert isinstance(lazy, LazyHeatmap)
+    assert integrator.cache_stats()["writes"] == 1
+
+    # Acierto sin mapa: otro manejador diferido, sin volver a clasificar
+    again = integrator.prediction(array, heatmap="lazy")
+    assert again[0] == label and isinstance(again[2], LazyHeatmap)
+    assert integrator.prediction(array, heatmap="never")[2] is None
+
+    cam = integrator.render_heatmap(array, lazy, (32, 32))
+    assert cam.shape == (32, 32, 3)
+    assert integrator.cache_stats()["writes"] == 2
+    cached = integrator.prediction(array, heatmap="lazy")
+    assert cached[0] == label
+    np.testing.assert_array_equal(cached[2], lazy.get())
+    assert len(calls) == 1
+
+
+def test_integrator_computes_missing_heatmap(stand_in_model, tmp_path, monkeypatch,
+                                             array):
+    """Un acierto sin mapa en modo always calcula el mapa de la clase guardada."""
+    import integrator
+
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", True)
+    monkeypatch.setattr(integrator, "_cache", ResultCache(str(tmp_path)))
+
+    label, proba, heatmap = integrator.prediction_batch([array], heatmaps=False)[0]
+    assert heatmap is None
+    assert integrator.cache_stats()["writes"] == 1
+
+    classified = []
+    monkeypatch.setattr(integrator, "predict_batch",
+                        lambda arrays, **kwargs: classified.extend(arrays) or [])
+    cached = integrator.prediction_batch([array], heatmaps=True)[0]
+    assert classified == []
+    assert cached[:2] == (label, proba)
+    np.testing.assert_allclose(cached[2], integrator.predict(array)[2], atol=1e-4)
+    assert integrator.cache_stats()["writes"] == 2
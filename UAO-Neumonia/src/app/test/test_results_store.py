@@ -0,0 +1,72 @@
+import csv
+import datetime
+import io
+
+from results_store import ResultsStore
+
+
+def _at(day, hour=12):
+    return datetime.datetime(2024, 3, day, hour, tzinfo=datetime.timezone.utc)
+
+
+def test_lookup_by_patient_and_date(tmp_path):
+    """Los resultados se consultan por paciente y por rango de fechas."""
+    with ResultsStore(str(tmp_path / "h.db")) as store:
+        with store.writer(batch_size=2) as writer:
+            writer.add("123", "viral", 91.5, study_hash="a", timestamp=_at(3))
+            writer.add("456", "normal", 80.0, study_hash="b", timestamp=_at(2))
+            writer.add("123", "bacteriana", 70.25, timestamp=_at(1))
+
+        assert store.count() == 3
+        rows = store.by_patient("123")
+        assert [r["label"] for r in rows] == ["bacteriana", "viral"]
+        assert rows[1]["proba"] == 91.5
+        assert [r["label"] for r in store.by_patient("123", start=_at(2))] == ["viral"]
+        assert [r["patient_id"] for r in store.between(_at(2), _at(3))] == ["456"]
+        assert store.by_study("b")[0]["patient_id"] == "456"
+
+
+def test_export_csv_streams_rows(tmp_path):
+    """La exportación escribe un CSV con encabezado, en orden cronológico."""
+    with ResultsStore(str(tmp_path / "h.db")) as store:
+        store.add_many([
+            {"patient_id": f"p{i}", "label": "normal", "proba": i,
+             "timestamp": _at(1 + i)}
+            for i in range(5)
+        ])
+        out = io.StringIO()
+
+        assert store.export_csv(out, start=_at(2), chunk=2) == 4
+
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [r["patient_id"] for r in rows] == ["p1", "p2", "p3", "p4"]
+
+
+def test_import_historial_once(tmp_path):
+    """El historial.csv antiguo se importa una sola vez, incluso con IDs con guiones."""
+    old = tmp_path / "historial.csv"
+    old.write_text("123-bacteriana-97.43%\r\n12-34-normal-88.00%\r\nbasura\r\n")
+
+    with ResultsStore(str(tmp_path / "h.db")) as store:
+        assert store.import_historial(str(old)) == 2
+        assert store.import_historial(str(old)) == 0
+
+        rows = store.by_patient("12-34")
+        assert len(rows) == 1
+        assert (rows[0]["label"], rows[0]["proba"]) == ("normal", 88.0)
+        assert rows[0]["source"] == "historial.csv"
+
+
+def test_journal_written_with_results(tmp_path):
+    """El diario de archivos se escribe en la misma transacción que los resultados."""
+    db = str(tmp_path / "h.db")
+    with ResultsStore(db) as store:
+        store.add_many(
+            [{"patient_id": "1", "label": "normal", "proba": 90.0}],
+            journal=[("/in/a.dcm", 10, 1, None), ("/in/roto.dcm", 3, 2, "ilegible")],
+        )
+        store.add_many([], journal=[("/in/a.dcm", 12, 5, None)])
+
+    with ResultsStore(db) as store:
+        assert store.count() == 1
+        assert store.processed() == {"/in/a.dcm": (12, 5), "/in/roto.dcm": (3, 2)}
@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import integrator
+from prediction import needs_heatmap
+from server import InferenceServer
+
+
+async def _request(port, method, path, body=b"", content_type="image/jpeg"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """La caché de resultados (y /metrics) usan una carpeta temporal, no ~/.cache."""
+    monkeypatch.setattr(integrator, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(integrator, "_cache", None)
+    monkeypatch.setenv("NEUMONIA_CACHE_DIR", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def jpg_bytes():
+    rng = np.random.default_rng(8)
+    image = rng.integers(0, 256, (96, 96, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+@pytest.fixture
+def no_warm_up(monkeypatch):
+    monkeypatch.setattr(integrator, "warm_up", lambda: None)
+
+
+def test_micro_batching_groups_requests(jpg_bytes, no_warm_up):
+    """Peticiones concurrentes se resuelven en pocas llamadas al modelo."""
+    sizes = []
+
+    def fake_predict(arrays, heatmaps):
+        sizes.append(len(arrays))
+        return [("normal", 90.0, None)] * len(arrays)
+
+    async def run():
+        server = InferenceServer(port=0, max_batch=8, max_wait_ms=50,
+                                 predict_fn=fake_predict)
+        await server.start()
+        try:
+            replies = await asyncio.gather(*[
+                _request(server.port, "POST", "/predict", jpg_bytes)
+                for _ in range(8)
+            ])
+            metrics = (await _request(server.port, "GET", "/metrics"))[1]
+        finally:
+            await server.stop()
+        return replies, metrics
+
+    replies, metrics = asyncio.run(run())
+
+    assert all(status == 200 for status, _ in replies)
+    assert all(body == {"label": "normal", "proba": 90.0} for _, body in replies)
+    assert sum(sizes) == 8 and len(sizes) < 8
+    # 8 predicciones más la propia consulta a /metrics
+    assert metrics["requests"] == 9 and metrics["batches"] == len(sizes)
+
+
+def test_backpressure_and_errors(jpg_bytes, no_warm_up):
+    """Con la cola llena se responde 503; rutas y formatos inválidos fallan."""
+    release = asyncio.Event()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        def slow_predict(arrays, heatmaps):
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+            return [("viral", 60.0, None)] * len(arrays)
+
+        server = InferenceServer(port=0, max_batch=1, max_wait_ms=0,
+                                 max_queue=1, predict_fn=slow_predict)
+        await server.start()
+        try:
+            pending = [
+                asyncio.ensure_future(
+                    _request(server.port, "POST", "/predict", jpg_bytes))
+                for _ in range(4)
+            ]
+            # Una petición en el modelo, una en cola, el resto rechazadas
+            while server.batcher.rejected < 2:
+                await asyncio.sleep(0.01)
+            release.set()
+            replies = await asyncio.gather(*pending)
+            not_found = await _request(server.port, "GET", "/nada")
+            bad_format = await _request(server.port, "POST",
+                                        "/predict?format=gif", jpg_bytes)
+            health = await _request(server.port, "GET", "/health")
+        finally:
+            await server.stop()
+        return replies, not_found, bad_format, health
+
+    replies, not_found, bad_format, health = asyncio.run(run())
+
+    assert sorted(status for status, _ in replies) == [200, 200, 503, 503]
+    assert not_found[0] == 404 and bad_format[0] == 400
+    assert health == (200, {"status": "ok", "model_loaded": True,
+                            "queue_depth": 0})
+
+
+def test_predict_with_model(stand_in_model, jpg_bytes, monkeypatch):
+    """De extremo a extremo con el modelo de prueba, con mapa de calor."""
+    monkeypatch.setattr(integrator, "CACHE_ENABLED", False)
+
+    async def run():
+        server = InferenceServer(port=0, max_wait_ms=5)
+        await server.start()
+        try:
+            full = await _request(server.port, "POST", "/predict?heatmap=1",
+                                  jpg_bytes)
+            small = await _request(server.port, "POST",
+                                   "/predict?heatmap=1&size=50x40", jpg_bytes)
+            auto = await _request(server.port, "POST", "/predict?heatmap=auto",
+                                  jpg_bytes)
+            return full, small, auto
+        finally:
+            await server.stop()
+
+    (status, body), (_, small), (_, auto) = asyncio.run(run())
+
+    assert status == 200
+    assert body["label"] in ("bacteriana", "normal", "viral")
+    assert 0.0 <= body["proba"] <= 100.0
+    for reply, shape in ((body, (96, 96, 3)), (small, (40, 50, 3))):
+        png = np.frombuffer(base64.b64decode(reply["heatmap_png"]), np.uint8)
+        assert cv2.imdecode(png, cv2.IMREAD_COLOR).shape == shape
+    # En modo auto el mapa se incluye solo si needs_heatmap lo pide
+    assert auto["label"] == body["label"]
+    assert ("heatmap_png" in auto) == needs_heatmap(auto["label"], auto["proba"])
+
+
+def test_admission_limit_and_bad_length(jpg_bytes, no_warm_up):
+    """Más allá de max_concurrency + max_queue se responde 503 sin leer el cuerpo."""
+    release = asyncio.Event()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        def slow_predict(arrays, heatmaps):
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+            return [("viral", 60.0, None)] * len(arrays)
+
+        server = InferenceServer(port=0, max_batch=1, max_wait_ms=0,
+                                 max_queue=1, max_concurrency=1,
+                                 predict_fn=slow_predict)
+        await server.start()
+        try:
+            pending = [
+                asyncio.ensure_future(
+                    _request(server.port, "POST", "/predict", jpg_bytes))
+                for _ in range(2)
+            ]
+            while server.admitted < 2:
+                await asyncio.sleep(0.01)
+            rejected = await _request(server.port, "POST", "/predict", jpg_bytes)
+            release.set()
+            replies = await asyncio.gather(*pending)
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"POST /predict HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+            await writer.drain()
+            bad_length = await reader.read()
+            writer.close()
+            metrics = (await _request(server.port, "GET", "/metrics"))[1]
+        finally:
+            await server.stop()
+        return rejected, replies, bad_length, metrics
+
+    rejected, replies, bad_length, metrics = asyncio.run(run())
+
+    assert rejected[0] == 503
+    assert [status for status, _ in replies] == [200, 200]
+    assert bad_length.split()[1] == b"400"
+    assert metrics["rejected"] == 1
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from preprocess_img import preprocess
+from read_img import MODEL_SIZE, read_image_file
+from shm_ring import SharedRing, ring_batches
+
+
+def _segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+@pytest.fixture
+def images(tmp_path):
+    """Siete JPG de prueba y un archivo ilegible en la cuarta posición."""
+    import cv2
+
+    paths = []
+    for i in range(7):
+        path = str(tmp_path / f"estudio{i}.jpg")
+        pixels = np.random.default_rng(i).integers(0, 256, (96, 80), dtype=np.uint8)
+        cv2.imwrite(path, pixels)
+        paths.append(path)
+    broken = tmp_path / "roto.jpg"
+    broken.write_bytes(b"no es una imagen")
+    paths.insert(3, str(broken))
+    return paths
+
+
+def test_ring_attach_and_unlink():
+    """Otro proceso ve los mismos slots por nombre; al cerrar se elimina el bloque."""
+    with SharedRing(4, shape=(8, 8, 1)) as ring:
+        ring.slot(2)[:] = 7.0
+        other = SharedRing(4, shape=(8, 8, 1), name=ring.name)
+        assert other.array[2].max() == 7.0 and not other.owner
+        other.close()
+        name = ring.name
+    with pytest.raises(FileNotFoundError):
+        SharedRing(4, shape=(8, 8, 1), name=name)
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_batches_are_views_of_the_ring(images, workers):
+    """Los lotes son vistas de la memoria compartida con el mismo preprocesamiento."""
+    before = _segments()
+    seen = []
+    for tensors, results in ring_batches(images, workers=workers, batch_size=3,
+                                         depth=2):
+        assert tensors.base is not None and not tensors.flags.owndata
+        for row, (path, error, info, original) in zip(tensors, results):
+            seen.append(path)
+            if path.endswith("roto.jpg"):
+                assert error and info is None
+                continue
+            assert error is None and info["study_hash"] and original is None
+            array, _ = read_image_file(path, target_size=MODEL_SIZE)
+            np.testing.assert_array_equal(row, preprocess(array)[0])
+
+    assert seen == images
+    assert _segments() == before
+
+
+def test_early_stop_releases_the_ring(images):
+    """Si el consumidor se detiene antes, el bloque compartido se elimina igual."""
+    before = _segments()
+    batches = ring_batches(images, workers=1, batch_size=2, depth=2)
+    next(batches)
+    batches.close()
+
+    assert _segments() == before
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+import preprocess_img
+from preprocess_img import preprocess
+from tensor_store import TensorStore, as_float32, build, main, rescore
+
+
+def _tensor(seed):
+    pixels = np.random.default_rng(seed).integers(0, 256, (80, 96), dtype=np.uint8)
+    return preprocess(pixels)[0]
+
+
+@pytest.fixture
+def studies(tmp_path):
+    """Cinco JPG de prueba y un archivo ilegible."""
+    import cv2
+
+    root = tmp_path / "estudios"
+    root.mkdir()
+    for i in range(5):
+        pixels = np.random.default_rng(i).integers(0, 256, (96, 80), dtype=np.uint8)
+        cv2.imwrite(str(root / f"estudio{i}.jpg"), pixels)
+    (root / "roto.jpg").write_bytes(b"no es una imagen")
+    return root
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("uint8", 0), ("float16", 1e-3)])
+def test_roundtrip(tmp_path, dtype, tolerance):
+    """Los tensores vuelven igual (uint8) o casi igual (float16), repartidos en shards."""
+    tensors = {f"h{i}": _tensor(i) for i in range(5)}
+    with TensorStore(str(tmp_path / "t"), dtype, shard_capacity=2) as store:
+        assert store.add_many((h, t, None) for h, t in tensors.items()) == 5
+        assert store.add("h0", tensors["h0"]) == 0
+
+        assert len(store) == 5 and "h3" in store and "otro" not in store
+        for h, t in tensors.items():
+            np.testing.assert_allclose(as_float32(store.get(h))[0], t, atol=tolerance)
+        batches = list(store.batches(batch_size=3))
+        # Filas consecutivas de un mismo shard: vistas de la memoria mapeada
+        assert [hashes for hashes, _ in batches] == [["h0", "h1"], ["h2", "h3"], ["h4"]]
+        assert all(isinstance(view, np.memmap) for _, view in batches)
+        assert [h for h, _ in store.batches(hashes=["h4", "h1"])] == [["h1"], ["h4"]]
+
+
+def test_parameter_change_invalidates(tmp_path, monkeypatch):
+    """Cambiar el clip limit de CLAHE oculta las entradas anteriores; prune las borra."""
+    root = str(tmp_path / "t")
+    with TensorStore(root) as store:
+        store.add("h0", _tensor(0))
+        old = store.params
+
+    monkeypatch.setattr(preprocess_img, "CLAHE_CLIP_LIMIT", 3.0)
+    with TensorStore(root) as store:
+        assert store.params != old
+        assert len(store) == 0 and store.get("h0") is None
+        assert store.prune() == 1
+    assert not os.path.exists(os.path.join(root, old))
+
+
+def test_build_is_incremental(studies, tmp_path):
+    """build solo decodifica los archivos nuevos o modificados."""
+    import cv2
+
+    with TensorStore(str(tmp_path / "t")) as store:
+        assert build(store, str(studies), workers=0, batch_size=2) == {
+            "stored": 5, "unchanged": 0, "failed": 1}
+        cv2.imwrite(str(studies / "estudio5.jpg"), np.full((64, 64), 7, np.uint8))
+
+        stats = build(store, str(studies), workers=0)
+        assert stats["stored"] == 1 and stats["unchanged"] == 5
+        assert len(store) == 6
+
+
+def test_rescore_matches_prediction(stand_in_model, studies, tmp_path):
+    """Reevaluar desde el almacén da el mismo resultado que preprocesar de nuevo."""
+    from prediction import predict_preprocessed
+    from read_img import MODEL_SIZE, read_image_file
+    from result_cache import study_hash
+
+    root = str(tmp_path / "t")
+    assert main(["build", str(studies), "--store", root, "--workers", "0"]) == 0
+    with TensorStore(root) as store:
+        scored = {h: (label, proba) for h, label, proba, _ in rescore(store, batch_size=2)}
+
+    assert len(scored) == 5
+    array, _ = read_image_file(str(studies / "estudio3.jpg"), target_size=MODEL_SIZE)
+    label, proba, _ = predict_preprocessed(preprocess(array), heatmaps=False)[0]
+    assert scored[study_hash(array)][0] == label
+    assert scored[study_hash(array)][1] == pytest.approx(proba, abs=1e-3)
+
+    output = tmp_path / "reevaluacion.csv"
+    assert main(["rescore", "--store", root, "-o", str(output)]) == 0
+    assert len(output.read_text().splitlines()) == 6
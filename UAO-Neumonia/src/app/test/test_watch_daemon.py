@@ -0,0 +1,141 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from results_store import ResultsStore
+from watch_daemon import IngestDaemon, Watcher, _libc, wanted
+
+
+def _write_dicom(path, seed=0):
+    import pydicom
+    from pydicom.dataset import FileDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    meta = pydicom.dataset.FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+    rng = np.random.default_rng(seed)
+    ds.PixelData = rng.integers(0, 256, (64, 64), dtype=np.uint8).tobytes()
+    ds.Rows = 64
+    ds.Columns = 64
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.SamplesPerPixel = 1
+    ds.PixelRepresentation = 0
+    ds.save_as(str(path))
+
+
+def _until(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "tiempo de espera agotado"
+        time.sleep(0.05)
+
+
+def test_wanted():
+    """Se ignoran los archivos ocultos, parciales y ajenos."""
+    assert wanted("/in/estudio.dcm") and wanted("/in/IM0001")
+    assert not wanted("/in/.estudio.dcm")
+    assert not wanted("/in/estudio.dcm.part")
+    assert not wanted("/in/notas.txt")
+
+
+@pytest.mark.skipif(_libc() is None, reason="inotify no disponible")
+def test_inotify_reports_closed_files(tmp_path):
+    """Con inotify se informa el archivo al cerrarse, también en subcarpetas nuevas."""
+    (tmp_path / "viejo.dcm").write_bytes(b"x")
+    stop = threading.Event()
+    seen = []
+    watcher = Watcher(str(tmp_path), use_inotify=True)
+
+    def consume():
+        for path in watcher.watch(stop):
+            seen.append(path)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    try:
+        _until(lambda: len(seen) == 1)
+        (tmp_path / "nueva").mkdir()
+        (tmp_path / "nueva" / "estudio.dcm").write_bytes(b"y")
+        (tmp_path / "copia.dcm.part").write_bytes(b"z")
+        (tmp_path / "copia.dcm.part").rename(tmp_path / "copia.dcm")
+        _until(lambda: len(seen) == 3)
+    finally:
+        stop.set()
+        thread.join()
+    assert sorted(p.rsplit("/", 1)[1] for p in seen) == ["copia.dcm", "estudio.dcm", "viejo.dcm"]
+    assert watcher.mode == "inotify"
+
+
+def test_daemon_processes_each_file_once(stand_in_model, tmp_path):
+    """Cada archivo se procesa una vez, aun después de reiniciar el servicio."""
+    inbox = tmp_path / "entrada"
+    inbox.mkdir()
+    for i in range(3):
+        _write_dicom(inbox / f"estudio{i}.dcm", seed=i)
+    (inbox / "roto.dcm").write_bytes(b"no es un DICOM")
+    (inbox / "notas.txt").write_text("no es una imagen")
+    db = str(tmp_path / "historial.db")
+
+    with ResultsStore(db) as store:
+        daemon = IngestDaemon(str(inbox), store=store, batch_size=2,
+                              max_wait=0.05, queue_size=2, poll_interval=0.05,
+                              use_inotify=False)
+        with daemon:
+            _until(lambda: len(store.processed()) == 4)
+            (inbox / "sub").mkdir()
+            _write_dicom(inbox / "sub" / "nuevo.dcm", seed=9)
+            _until(lambda: len(store.processed()) == 5)
+            stats = daemon.stats()
+
+        assert store.count() == 4
+        assert stats["mode"] == "polling"
+        assert stats["stages"]["sink"]["processed"] == 5
+        assert stats["stages"]["inference"]["processed"] == 4
+        assert all(s["queue"] <= s["capacity"] == 2 for s in stats["stages"].values())
+
+        # Reinicio: el diario evita volver a procesar los mismos archivos
+        restarted = IngestDaemon(str(inbox), store=store, poll_interval=0.05,
+                                 use_inotify=False)
+        with restarted:
+            _until(lambda: restarted.skipped >= 5)
+        assert store.count() == 4
+        assert restarted.stats()["stages"]["decode"]["processed"] == 0
+
+
+def test_rewrite_while_in_flight_is_requeued(stand_in_model, tmp_path, monkeypatch):
+    """Un archivo reescrito mientras su versión anterior se procesa entra de nuevo."""
+    import prediction
+
+    inbox = tmp_path / "entrada"
+    inbox.mkdir()
+    release = threading.Event()
+    original = prediction.predict_preprocessed
+
+    def slow(*args, **kwargs):
+        release.wait(30)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(prediction, "predict_preprocessed", slow)
+    with ResultsStore(str(tmp_path / "historial.db")) as store:
+        daemon = IngestDaemon(str(inbox), store=store, batch_size=1,
+                              max_wait=0.05, poll_interval=0.05, use_inotify=False)
+        with daemon:
+            path = inbox / "estudio.dcm"
+            _write_dicom(path, seed=1)
+            _until(lambda: daemon.stats()["stages"]["decode"]["processed"] == 1)
+            # Nueva versión (otra fecha) mientras la anterior espera al modelo
+            time.sleep(0.05)
+            _write_dicom(path, seed=2)
+            _until(lambda: str(path) in daemon._dirty)
+            release.set()
+            _until(lambda: store.count() == 2)
+            _until(lambda: daemon.stats()["in_flight"] == 0)
+
+        stat = path.stat()
+        assert store.processed()[str(path)] == (stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,557 @@
+# Servicio que vigila una carpeta de entrada y analiza los estudios que llegan
+"""
+Watch-folder ingestion daemon.
+
+Modality exports dropped into a folder are picked up and classified without
+anyone opening them in the GUI. The daemon is a pipeline of threads joined
+by bounded queues:
+
+    watcher -> decode (read_image_file) -> preprocess -> batched inference
+            -> sink (results_store)
+
+The watcher uses inotify on Linux (through ctypes, `IN_CLOSE_WRITE` and
+`IN_MOVED_TO`, so half-written files are not picked up) and falls back to
+polling, where a file is ready once its size and mtime are stable across two
+polls. Every queue is bounded: when inference falls behind, the earlier
+stages block, and a burst of thousands of files only keeps `queue_size`
+images per stage in memory (512x512, about 1 MB each). On Linux the kernel
+buffers the pending inotify events meanwhile; if that buffer overflows the
+folder is rescanned.
+
+The sink writes each batch of results and the journal entries of its input
+files (path, size, mtime) in one transaction of the results database. On
+start the journal is loaded and every file in the folder is checked against
+it, so after a restart each version of a file is processed exactly once:
+files that were in flight during a crash are neither recorded nor lost.
+A file rewritten while its previous version is still in the pipeline is
+queued again when that version is recorded.
+
+`stats()` returns the queue depth, processed count, throughput and busy
+fraction of every stage; the command line logs it periodically.
+
+Usage (from UAO-Neumonia/):
+    python src/app/watch_daemon.py /ruta/entrada --store historial.db \\
+        --batch-size 16 --queue-size 32 --decode-workers 2
+
+Classes:
+    Watcher: Yields the complete files that appear in a folder.
+    IngestDaemon: The pipeline.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from batch_scan import EXTENSIONS, patient_id
+from dicom_index import walk_files
+from preprocess_img import preprocess
+from read_img import MODEL_SIZE, read_image_file
+from result_cache import study_hash
+from results_store import ResultsStore
+
+# Segundos entre revisiones de la carpeta cuando no hay inotify
+POLL_INTERVAL = 2.0
+# Elementos por cola entre etapas
+QUEUE_SIZE = 32
+# Espera máxima para completar un lote de inferencia
+MAX_WAIT = 0.5
+# Archivos que todavía se están copiando
+PARTIAL_SUFFIXES = (".tmp", ".part", ".partial", ".crdownload")
+
+# Constantes de inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct("iIII")
+
+# Marca de fin que recorre la tubería al detenerla
+_STOP = object()
+
+
+def wanted(path):
+    """Returns True for the files the daemon should process."""
+    name = os.path.basename(path)
+    if name.startswith(".") or name.lower().endswith(PARTIAL_SUFFIXES):
+        return False
+    # Los DICOM exportados por PACS a menudo no tienen extensión
+    return "." not in name or name.lower().endswith(EXTENSIONS)
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Watcher:
+    """
+    Yields the complete files that appear in a folder (and its subfolders).
+
+    Args:
+        root (str): Folder to watch.
+        poll_interval (float): Seconds between polls, without inotify.
+        use_inotify (bool, optional): Force (True) or disable (False)
+            inotify. Defaults to inotify when available.
+    """
+
+    def __init__(self, root, poll_interval=POLL_INTERVAL, use_inotify=None):
+        self.root = os.path.abspath(root)
+        self.poll_interval = poll_interval
+        self._libc = _libc() if use_inotify is not False else None
+        if use_inotify and self._libc is None:
+            raise OSError("inotify no está disponible en este sistema.")
+        self.mode = "inotify" if self._libc is not None else "polling"
+
+    def watch(self, stop):
+        """
+        Yields the paths of complete files until `stop` is set.
+
+        The files already in the folder are yielded first. A path is yielded
+        again when the file is rewritten.
+
+        Args:
+            stop (threading.Event): Ends the generator.
+        """
+        if self._libc is not None:
+            yield from self._watch_inotify(stop)
+        else:
+            yield from self._watch_polling(stop)
+
+    def _existing(self, root):
+        return [path for path, _, _ in walk_files(root) if wanted(path)]
+
+    def _watch_polling(self, stop):
+        seen, reported, first = {}, {}, True
+        while not stop.is_set():
+            now = time.time()
+            current = {path: (size, mtime_ns)
+                       for path, size, mtime_ns in walk_files(self.root)
+                       if wanted(path)}
+            for path, key in sorted(current.items()):
+                if reported.get(path) == key:
+                    continue
+                # Listo si no cambió desde la revisión anterior; al arrancar,
+                # si ya tenía más de un intervalo de antigüedad
+                old = first and now - key[1] / 1e9 > self.poll_interval
+                if seen.get(path) == key or old:
+                    reported[path] = key
+                    yield path
+            for path in set(reported) - set(current):
+                del reported[path]
+            seen, first = current, False
+            stop.wait(self.poll_interval)
+
+    def _add_watches(self, fd, root, watches):
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for directory, _, _ in os.walk(root):
+            wd = self._libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+            if wd >= 0:
+                watches[wd] = directory
+
+    def _watch_inotify(self, stop):
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        watches = {}
+        try:
+            # Primero los watches y luego el listado: no se pierde ningún archivo
+            self._add_watches(fd, self.root, watches)
+            yield from self._existing(self.root)
+            while not stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.2)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                    name = os.fsdecode(data[offset + _EVENT.size:
+                                            offset + _EVENT.size + length].rstrip(b"\0"))
+                    offset += _EVENT.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        # Se perdieron eventos: se revisa toda la carpeta
+                        yield from self._existing(self.root)
+                        continue
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    directory = watches.get(wd)
+                    if directory is None:
+                        continue
+                    path = os.path.join(directory, name)
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            self._add_watches(fd, path, watches)
+                            yield from self._existing(path)
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and wanted(path):
+                        yield path
+        finally:
+            os.close(fd)
+
+
+class _Stage:
+    """Counters of one pipeline stage."""
+
+    def __init__(self, name, inbox):
+        self.name = name
+        self.inbox = inbox
+        self.processed = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def done(self, count, seconds):
+        with self.lock:
+            self.processed += count
+            self.busy += seconds
+        metrics.inc("ingest_processed_total", count, stage=self.name)
+        metrics.observe("ingest_" + self.name, seconds)
+
+
+class IngestDaemon:
+    """
+    Pipeline that classifies the files dropped into a folder.
+
+    Args:
+        root (str): Folder to watch.
+        store (str or ResultsStore, optional): Results database (and
+            journal). Defaults to results_store.DB_PATH.
+        batch_size (int): Images per model call.
+        max_wait (float): Seconds to wait for a batch to fill up.
+        queue_size (int): Capacity of each queue between stages.
+        decode_workers (int): Decoding threads.
+        poll_interval (float): See `Watcher`.
+        use_inotify (bool, optional): See `Watcher`.
+    """
+
+    def __init__(self, root, store=None, batch_size=16, max_wait=MAX_WAIT,
+                 queue_size=QUEUE_SIZE, decode_workers=2,
+                 poll_interval=POLL_INTERVAL, use_inotify=None):
+        self.watcher = Watcher(root, poll_interval, use_inotify)
+        self.own_store = not isinstance(store, ResultsStore)
+        self.store = ResultsStore(store) if self.own_store else store
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.decode_workers = decode_workers
+        self.stages = [
+            _Stage(name, queue.Queue(maxsize=queue_size))
+            for name in ("decode", "preprocess", "inference", "sink")
+        ]
+        self.version = None
+        self.skipped = 0
+        self._done = {}
+        self._in_flight = set()
+        # Reescritos mientras su versión anterior seguía en el pipeline
+        self._dirty = set()
+        self._requeue = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._started = None
+
+    def _stage(self, name):
+        return next(s for s in self.stages if s.name == name)
+
+    def start(self):
+        """Starts the watcher and the stage threads; returns immediately."""
+        from integrator import model_version, warm_up
+
+        warm_up()
+        self.version = model_version()
+        self._done = self.store.processed()
+        self._started = time.perf_counter()
+        targets = [(self._watch, 1), (self._decode, self.decode_workers),
+                   (self._preprocess, 1), (self._infer, 1), (self._sink, 1)]
+        for target, count in targets:
+            for i in range(count):
+                thread = threading.Thread(target=target, daemon=True,
+                                          name=f"ingest-{target.__name__[1:]}-{i}")
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops watching and waits until the files already queued are done.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.own_store:
+            self.store.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _put(self, name, item):
+        self._stage(name).inbox.put(item)
+
+    def _watch(self):
+        try:
+            for path in self.watcher.watch(self._stop):
+                if self._stop.is_set():
+                    break
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = (stat.st_size, stat.st_mtime_ns)
+                with self._lock:
+                    if self._done.get(path) == key:
+                        self.skipped += 1
+                        continue
+                    if path in self._in_flight:
+                        # Se vuelve a encolar cuando termine la versión anterior
+                        self._dirty.add(path)
+                        continue
+                    self._in_flight.add(path)
+                # Bloquea si la cola está llena: contrapresión hasta el watcher
+                self._put("decode", (path,) + key)
+        finally:
+            for _ in range(self.decode_workers):
+                self._put("decode", _STOP)
+
+    def _decode(self):
+        stage = self._stage("decode")
+        while True:
+            item = stage.inbox.get()
+            if item is _STOP:
+                self._put("preprocess", _STOP)
+                return
+            start = time.perf_counter()
+            path = item[0]
+            try:
+                array, _ = read_image_file(path, target_size=MODEL_SIZE)
+                if array is None:
+                    raise ValueError("No se pudo leer el archivo.")
+                info = {"patient_id": patient_id(path), "source": path}
+            except Exception as e:
+                stage.done(1, time.perf_counter() - start)
+                self._put("sink", [(item, None, str(e) or type(e).__name__)])
+                continue
+            stage.done(1, time.perf_counter() - start)
+            self._put("preprocess", (item, array, info))
+
+    def _preprocess(self):
+        stage = self._stage("preprocess")
+        stops = 0
+        while True:
+            entry = stage.inbox.get()
+            if entry is _STOP:
+                stops += 1
+                if stops == self.decode_workers:
+                    self._put("inference", _STOP)
+                    return
+                continue
+            start = time.perf_counter()
+            item, array, info = entry
+            try:
+                tensor = preprocess(array)[0]
+                info["study_hash"] = study_hash(array)
+            except Exception as e:
+                stage.done(1, time.perf_counter() - start)
+                self._put("sink", [(item, None, str(e))])
+                continue
+            stage.done(1, time.perf_counter() - start)
+            self._put("inference", (item, tensor, info))
+
+    def _infer(self):
+        from prediction import predict_preprocessed
+
+        stage = self._stage("inference")
+        finished = False
+        while not finished:
+            first = stage.inbox.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    entry = stage.inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    finished = True
+                    break
+                batch.append(entry)
+
+            start = time.perf_counter()
+            try:
+                results = predict_preprocessed(
+                    np.stack([tensor for _, tensor, _ in batch]),
+                    batch_size=self.batch_size, heatmaps=False,
+                )
+                out = [(item, dict(info, label=label, proba=proba), None)
+                       for (item, _, info), (label, proba, _) in zip(batch, results)]
+            except Exception as e:
+                out = [(item, None, str(e)) for item, _, _ in batch]
+            stage.done(len(batch), time.perf_counter() - start)
+            self._put("sink", out)
+        self._put("sink", _STOP)
+
+    def _sink(self):
+        stage = self._stage("sink")
+        while True:
+            try:
+                entries = stage.inbox.get(timeout=self.max_wait)
+            except queue.Empty:
+                self._flush_requeue()
+                continue
+            # Las etapas anteriores ya terminaron: no queda nada detrás
+            if entries is _STOP:
+                return
+            self._write(stage, entries)
+            self._flush_requeue()
+
+    def _flush_requeue(self):
+        # Sin bloquear: si la cola de decodificación está llena, el sink la
+        # esperaría mientras las etapas anteriores lo esperan a él
+        decode = self._stage("decode").inbox
+        while self._requeue and not self._stop.is_set():
+            try:
+                decode.put_nowait(self._requeue[0])
+            except queue.Full:
+                return
+            self._requeue.pop(0)
+
+    def _write(self, stage, entries):
+        start = time.perf_counter()
+        records = [dict(record, model_version=self.version)
+                   for _, record, error in entries if error is None]
+        journal = [item + (error,) for item, _, error in entries]
+        # Resultados y diario en la misma transacción: exactamente una vez
+        self.store.add_many(records, journal=journal)
+        rewritten = []
+        with self._lock:
+            for path, size, mtime_ns in (item for item, _, _ in entries):
+                self._done[path] = (size, mtime_ns)
+                if path in self._dirty:
+                    self._dirty.discard(path)
+                    rewritten.append(path)
+                else:
+                    self._in_flight.discard(path)
+        for path in rewritten:
+            try:
+                stat = os.stat(path)
+                key = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                key = None
+            with self._lock:
+                if key is None or self._done.get(path) == key:
+                    self._in_flight.discard(path)
+                    continue
+            # Sigue en vuelo: la nueva versión entra de nuevo al pipeline
+            self._requeue.append((path,) + key)
+        stage.done(len(entries), time.perf_counter() - start)
+        metrics.inc("ingest_failed_total", len(entries) - len(records))
+
+    def stats(self):
+        """
+        Returns the state of every stage.
+
+        Returns:
+            dict: `mode` of the watcher, `skipped` files (already in the
+            journal), `in_flight` files and, per stage, `queue` (current
+            depth), `capacity`, `processed`, `rate` (items per second since
+            start) and `busy` (fraction of the time spent working).
+        """
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        stages = {}
+        for stage in self.stages:
+            with stage.lock:
+                processed, busy = stage.processed, stage.busy
+            stages[stage.name] = {
+                "queue": stage.inbox.qsize(),
+                "capacity": stage.inbox.maxsize,
+                "processed": processed,
+                "rate": processed / elapsed if elapsed > 0 else 0.0,
+                "busy": busy / elapsed if elapsed > 0 else 0.0,
+            }
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {"mode": self.watcher.mode, "skipped": self.skipped,
+                "in_flight": in_flight, "stages": stages}
+
+
+def _log_stats(stats, log):
+    parts = [
+        f"{name}: cola {s['queue']}/{s['capacity']}, {s['processed']} "
+        f"({s['rate']:.1f}/s, {100 * s['busy']:.0f}% ocupado)"
+        for name, s in stats["stages"].items()
+    ]
+    print(f"[{stats['mode']}] en curso {stats['in_flight']}, "
+          f"ya procesados {stats['skipped']} | " + " | ".join(parts), file=log)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Vigila una carpeta y analiza los estudios que llegan."
+    )
+    parser.add_argument("input", help="Carpeta de entrada")
+    parser.add_argument("--store", metavar="DB", default=None,
+                        help="Base de datos del historial y del diario")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Imágenes por llamada al modelo")
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT,
+                        help="Segundos de espera para completar un lote")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="Capacidad de cada cola entre etapas")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                        help="Hilos de decodificación")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help="Segundos entre revisiones sin inotify")
+    parser.add_argument("--polling", action="store_true",
+                        help="Revisar la carpeta periódicamente en lugar de usar inotify")
+    parser.add_argument("--stats-every", type=float, default=30.0,
+                        help="Segundos entre reportes de estado (0 = nunca)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input):
+        parser.error(f"La carpeta {args.input} no existe.")
+    daemon = IngestDaemon(
+        args.input, store=args.store, batch_size=args.batch_size,
+        max_wait=args.max_wait, queue_size=args.queue_size,
+        decode_workers=args.decode_workers, poll_interval=args.poll_interval,
+        use_inotify=False if args.polling else None,
+    )
+    finished = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: finished.set())
+    daemon.start()
+    print(f"Vigilando {daemon.watcher.root} ({daemon.watcher.mode}).",
+          file=sys.stderr)
+    while not finished.wait(args.stats_every or None):
+        _log_stats(daemon.stats(), sys.stderr)
+    print("Deteniendo: terminando los estudios en curso...", file=sys.stderr)
+    daemon.stop()
+    _log_stats(daemon.stats(), sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())